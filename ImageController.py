@@ -1,67 +1,175 @@
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
 from typing import List, Tuple
 
 import cv2
 import numpy as np
-import requests
 from PIL import Image
-from skimage.measure import label, regionprops
-import rembg
+from background import apply_mask, get_remover
+from crop_collection import CropCollection
+from downloader import Downloader, decode_image
+from icon_cache import get_icon_cache
+from metrics import metrics
+
+
+def read_labels(file_path: str, image_width: int, image_height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Читает файл разметки YOLO (class x_center y_center width height, нормализованные) и
+    переводит рамки в пиксели одним векторным проходом. Строки другого формата пропускаются.
+    :return: (рамки N x 4 [left, top, right, bottom] в int, классы N).
+    """
+    with open(file_path, "r") as file:
+        text = file.read()
+
+    values = None
+    if text.strip():
+        try:
+            # Быстрый разбор в C; строки разной длины дают ValueError
+            values = np.loadtxt(StringIO(text), dtype=np.float64, ndmin=2)
+        except ValueError:
+            pass
+    if values is None or values.shape[1] != 5:
+        # Смешанный файл (например, с полигонами сегментации) — берём только строки из пяти чисел
+        rows = [line.split() for line in text.splitlines()]
+        values = np.array([row for row in rows if len(row) == 5], dtype=np.float64).reshape(-1, 5)
+
+    centers, sizes = values[:, 1:3], values[:, 3:5]
+    scale = np.array([image_width, image_height], dtype=np.float64)
+    boxes = np.hstack([(centers - sizes / 2) * scale, (centers + sizes / 2) * scale])
+    # Усечение к нулю, как у int()
+    return np.trunc(boxes).astype(np.int64), values[:, 0].astype(np.int32)
 
 
 def read_coordinates(file_path: str, image_width: int, image_height: int) -> List[Tuple[int, int, int, int]]:
     """
     Читает нормализованные координаты из файла и конвертирует их в пиксельные значения.
     """
-    coordinates = []
-    with open(file_path, "r") as file:
-        for line in file:
-            values = list(map(float, line.strip().split()))
-            if len(values) == 5:
-                _, x_center, y_center, width, height = values
-                left = int((x_center - width / 2) * image_width)
-                top = int((y_center - height / 2) * image_height)
-                right = int((x_center + width / 2) * image_width)
-                bottom = int((y_center + height / 2) * image_height)
-                coordinates.append((left, top, right, bottom))
-    return coordinates
+    boxes, _ = read_labels(file_path, image_width, image_height)
+    return [tuple(box) for box in boxes.tolist()]
 
 
 def remove_background(image: Image.Image) -> Image.Image:
     """
     Удаляет фон с изображения, сохраняя прозрачность.
     """
-    input_data = np.array(image)
-    output_data = rembg.remove(input_data)
-    return Image.fromarray(output_data)
+    return get_remover().remove(image)
 
 
-def align_symbol(image):
+def _largest_component(mask: np.ndarray):
+    """
+    Возвращает маску и рамку (minr, minc, maxr, maxc) наибольшей связной компоненты или None.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+
+    index = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    left, top, width, height = stats[index, :4]
+    return labels == index, (top, left, top + height, left + width)
+
+
+def _rotated_bbox_areas(points: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """
+    Площади рамок точек после поворота на каждый из углов (в градусах, против часовой, как в PIL).
+    """
+    theta = np.deg2rad(angles)[:, None]
+    x, y = points[:, 0][None, :], points[:, 1][None, :]
+    cos, sin = np.cos(theta), np.sin(theta)
+    xr = x * cos + y * sin
+    yr = y * cos - x * sin
+    # +1, чтобы площадь считалась в пикселях, как у рамки regionprops
+    return (xr.max(axis=1) - xr.min(axis=1) + 1) * (yr.max(axis=1) - yr.min(axis=1) + 1)
+
+
+def estimate_angle(mask: np.ndarray, refine: bool = False) -> float:
+    """
+    Оценивает угол выравнивания за один проход по выпуклой оболочке наибольшей компоненты.
+    Минимальная по площади рамка всегда лежит на одной из сторон оболочки,
+    поэтому достаточно проверить углы её сторон.
+    :param mask: Бинарная маска значка (uint8).
+    :param refine: Уточнить угол перебором с шагом 0.1° вокруг найденного значения.
+    :return: Угол в диапазоне [-45, 45] для Image.rotate.
+    """
+    component = _largest_component(mask)
+    if component is None:
+        return 0.0
+
+    component_mask, _ = component
+    contours, _ = cv2.findContours(component_mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    hull = cv2.convexHull(points.astype(np.float32)).reshape(-1, 2).astype(np.float64)
+    if len(hull) < 3:
+        return 0.0
+
+    edges = np.roll(hull, -1, axis=0) - hull
+    angles = np.degrees(np.arctan2(edges[:, 1], edges[:, 0]))
+    angles = (angles + 45) % 90 - 45
+    candidates = np.unique(np.round(np.append(angles, 0.0), 6))
+
+    areas = _rotated_bbox_areas(hull, candidates)
+    best_angle = candidates[np.argmin(areas)]
+
+    if refine:
+        # Уточнение по всем точкам контура: растровая оболочка даёт шум на мелких значках
+        fine = np.clip(best_angle + np.arange(-1.0, 1.05, 0.1), -45, 45)
+        best_angle = fine[np.argmin(_rotated_bbox_areas(points, fine))]
+
+    return float(best_angle)
+
+
+def align_symbol(image, mode: str = "fast", refine: bool = False, mask: Image.Image = None):
     """
     Выравнивает значок по вертикали и обрезает по его границам.
     Использует удаление фона только для оценки формы.
+    :param mode: "fast" — оценка угла за один проход по контуру,
+                 "search" — эталонный перебор углов от -45 до 45 с шагом 1°.
+    :param refine: Уточнять угол до десятых долей градуса (только для "fast").
+    :param mask: Готовая альфа-маска значка; если не передана, фон удаляется заново.
     """
     # Получаем изображение с удалённым фоном для анализа
-    img_no_bg = remove_background(image)
-    img_no_bg_array = np.array(img_no_bg.convert("RGBA"))
+    img_no_bg = remove_background(image) if mask is None else apply_mask(image, mask)
 
-    original_array = np.array(image.convert("RGBA"))
+    if mode == "search":
+        return _align_symbol_search(image, img_no_bg)
+
+    alpha = np.array(img_no_bg.convert("RGBA"))[:, :, 3]
+    mask = np.where(alpha > 1, 255, 0).astype(np.uint8)
+    best_angle = estimate_angle(mask, refine)
+
+    rotated_img = image.convert("RGBA").rotate(best_angle, expand=True, fillcolor=(0, 0, 0, 0))
+    rotated_mask = np.array(Image.fromarray(mask).rotate(best_angle, expand=True, fillcolor=0))
+
+    component = _largest_component(rotated_mask)
+    if component is None:
+        return rotated_img  # fallback
+
+    _, (minr, minc, maxr, maxc) = component
+    return rotated_img.crop((minc, minr, maxc, maxr))
+
+
+def _mask_of(img_arr: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(img_arr, cv2.COLOR_RGBA2GRAY)
+    _, thresh = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
+    return thresh
+
+
+def search_angle(img_no_bg: Image.Image) -> int:
+    """
+    Эталонная оценка угла: перебор от -45 до 45 с шагом 1° по площади рамки наибольшей компоненты.
+    :param img_no_bg: Значок с удалённым фоном.
+    """
+    from skimage.measure import label, regionprops
 
+    img_no_bg_array = np.array(img_no_bg.convert("RGBA"))
     min_area = float('inf')
     best_angle = 0
 
-    def get_mask(img_arr):
-        gray = cv2.cvtColor(img_arr, cv2.COLOR_RGBA2GRAY)
-        _, thresh = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
-        return thresh
-
     # Ищем лучший угол вращения
     for angle in range(-45, 46, 1):
         rotated_mask_img = Image.fromarray(img_no_bg_array).rotate(angle, expand=True, fillcolor=(0, 0, 0, 0))
         rotated_mask_array = np.array(rotated_mask_img)
 
-        mask = get_mask(rotated_mask_array)
+        mask = _mask_of(rotated_mask_array)
         labeled = label(mask)
         regions = regionprops(labeled)
 
@@ -75,6 +183,18 @@ def align_symbol(image):
         if area < min_area:
             min_area = area
             best_angle = angle
+    return best_angle
+
+
+def _align_symbol_search(image, img_no_bg):
+    """
+    Эталонное выравнивание полным перебором углов.
+    """
+    from skimage.measure import label, regionprops
+
+    img_no_bg_array = np.array(img_no_bg.convert("RGBA"))
+    original_array = np.array(image.convert("RGBA"))
+    best_angle = search_angle(img_no_bg)
 
     # Поворачиваем оригинальное изображение
     rotated_img = Image.fromarray(original_array).rotate(best_angle, expand=True, fillcolor=(0, 0, 0, 0))
@@ -83,7 +203,7 @@ def align_symbol(image):
     # Также поворачиваем маску, чтобы определить границы значка
     rotated_mask_img = Image.fromarray(img_no_bg_array).rotate(best_angle, expand=True, fillcolor=(0, 0, 0, 0))
     rotated_mask_arr = np.array(rotated_mask_img)
-    mask = get_mask(rotated_mask_arr)
+    mask = _mask_of(rotated_mask_arr)
 
     labeled = label(mask)
     regions = regionprops(labeled)
@@ -104,26 +224,81 @@ class ImageController:
     """
     Контроллер обработки изображений.
     """
-    def __init__(self, url: str, coordinates: List[Tuple[int, int, int, int]]):
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        self.image = Image.open(BytesIO(response.content)).convert("RGBA")
+    def __init__(self, image, coordinates: List[Tuple[int, int, int, int]]):
+        """
+        :param image: Изображение в памяти (PIL Image, numpy-массив или байты).
+        :param coordinates: Координаты областей для обрезки.
+        """
+        self.image = decode_image(image).convert("RGBA")
+        self.array = np.asarray(self.image)
         self.width, self.height = self.image.size
         self.coordinates = coordinates
 
-    def crop_images(self, remove_bg: bool = False, align: bool = False) -> List[Image.Image]:
+    @classmethod
+    async def from_url(cls, url: str, coordinates: List[Tuple[int, int, int, int]],
+                       downloader: Downloader) -> "ImageController":
         """
-        Обрезает изображение по координатам и применяет доп. обработку.
+        Асинхронно скачивает изображение и создаёт контроллер.
         """
-        cropped_images = [self.image.crop(coords) for coords in self.coordinates]
+        return cls(await downloader.fetch(url), coordinates)
+
+    def crop_collection(self, remove_bg: bool = False, align: bool = False, sheet_mask: bool = False,
+                        classes=None, confidences=None, names=None, use_cache: bool = True) -> CropCollection:
+        """
+        Возвращает набор вырезок. Без доп. обработки вырезки остаются срезами исходного массива
+        и материализуются только когда нужны пиксели.
+        Маска каждого значка считается один раз и используется и для удаления фона, и для выравнивания.
+        :param sheet_mask: Сегментировать весь лист один раз и нарезать маски по рамкам.
+        :param use_cache: Брать готовые результаты из кэша значков по содержимому вырезки.
+        """
+        with metrics.span("crop"):
+            collection = CropCollection(self.array, self.coordinates, classes, confidences, names)
+        if not (remove_bg or align):
+            return collection
+
+        cropped_images = collection.images
+        remover = get_remover()
+        # Маска по всему листу зависит не только от пикселей вырезки, такие результаты не кэшируются
+        icon_cache = get_icon_cache() if use_cache and not sheet_mask else None
+        options = f"remove_bg={remove_bg};align={align};model={remover.model_name}"
 
+        results = [None] * len(cropped_images)
+        if icon_cache is not None:
+            with metrics.span("icon_cache"):
+                results = [icon_cache.get(np.asarray(img), options) for img in cropped_images]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            collection.images = results
+            return collection
+
+        pending = [cropped_images[i] for i in missing]
+        with metrics.span("background_mask"):
+            if sheet_mask:
+                masks = remover.sheet_masks(self.image, [collection[i].box for i in missing])
+            else:
+                masks = remover.masks(pending)
+
+        processed = pending
         if remove_bg:
-            cropped_images = [remove_background(img) for img in cropped_images]
+            processed = [apply_mask(img, mask) for img, mask in zip(processed, masks)]
         if align:
-            cropped_images = [align_symbol(img) for img in cropped_images]
+            with metrics.span("align"):
+                processed = [align_symbol(img, mask=mask) for img, mask in zip(processed, masks)]
+
+        for i, original, result in zip(missing, pending, processed):
+            results[i] = result
+            if icon_cache is not None:
+                icon_cache.put(np.asarray(original), options, result)
+
+        collection.images = results
+        return collection
 
-        return cropped_images
+    def crop_images(self, remove_bg: bool = False, align: bool = False,
+                    sheet_mask: bool = False) -> List[Image.Image]:
+        """
+        Обрезает изображение по координатам и применяет доп. обработку.
+        """
+        return self.crop_collection(remove_bg, align, sheet_mask).images
 
     def save_cropped_images(self, output_folder: str, remove_bg: bool = False, align: bool = False) -> None:
         """
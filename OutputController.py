@@ -1,102 +1,208 @@
+import json
 import os
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image, ImageOps, ImageEnhance
-from fpdf import FPDF
+from tempfile import SpooledTemporaryFile
+from PIL import Image
+from typing import BinaryIO
+
+from crop_collection import CropCollection
+from filters import FilterChain
+from metrics import metrics
+from pdf_engine import PdfWriter, grid_placements
 
 
 class OutputController:
-    def __init__(self, images: list[Image.Image]):
+    def __init__(self, images):
         """
-        :param images: Список изображений (PIL Image)
+        :param images: Набор вырезок (CropCollection) или список изображений (PIL Image)
         """
-        self.images = images
+        if not isinstance(images, CropCollection):
+            images = CropCollection.from_images(images)
+        self.crops = images
+        self._pending = FilterChain()
+
+    @property
+    def images(self) -> list[Image.Image]:
+        """Изображения для экспорта (материализуются при первом обращении)."""
+        self._flush_filters()
+        return self.crops.images
 
-    def apply_filters(self, filter_type: str):
+    @images.setter
+    def images(self, images: list[Image.Image]) -> None:
+        self.crops.images = images
+
+    def apply_filters(self, *filter_types: str):
         """
-        Применяет фильтр ко всем изображениям.
-        :param filter_type: Тип фильтра (grayscale, invert, contrast, threshold)
+        Применяет фильтры ко всем изображениям.
+        Фильтры копятся в ленивую цепочку и выполняются одним проходом перед экспортом.
+        :param filter_types: Типы фильтров по порядку (grayscale, invert, contrast, threshold)
         """
-        filters = {
-            "grayscale": lambda img: ImageOps.grayscale(img),
-            "invert": lambda img: ImageOps.invert(img.convert("RGB")),
-            "contrast": lambda img: ImageEnhance.Contrast(img).enhance(2.0),
-            "threshold": lambda img: img.convert("L").point(lambda p: 255 if p > 128 else 0, "1")
-        }
-        
-        if filter_type in filters:
-            self.images = [filters[filter_type](img) for img in self.images]
-    
-    def export_pdf_bytes(self, rows: int = 4, cols: int = 3, margin: int = 10) -> BytesIO:
+        self._pending = self._pending.then(*filter_types)
+
+    def _flush_filters(self) -> None:
+        if self._pending:
+            chain, self._pending = self._pending, FilterChain()
+            with metrics.span("filters"):
+                self.crops.images = chain.apply(self.crops.images)
+
+    def export_pdf(self, stream: BinaryIO, rows: int = 4, cols: int = 3, margin: int = 10,
+                   orientation: str = "portrait", page_size: str = "A4", dpi: int = 150,
+                   image_format: str = "flate") -> None:
         """
-        Экспортирует изображения в PDF в памяти (BytesIO), вписывая их в сетку.
+        Постранично пишет PDF с изображениями в сетке в поток.
+        :param orientation: "portrait" или "landscape".
+        :param page_size: Формат страницы (A3, A4, A5, Letter).
+        :param dpi: Разрешение встраиваемых изображений.
+        :param image_format: "flate" (без потерь) или "jpeg" (для непрозрачных изображений).
         """
-        pdf = FPDF(orientation="P", unit="mm", format="A4")
-        pdf.add_page()
+        self._flush_filters()
+        with metrics.span("export_pdf"):
+            writer = PdfWriter(stream, page_size, orientation, dpi, image_format)
+            sizes = [crop.size for crop in self.crops]
+            for page in grid_placements(sizes, writer.page_width, writer.page_height, rows, cols, margin):
+                writer.add_page([
+                    (self.crops[i].transient_image(), x, y, width, height) for i, x, y, width, height in page
+                ])
+            writer.close()
 
-        page_width, page_height = 210, 297  # Размеры A4 в мм
-        available_width = page_width - (cols + 1) * margin
-        available_height = page_height - (rows + 1) * margin
+    def export_pdf_bytes(self, rows: int = 4, cols: int = 3, margin: int = 10,
+                         orientation: str = "portrait", page_size: str = "A4", dpi: int = 150,
+                         image_format: str = "flate") -> BytesIO:
+        """
+        Экспортирует изображения в PDF в памяти (BytesIO), вписывая их в сетку.
+        """
+        pdf_output = BytesIO()
+        self.export_pdf(pdf_output, rows, cols, margin, orientation, page_size, dpi, image_format)
+        pdf_output.seek(0)
+        return pdf_output
 
-        cell_width = available_width / cols
-        cell_height = available_height / rows
+    def save_pdf(self, output_path: str = "output.pdf", rows: int = 4, cols: int = 3, margin: int = 10,
+                 orientation: str = "portrait"):
+        """
+        Сохраняет PDF с изображениями в сетке.
+        """
+        with open(output_path, "wb") as f:
+            self.export_pdf(f, rows, cols, margin, orientation)
 
-        for i, img in enumerate(self.images):
-            if i % (rows * cols) == 0 and i > 0:
-                pdf.add_page()
+    def encode(self, image_format: str = "png", compress_level: int = 6, quality: int = 90,
+               workers: int = None) -> None:
+        """
+        Заранее кодирует все вырезки и сохраняет байты в них: так кодирование можно выполнить
+        на отдельном этапе конвейера, а export_zip только запишет готовые данные.
+        :param image_format: "png", "webp" или "jpeg".
+        """
+        self._flush_filters()
+        with ThreadPoolExecutor(workers or os.cpu_count() or 1) as executor:
+            encoded = list(executor.map(
+                lambda i: self._encode(i, image_format, compress_level, quality), range(len(self.crops))
+            ))
+        for crop, data in zip(self.crops, encoded):
+            crop.encoded = ((image_format, compress_level, quality), data)
 
-            col = i % cols
-            row = (i // cols) % rows
+    def _encode(self, index: int, image_format: str, compress_level: int, quality: int) -> bytes:
+        """Кодирует одну вырезку в итоговый формат архива."""
+        crop = self.crops[index]
+        if crop.encoded is not None and crop.encoded[0] == (image_format, compress_level, quality):
+            return crop.encoded[1]
 
-            img_width, img_height = img.size
-            img_aspect = img_width / img_height
-            cell_aspect = cell_width / cell_height
+        img = crop.transient_image()
+        output = BytesIO()
+        if image_format == "png":
+            img.save(output, format="PNG", compress_level=compress_level)
+        elif image_format == "webp":
+            img.save(output, format="WEBP", quality=quality, method=4)
+        elif image_format == "jpeg":
+            if img.mode in ("RGBA", "LA", "P"):
+                # В JPEG нет прозрачности — кладём значок на белый фон
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.convert("RGBA").getchannel("A"))
+                img = background
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(output, format="JPEG", quality=quality)
+        else:
+            raise ValueError(f"Неизвестный формат: {image_format}")
+        return output.getvalue()
 
-            if img_aspect > cell_aspect:
-                new_width = cell_width
-                new_height = cell_width / img_aspect
-            else:
-                new_height = cell_height
-                new_width = cell_height * img_aspect
+    def export_zip(self, stream: BinaryIO, image_format: str = "png", compress_level: int = 6,
+                   quality: int = 90, workers: int = None, manifest: bool = True) -> None:
+        """
+        Пишет ZIP-архив с изображениями в поток, кодируя изображения параллельно.
+        Изображения уже сжаты, поэтому кладутся в архив без повторного сжатия (ZIP_STORED).
+        :param image_format: "png", "webp" или "jpeg".
+        :param compress_level: Уровень сжатия PNG (0-9).
+        :param quality: Качество WebP/JPEG.
+        :param workers: Число потоков кодирования (по умолчанию — число ядер).
+        :param manifest: Добавить manifest.json с рамками и классами.
+        """
+        self._flush_filters()
+        extension = "jpg" if image_format == "jpeg" else image_format
+        workers = workers or os.cpu_count() or 1
+        window = workers * 2
+        entries = []
 
-            temp_io = BytesIO()
-            img.resize((int(new_width * 3.78), int(new_height * 3.78)), Image.LANCZOS).save(temp_io, format="PNG")
-            temp_io.seek(0)
+        with metrics.span("export_zip"), zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as zip_file, \
+                ThreadPoolExecutor(workers) as executor:
+            # Кодирование отпускает GIL; окно ограничивает число готовых, но не записанных изображений
+            for start in range(0, len(self.crops), window):
+                indices = range(start, min(start + window, len(self.crops)))
+                encoded = executor.map(lambda i: self._encode(i, image_format, compress_level, quality), indices)
+                for i, data in zip(indices, encoded):
+                    filename = f"image_{i}.{extension}"
+                    zip_file.writestr(filename, data)
 
-            x = margin + col * (cell_width + margin) + (cell_width - new_width) / 2
-            y = margin + row * (cell_height + margin) + (cell_height - new_height) / 2
-            pdf.image(temp_io, x, y, new_width, new_height)
+                    crop = self.crops[i]
+                    entries.append({
+                        "file": filename,
+                        "photo": crop.source_id,
+                        "box": list(crop.box),
+                        "class_id": crop.class_id,
+                        "class": self.crops.class_name(crop),
+                        "confidence": round(crop.confidence, 4),
+                    })
 
-        pdf_output = BytesIO()
-        pdf.output(pdf_output, 'F')
-        pdf_output.seek(0)
-        return pdf_output
+            if manifest:
+                zip_file.writestr("manifest.json", json.dumps(entries, ensure_ascii=False, indent=1),
+                                  compress_type=zipfile.ZIP_DEFLATED)
 
-    def save_pdf(self, output_path: str = "output.pdf", rows: int = 4, cols: int = 3, margin: int = 10):
+    def export_zip_spooled(self, spool_threshold: int = 32 * 1024 * 1024, **options) -> SpooledTemporaryFile:
         """
-        Сохраняет PDF с изображениями в сетке.
+        Экспортирует ZIP во временный буфер, который уходит на диск при превышении порога.
+        :param spool_threshold: Размер в байтах, после которого буфер переносится на диск.
+        :param options: Параметры export_zip.
         """
-        with open(output_path, "wb") as f:
-            f.write(self.export_pdf_bytes(rows, cols, margin).getvalue())
+        buffer = SpooledTemporaryFile(max_size=spool_threshold)
+        self.export_zip(buffer, **options)
+        buffer.seek(0)
+        return buffer
 
-    def export_zip_bytes(self) -> BytesIO:
+    def export_zip_bytes(self, **options) -> BytesIO:
         """
         Экспортирует изображения в ZIP-архив в памяти (BytesIO).
+        :param options: Параметры export_zip.
         """
         zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for i, img in enumerate(self.images):
-                img_bytes = BytesIO()
-                img.save(img_bytes, format="PNG")
-                img_bytes.seek(0)
-                zip_file.writestr(f"image_{i}.png", img_bytes.getvalue())
-        
+        self.export_zip(zip_buffer, **options)
         zip_buffer.seek(0)
         return zip_buffer
 
+    def save_images(self, output_folder: str, image_format: str = "png", compress_level: int = 6,
+                    quality: int = 90) -> None:
+        """
+        Сохраняет каждую вырезку отдельным файлом (image_<i>.<ext>, как в ZIP), кодируя параллельно.
+        """
+        self.encode(image_format, compress_level, quality)
+        extension = "jpg" if image_format == "jpeg" else image_format
+        os.makedirs(output_folder, exist_ok=True)
+        for i, crop in enumerate(self.crops):
+            with open(os.path.join(output_folder, f"image_{i}.{extension}"), "wb") as f:
+                f.write(crop.encoded[1])
+
     def save_zip(self, output_path: str = "output.zip"):
         """
         Сохраняет ZIP-архив с изображениями на диск.
         """
         with open(output_path, "wb") as f:
-            f.write(self.export_zip_bytes().getvalue())
+            self.export_zip(f)
@@ -0,0 +1,121 @@
+import asyncio
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.types import Message
+
+from result_cache import get_detection
+from worker_pool import crop_part_task, export_parts_pdf_task, export_parts_zip_task, pool
+
+if TYPE_CHECKING:
+    from crop_collection import CropCollection
+    from yolo_processor import DetectionResult
+
+
+class AlbumCollector:
+    """
+    Собирает сообщения одного альбома (media_group_id): Telegram присылает каждое фото
+    отдельным сообщением, поэтому ждём паузы и обрабатываем альбом целиком.
+    """
+    def __init__(self, delay: float = 1.0):
+        """
+        :param delay: Сколько секунд ждать следующего фото альбома.
+        """
+        self.delay = delay
+        self._albums: Dict[str, List[Message]] = {}
+
+    async def add(self, message: Message,
+                  on_complete: Callable[[List[Message]], Awaitable[None]]) -> None:
+        """
+        Добавляет сообщение в альбом. Первый вызов для альбома дожидается паузы
+        и вызывает on_complete со всеми сообщениями по порядку.
+        """
+        album_id = message.media_group_id
+        messages = self._albums.get(album_id)
+        if messages is not None:
+            messages.append(message)
+            return
+
+        messages = self._albums[album_id] = [message]
+        received = 0
+        while received != len(messages):
+            received = len(messages)
+            await asyncio.sleep(self.delay)
+        del self._albums[album_id]
+        await on_complete(sorted(messages, key=lambda item: item.message_id))
+
+
+def _notify_once(notify: Optional[Callable[[int], Awaitable[None]]]):
+    """Сообщает о позиции в очереди один раз на весь альбом, а не для каждого фото."""
+    if notify is None:
+        return None
+    sent = False
+
+    async def wrapper(position: int) -> None:
+        nonlocal sent
+        if not sent:
+            sent = True
+            await notify(position)
+    return wrapper
+
+
+async def detect_album(photos: List[dict],
+                       on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> List["DetectionResult"]:
+    """
+    Детекция всех фото альбома: скачивания идут параллельно, а планировщик
+    собирает готовые изображения в пакеты для модели.
+    :param photos: Фото альбома: словари с ключами file_id, photo_id и tiled.
+    """
+    notify = _notify_once(on_queued)
+    return await asyncio.gather(*(
+        get_detection(photo["photo_id"], photo["file_id"], notify, photo["tiled"]) for photo in photos
+    ))
+
+
+async def process_album(photos: List[dict], on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+                        remove_bg: bool = False, align: bool = False,
+                        image_format: Optional[str] = None) -> List["CropCollection"]:
+    """
+    Конвейер альбома: скачивание → детекция → обрезка (и кодирование для ZIP).
+    Каждое фото переходит на следующий этап сразу, как только готово, поэтому обрезка одного фото
+    идёт в пуле параллельно со скачиванием и детекцией остальных.
+    :param image_format: Формат вырезок для ZIP; None — оставить пиксели (для PDF).
+    :return: Наборы вырезок по фото в порядке альбома.
+    """
+    notify = _notify_once(on_queued)
+
+    async def run(source_id: int, photo: dict) -> "CropCollection":
+        detection = await get_detection(photo["photo_id"], photo["file_id"], notify, photo["tiled"])
+        coordinates = [tuple(box) for box in detection.coordinates]
+        return await pool.run(
+            crop_part_task, detection.image, coordinates, detection.classes, detection.confidences,
+            detection.names, source_id, remove_bg, align, image_format, on_queued=notify, admitted=True
+        )
+
+    return await asyncio.gather(*(run(i, photo) for i, photo in enumerate(photos)))
+
+
+async def export_album_zip(photos: List[dict], on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+                           image_format: str = "png") -> bytes:
+    """
+    Один ZIP со значками всех фото альбома (в manifest.json указан номер фото).
+    """
+    notify = _notify_once(on_queued)
+    parts = await process_album(photos, notify, image_format=image_format)
+    return await pool.run(export_parts_zip_task, parts, image_format, on_queued=notify, admitted=True)
+
+
+async def export_album_pdf(photos: List[dict], rows: int, cols: int, orientation: str = "portrait",
+                           on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+                           page_size: str = "A4", dpi: int = 150) -> bytes:
+    """
+    Один PDF со значками всех фото альбома.
+    :param page_size: Формат страницы (A3, A4, A5, Letter).
+    :param dpi: Разрешение встраиваемых изображений.
+    """
+    notify = _notify_once(on_queued)
+    parts = await process_album(photos, notify)
+    return await pool.run(export_parts_pdf_task, parts, rows, cols, orientation, page_size, dpi,
+                          on_queued=notify, admitted=True)
+
+
+album_collector = AlbumCollector()
@@ -0,0 +1,149 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# Параметры нормализации моделей семейства U2Net, для которых возможен пакетный прогон
+_BATCH_NORMALIZATION = {
+    "u2net": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "u2netp": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "u2net_human_seg": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "silueta": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+}
+
+# Сколько пакетов (или вырезок) одного листа считать параллельно в общей сессии
+BACKGROUND_THREADS = int(os.getenv("BACKGROUND_THREADS", "2"))
+
+
+def apply_mask(image: Image.Image, mask: Image.Image) -> Image.Image:
+    """
+    Вырезает объект по маске так же, как rembg: всё вне маски становится прозрачным.
+    """
+    empty = Image.new("RGBA", image.size, 0)
+    return Image.composite(image.convert("RGBA"), empty, mask)
+
+
+class BackgroundRemover:
+    """
+    Движок удаления фона с одной постоянной ONNX-сессией на модель.
+    Считает только альфа-маски, чтобы их можно было переиспользовать при выравнивании.
+    """
+    def __init__(self, model_name: str = "u2net", batch_size: int = 8, threads: int = BACKGROUND_THREADS):
+        """
+        :param model_name: Имя модели rembg.
+        :param batch_size: Сколько вырезок отправлять в сеть за один вызов, если размер пакета
+                           не зафиксирован в модели.
+        :param threads: Сколько вызовов сети выполнять одновременно.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.threads = threads
+        self._session = None
+        self._lock = Lock()
+
+    @property
+    def session(self):
+        """Сессия rembg, создаётся один раз при первом обращении."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import rembg
+                    self._session = rembg.new_session(self.model_name)
+        return self._session
+
+    def _batch_input(self) -> Tuple[int, bool]:
+        """
+        Размер пакета и зафиксирован ли он в модели. 0 — модель не из семейства U2Net,
+        такие модели считаются через rembg по одному изображению.
+        """
+        if self.model_name not in _BATCH_NORMALIZATION:
+            return 0, False
+        batch_dim = self.session.inner_session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim > 0:
+            return batch_dim, True
+        return self.batch_size, False
+
+    def _predict_batch(self, images: Sequence[Image.Image], pad_to: int = 0) -> List[Image.Image]:
+        """
+        Один вызов сети на несколько изображений (повторяет постобработку U2Net из rembg).
+        :param pad_to: Фиксированный размер пакета модели: неполный пакет дополняется повтором
+                       последнего изображения, лишние маски отбрасываются.
+        """
+        mean, std, size = _BATCH_NORMALIZATION[self.model_name]
+        session = self.session
+        padded = list(images) + [images[-1]] * (pad_to - len(images))
+        inputs = [session.normalize(image.convert("RGB"), mean, std, size) for image in padded]
+        input_name = next(iter(inputs[0]))
+        batch = np.concatenate([item[input_name] for item in inputs], axis=0)
+
+        predictions = session.inner_session.run(None, {input_name: batch})[0][:, 0, :, :]
+        masks = []
+        for image, prediction in zip(images, predictions):
+            low, high = prediction.min(), prediction.max()
+            prediction = (prediction - low) / (high - low + 1e-8)
+            mask = Image.fromarray((prediction * 255).astype(np.uint8), mode="L")
+            masks.append(mask.resize(image.size, Image.LANCZOS))
+        return masks
+
+    def _predict_one(self, image: Image.Image) -> Image.Image:
+        import rembg
+        return rembg.remove(image.convert("RGB"), session=self.session, only_mask=True)
+
+    def masks(self, images: Sequence[Image.Image]) -> List[Image.Image]:
+        """
+        Считает альфа-маски (режим L) для списка изображений пакетами.
+        Если размер пакета зафиксирован в модели (у стандартных моделей rembg он равен 1),
+        вырезки делятся на пакеты этого размера, и пакеты считаются параллельно в threads потоках.
+        """
+        if not images:
+            return []
+
+        size, fixed = self._batch_input()
+        if size:
+            chunks = [images[start:start + size] for start in range(0, len(images), size)]
+        else:
+            chunks = [[image] for image in images]
+
+        def predict(chunk: Sequence[Image.Image]) -> List[Image.Image]:
+            if size:
+                return self._predict_batch(chunk, size if fixed else 0)
+            return [self._predict_one(chunk[0])]
+
+        if self.threads > 1 and len(chunks) > 1:
+            # ONNX Runtime отпускает GIL, а вызовы одной сессии потокобезопасны
+            with ThreadPoolExecutor(min(self.threads, len(chunks))) as executor:
+                parts = list(executor.map(predict, chunks))
+        else:
+            parts = [predict(chunk) for chunk in chunks]
+        return [mask for part in parts for mask in part]
+
+    def mask(self, image: Image.Image) -> Image.Image:
+        """Альфа-маска одного изображения."""
+        return self.masks([image])[0]
+
+    def sheet_masks(self, image: Image.Image, boxes: Sequence[Tuple[int, int, int, int]]) -> List[Image.Image]:
+        """
+        Сегментирует весь лист один раз и нарезает маски по рамкам,
+        вместо того чтобы запускать сеть на каждый значок.
+        """
+        sheet_mask = self._predict_one(image)
+        return [sheet_mask.crop(box) for box in boxes]
+
+    def remove(self, image: Image.Image) -> Image.Image:
+        """Удаляет фон с изображения, сохраняя прозрачность."""
+        return apply_mask(image, self.mask(image))
+
+
+_removers: Dict[str, BackgroundRemover] = {}
+
+
+def get_remover(model_name: str = "u2net") -> BackgroundRemover:
+    """Возвращает общий для процесса движок удаления фона для модели."""
+    remover = _removers.get(model_name)
+    if remover is None:
+        remover = _removers.setdefault(model_name, BackgroundRemover(model_name))
+    return remover
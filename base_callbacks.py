@@ -1,17 +1,21 @@
-from io import BytesIO
-from PIL import Image
 from aiogram import types, F, Bot, Dispatcher
 from aiogram.types import (
-    Message, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, InputFile, InputMediaPhoto
 )
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types.input_file import BufferedInputFile
 
-from yolo_processor import YOLOProcessor
-from ImageController import ImageController
-from OutputController import OutputController
+from album import album_collector, detect_album, export_album_zip
+from job_scheduler import job_scheduler
+from jobs import JobCancelled, ProgressMessage, jobs, photos_key, zip_in_parts
+from metrics import metrics
+from result_cache import get_detection
+from worker_pool import PoolBusyError, queue_notifier
+
+
+ALREADY_RUNNING = "Этот запрос уже выполняется, результат придёт автоматически."
 
 
 async def start_command(message: Message) -> None:
@@ -22,83 +26,167 @@ async def start_command(message: Message) -> None:
 
 async def handle_photo(message: Message, state: FSMContext) -> None:
     """Обрабатывает получение фотографии от пользователя."""
+    # Новое фото делает незавершённую обработку предыдущего ненужной
+    jobs.cancel(message.chat.id)
+    if message.media_group_id:
+        await album_collector.add(message, lambda messages: _accept_album(messages, state))
+        return
     photo = message.photo[-1]
-    file_info = await message.bot.get_file(photo.file_id)
-    file_path = file_info.file_path
-    file_url = f"https://api.telegram.org/file/bot{message.bot.token}/{file_path}"
-    
-    await state.update_data(photo=file_url)
+    await _accept_image(message, state, photo.file_id, photo.file_unique_id, tiled=False)
+
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+async def handle_image_document(message: Message, state: FSMContext) -> None:
+    """Обрабатывает изображение, отправленное файлом (без сжатия Telegram), для тайловой детекции."""
+    jobs.cancel(message.chat.id)
+    if message.media_group_id:
+        await album_collector.add(message, lambda messages: _accept_album(messages, state))
+        return
+    document = message.document
+    await _accept_image(message, state, document.file_id, document.file_unique_id, tiled=True)
+
+
+def _result_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="В размеченном PDF", callback_data="export_to_pdf")],
         [InlineKeyboardButton(text="Фото с выделенными значками", callback_data="marked_photo")],
         [InlineKeyboardButton(text="Скачать все распознанные значки", callback_data="download_all_icons")]
     ])
 
-    await message.reply("Фото получено! Как хотите получить результат?", reply_markup=keyboard)
+
+async def _accept_image(message: Message, state: FSMContext, file_id: str, file_unique_id: str,
+                        tiled: bool) -> None:
+    # Сохраняем только file_id: ссылка на файл временная и содержит токен бота
+    await state.update_data(file_id=file_id, photo_id=file_unique_id, tiled=tiled, album=None)
+    await message.reply("Фото получено! Как хотите получить результат?", reply_markup=_result_keyboard())
+
+
+async def _accept_album(messages: list, state: FSMContext) -> None:
+    """Сохраняет все фото альбома как одно задание и показывает одну клавиатуру."""
+    files = [
+        (message.photo[-1], False) if message.photo else (message.document, True)
+        for message in messages
+    ]
+    album = [{"file_id": file.file_id, "photo_id": file.file_unique_id, "tiled": tiled} for file, tiled in files]
+    await state.update_data(album=album)
+    await messages[0].reply(
+        f"Альбом из {len(album)} фото получен! Результат будет общим для всех фото. Как хотите его получить?",
+        reply_markup=_result_keyboard(),
+    )
 
 
 async def handle_marked_photo(callback: types.CallbackQuery, state: FSMContext) -> None:
     """Обрабатывает запрос на получение фото с выделенными объектами."""
+    data = await state.get_data()
+    job = jobs.start(callback.message.chat.id, ("marked_photo", photos_key(data)))
+    if job is None:
+        await callback.answer(ALREADY_RUNNING)
+        return
     await callback.message.delete()
     await callback.message.answer("Обрабатываю изображение...")
 
     try:
-        data = await state.get_data()
-        photo_url = str(data.get("photo"))
-        yolo_processor = YOLOProcessor()
-
-        processed_image = yolo_processor.process_image(photo_url)
-        coordinates = yolo_processor.get_objects(photo_url)
-
-        if processed_image:
-            await callback.message.answer_photo(
-                BufferedInputFile(processed_image.getvalue(), filename="processed_image.png")
-            )
+        notify = queue_notifier(callback.message)
+        async with job_scheduler.slot(callback.message.chat.id, "marked_photo", job, notify):
+            if data.get("album"):
+                await _send_marked_album(callback.message, data["album"], job)
+                return
+
+            detection = await get_detection(data["photo_id"], data["file_id"], notify, data.get("tiled", False))
+            job.check()
+
+            if detection:
+                coordinates = detection.coordinates
+                await callback.message.answer_photo(
+                    BufferedInputFile(detection.annotated, filename="processed_image.png")
+                )
             
-            coordinates_text = "\n".join(
-                [f"{x_min}, {y_min}, {x_max}, {y_max}" for x_min, y_min, x_max, y_max in coordinates]
-            )
-            formatted_coordinates = f"```\n{coordinates_text}\n```"
-            await callback.message.answer("Готово! Вот координаты найденных объектов: ")
-            await callback.message.answer(formatted_coordinates, parse_mode=ParseMode.MARKDOWN_V2)
-        else:
-            await callback.message.answer("Не удалось обработать изображение.")
-
+                coordinates_text = "\n".join(
+                    [f"{x_min}, {y_min}, {x_max}, {y_max}" for x_min, y_min, x_max, y_max in coordinates]
+                )
+                formatted_coordinates = f"```\n{coordinates_text}\n```"
+                await callback.message.answer("Готово! Вот координаты найденных объектов: ")
+                await callback.message.answer(formatted_coordinates, parse_mode=ParseMode.MARKDOWN_V2)
+            else:
+                await callback.message.answer("Не удалось обработать изображение.")
+
+    except JobCancelled:
+        await callback.message.answer("Обработка прервана: пришло новое фото или новый запрос.")
+    except PoolBusyError as e:
+        await callback.message.answer(f"{e}. Попробуйте позже.")
     except Exception as e:
         await callback.message.answer(f"Произошла ошибка: {e}")
-        print(f"Произошла ошибка: {e}")
+        metrics.request_error(e)
+    finally:
+        jobs.finish(job)
+
+
+async def _send_marked_album(message: Message, album: list, job) -> None:
+    """Отправляет размеченные фото альбома одной медиагруппой."""
+    detections = await detect_album(album, queue_notifier(message))
+    job.check()
+    await message.answer_media_group([
+        InputMediaPhoto(media=BufferedInputFile(detection.annotated, filename=f"processed_image_{i}.png"))
+        for i, detection in enumerate(detections)
+    ])
+    counts = ", ".join(str(len(detection.boxes)) for detection in detections)
+    await message.answer(f"Готово! Найдено значков по фото: {counts}")
 
 
 async def handle_download_all_icons(callback: types.CallbackQuery, state: FSMContext) -> None:
-    """Обрабатывает запрос на скачивание всех распознанных значков в zip."""
+    """
+    Обрабатывает запрос на скачивание всех распознанных значков в zip.
+    Сразу после детекции отправляет размеченное фото, затем показывает прогресс вырезания.
+    """
+    data = await state.get_data()
+    job = jobs.start(callback.message.chat.id, ("zip", photos_key(data)))
+    if job is None:
+        await callback.answer(ALREADY_RUNNING)
+        return
     await callback.message.delete()
-    
+
     try:
-        data = await state.get_data()
-        photo_url = str(data.get("photo"))
-        yolo_processor = YOLOProcessor()
-
-        coordinates = [tuple(sublist) for sublist in yolo_processor.get_objects(photo_url)]
-        controller = ImageController(photo_url, coordinates)
-        bytes_images = controller.export_bytes_images(False, False)
-
-        pil_images = [Image.open(img_bytes) for img_bytes in bytes_images]
-        output_controller = OutputController(pil_images)
-        zip_bytes = output_controller.export_zip_bytes()
-
-        await callback.message.answer("Я поработал, сейчас отправлю!")
-        await callback.message.answer_document(
-            BufferedInputFile(zip_bytes.getvalue(), filename="cropped_icons.zip")
-        )
+        notify = queue_notifier(callback.message)
+        async with job_scheduler.slot(callback.message.chat.id, "zip", job, notify):
+            if data.get("album"):
+                zip_bytes = await job.shared(job.key, lambda: export_album_zip(data["album"], notify))
+                job.check()
+                await callback.message.answer("Я поработал, сейчас отправлю!")
+                await callback.message.answer_document(
+                    BufferedInputFile(zip_bytes, filename="cropped_icons.zip")
+                )
+                return
+
+            detection = await get_detection(data["photo_id"], data["file_id"], notify, data.get("tiled", False))
+            job.check()
+            await callback.message.answer_photo(
+                BufferedInputFile(detection.annotated, filename="processed_image.png"),
+                caption=f"Найдено значков: {len(detection.boxes)}. Вырезаю их..."
+            )
+
+            progress = ProgressMessage(callback.message, "Вырезаю значки", len(detection.boxes))
+            await progress.update(0, force=True)
+            zip_bytes = await zip_in_parts(job, detection, notify, progress, image_format="png")
+            job.check()
+
+            await progress.finish("Я поработал, сейчас отправлю!")
+            await callback.message.answer_document(
+                BufferedInputFile(zip_bytes, filename="cropped_icons.zip")
+            )
+    except JobCancelled:
+        await callback.message.answer("Обработка прервана: пришло новое фото или новый запрос.")
+    except PoolBusyError as e:
+        await callback.message.answer(f"{e}. Попробуйте позже.")
     except Exception as e:
         await callback.message.answer(f"Произошла ошибка: {e}")
-        print(f"Произошла ошибка: {e}")
+        metrics.request_error(e)
+    finally:
+        jobs.finish(job)
 
 
 def register_base_callbacks(dp: Dispatcher, bot: Bot) -> None:
     """Регистрирует обработчики команд и событий."""
     dp.message.register(start_command, Command("start"))
     dp.message.register(handle_photo, F.photo)
+    dp.message.register(handle_image_document, F.document.mime_type.startswith("image/"))
     dp.callback_query.register(handle_marked_photo, F.data == "marked_photo")
     dp.callback_query.register(handle_download_all_icons, F.data == "download_all_icons")
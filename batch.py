@@ -0,0 +1,233 @@
+"""
+Офлайн-обработка каталогов со сканами без Telegram.
+
+Запуск:
+    python batch.py scans/ -o out/ --format zip
+    python batch.py dataset/images --labels dataset/labels -o out/ --format pdf --grid 5x9 --workers 4
+    python batch.py scans/ -o out/ --format crops --remove-bg --align
+
+Для каждого изображения ищется разметка YOLO (.txt): в каталоге --labels с той же структурой,
+рядом с изображением или в соседнем каталоге labels/ (раскладка датасетов YOLO).
+Если разметка есть, модель не запускается. Готовые файлы отмечаются в <output>/progress.jsonl,
+повторный запуск продолжает с необработанных (--restart — начать заново).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from model_registry import DEFAULT_MODEL
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+PROGRESS_FILE = "progress.jsonl"
+OUTPUT_SUFFIXES = {"zip": ".zip", "pdf": ".pdf", "crops": ""}
+
+
+def find_images(inputs: List[Path]) -> List[Tuple[Path, Path]]:
+    """
+    Рекурсивно собирает изображения из каталогов (или отдельных файлов).
+    :return: Пары (корневой каталог, файл) в стабильном порядке.
+    """
+    found = []
+    for root in inputs:
+        if root.is_file():
+            found.append((root.parent, root))
+            continue
+        for path in sorted(root.rglob("*")):
+            if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file():
+                found.append((root, path))
+    return found
+
+
+def find_label(image_path: Path, root: Path, labels_root: Optional[Path]) -> Optional[Path]:
+    """Ищет файл разметки YOLO для изображения."""
+    relative = image_path.relative_to(root).with_suffix(".txt")
+    candidates = [image_path.with_suffix(".txt")]
+    if labels_root is not None:
+        candidates.insert(0, labels_root / relative)
+    parts = image_path.parts
+    if "images" in parts:
+        index = len(parts) - 1 - parts[::-1].index("images")
+        candidates.append(Path(*parts[:index], "labels", *parts[index + 1:]).with_suffix(".txt"))
+    return next((path for path in candidates if path.is_file()), None)
+
+
+def output_key(image_path: Path, root: Path, several_roots: bool) -> str:
+    """Путь результата относительно выходного каталога (без расширения)."""
+    relative = image_path.relative_to(root).with_suffix("")
+    if several_roots:
+        relative = Path(root.name) / relative
+    return relative.as_posix()
+
+
+def load_progress(output_dir: Path, output_format: str) -> Set[str]:
+    """Возвращает ключи файлов, уже обработанных в этом формате."""
+    path = output_dir / PROGRESS_FILE
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Строка, оборванная при аварийной остановке
+                continue
+            if record.get("format") == output_format:
+                done.add(record["file"])
+    return done
+
+
+def _init_batch_worker(threads: int) -> None:
+    """
+    Ограничивает число потоков вычислительных библиотек в процессе.
+    Модель загружается при первом изображении без разметки, один раз на процесс.
+    """
+    for variable in ("OMP_NUM_THREADS", "YOLO_INTRA_THREADS"):
+        os.environ.setdefault(variable, str(threads))
+
+
+def process_image(image_path: str, label_path: Optional[str], output_path: str, options: Dict) -> Dict:
+    """
+    Обрабатывает одно изображение в рабочем процессе: рамки из разметки или от модели,
+    обрезка и запись результата (сначала во временный путь, затем атомарное переименование).
+    :return: Число значков и источник рамок.
+    """
+    import numpy as np
+    from PIL import Image
+    from ImageController import ImageController, read_labels
+    from OutputController import OutputController
+    from model_registry import get_processor
+
+    with Image.open(image_path) as opened:
+        image = opened.convert("RGB")
+
+    if label_path is not None:
+        boxes, classes = read_labels(label_path, image.width, image.height)
+        confidences = np.ones(len(boxes), dtype=np.float32)
+        names, source = {}, "labels"
+    else:
+        processor = get_processor(options["model"])
+        detection = processor.detect_tiled(image) if options["tiled"] else processor.detect(image)
+        boxes, classes, confidences = detection.boxes, detection.classes, detection.confidences
+        names, source = detection.names, "model"
+
+    crops = ImageController(image, boxes.tolist()).crop_collection(
+        options["remove_bg"], options["align"], classes=classes, confidences=confidences, names=names
+    )
+    output = OutputController(crops)
+
+    temporary = output_path + ".tmp"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if options["format"] == "zip":
+        with open(temporary, "wb") as file:
+            output.export_zip(file, image_format=options["image_format"], workers=1)
+    elif options["format"] == "pdf":
+        with open(temporary, "wb") as file:
+            output.export_pdf(file, options["rows"], options["cols"], orientation=options["orientation"])
+    else:
+        shutil.rmtree(temporary, ignore_errors=True)
+        output.save_images(temporary, options["image_format"])
+        shutil.rmtree(output_path, ignore_errors=True)
+    os.replace(temporary, output_path)
+    return {"icons": len(crops), "source": source}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-обработка каталогов со сканами листов со значками.")
+    parser.add_argument("inputs", type=Path, nargs="+", help="каталоги или файлы изображений")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="каталог результатов")
+    parser.add_argument("--format", choices=tuple(OUTPUT_SUFFIXES), default="zip")
+    parser.add_argument("--labels", type=Path, help="корень каталога разметки YOLO с той же структурой")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--tiled", action="store_true", help="детекция по тайлам для сканов высокого разрешения")
+    parser.add_argument("--remove-bg", action="store_true")
+    parser.add_argument("--align", action="store_true")
+    parser.add_argument("--image-format", choices=("png", "webp", "jpeg"), default="png")
+    parser.add_argument("--grid", default="5x9", help="сетка PDF: строки x столбцы")
+    parser.add_argument("--orientation", choices=("portrait", "landscape"), default="portrait")
+    parser.add_argument("--restart", action="store_true", help="не учитывать прогресс прошлых запусков")
+    args = parser.parse_args()
+
+    rows, cols = map(int, args.grid.split("x"))
+    options = {
+        "format": args.format, "model": args.model, "tiled": args.tiled, "remove_bg": args.remove_bg,
+        "align": args.align, "image_format": args.image_format, "rows": rows, "cols": cols,
+        "orientation": args.orientation,
+    }
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    progress_path = args.output / PROGRESS_FILE
+    if args.restart and progress_path.exists():
+        progress_path.unlink()
+    done = load_progress(args.output, args.format)
+
+    several_roots = len(args.inputs) > 1
+    jobs, skipped = [], 0
+    for root, image_path in find_images(args.inputs):
+        key = output_key(image_path, root, several_roots)
+        output_path = args.output / (key + OUTPUT_SUFFIXES[args.format])
+        # Отметка в журнале без файла результата (удалён вручную) — обрабатываем заново
+        if key in done and output_path.exists():
+            skipped += 1
+            continue
+        label = find_label(image_path, root, args.labels)
+        jobs.append((key, str(image_path), str(label) if label else None, str(output_path)))
+
+    print(f"К обработке: {len(jobs)} изображений, уже готово: {skipped}")
+    if not jobs:
+        return 0
+
+    workers = max(1, min(args.workers, len(jobs)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    started = time.perf_counter()
+    counts = {"labels": 0, "model": 0}
+    icons = failed = completed = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_batch_worker, initargs=(threads,)) as executor, \
+            open(progress_path, "a", encoding="utf-8") as progress:
+        queue = iter(jobs)
+        running = {}
+        while True:
+            # Ограниченное окно задач, чтобы не держать в памяти очередь из тысяч изображений
+            for key, image_path, label, output_path in queue:
+                running[executor.submit(process_image, image_path, label, output_path, options)] = (key, image_path)
+                if len(running) >= workers * 2:
+                    break
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, image_path = running.pop(future)
+                completed += 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{completed}/{len(jobs)}] {image_path}: ошибка: {e}")
+                    continue
+
+                counts[result["source"]] += 1
+                icons += result["icons"]
+                progress.write(json.dumps({"file": key, "format": args.format, **result}, ensure_ascii=False) + "\n")
+                progress.flush()
+                print(f"[{completed}/{len(jobs)}] {image_path}: {result['icons']} значков ({result['source']})")
+
+    elapsed = time.perf_counter() - started
+    print(f"Готово за {elapsed:.1f} с ({(completed - failed) / elapsed:.2f} изобр./с): "
+          f"по разметке {counts['labels']}, моделью {counts['model']}, значков {icons}, ошибок {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Set
+
+from metrics import Histogram, metrics
+from worker_pool import detect_batch_task, pool
+
+if TYPE_CHECKING:
+    from yolo_processor import DetectionResult
+
+
+class _Pending:
+    __slots__ = ("image", "future", "enqueued_at", "on_queued")
+
+    def __init__(self, image, future: asyncio.Future, on_queued):
+        self.image = image
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.on_queued = on_queued
+
+
+class BatchScheduler:
+    """
+    Планировщик микро-пакетов: собирает запросы на детекцию в течение нескольких миллисекунд
+    (или до заполнения пакета), выполняет их одним вызовом модели и раздаёт результаты ожидающим.
+    Ошибка одного изображения (или его колбэка) достаётся только его запросу, а не всему пакету.
+    """
+    def __init__(self, runner: Callable[..., Awaitable[List["DetectionResult"]]],
+                 max_batch: int = 8, max_wait_ms: float = 10.0, max_inflight: int = 1):
+        """
+        :param runner: Корутина runner(images, on_queued), выполняющая пакетную детекцию;
+                       вместо результата изображения может вернуть его исключение.
+        :param max_batch: Максимальный размер пакета.
+        :param max_wait_ms: Сколько ждать добора пакета после первого запроса.
+        :param max_inflight: Сколько пакетов может выполняться одновременно.
+        """
+        self.runner = runner
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_inflight = max_inflight
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32])
+        self.queue_wait = Histogram([0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0])
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        # Ссылки на выполняющиеся пакеты, чтобы задачи не собрал сборщик мусора
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _ensure_started(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._worker = asyncio.create_task(self._collect())
+
+    async def submit(self, image, on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> "DetectionResult":
+        """
+        Ставит изображение в очередь на детекцию и ожидает его результат.
+        :param image: Изображение в памяти.
+        :param on_queued: Колбэк с позицией в очереди пула процессов.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(image, future, on_queued))
+        return await future
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._inflight.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[_Pending]) -> None:
+        started = time.perf_counter()
+        self.batch_sizes.observe(len(batch))
+        metrics.observe("batch_size", len(batch), self.batch_sizes.bounds)
+        for item in batch:
+            self.queue_wait.observe(started - item.enqueued_at)
+            metrics.observe("batch_queue_wait_seconds", started - item.enqueued_at, self.queue_wait.bounds)
+
+        async def notify(position: int) -> None:
+            for item in batch:
+                if item.on_queued is None:
+                    continue
+                try:
+                    await item.on_queued(position)
+                except Exception:
+                    # Например, не удалось отправить сообщение о позиции — на остальной пакет это не влияет
+                    logging.getLogger("photobot").exception("Ошибка уведомления о позиции в очереди")
+
+        try:
+            results = await self.runner([item.image for item in batch], notify)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        else:
+            for item, result in zip(batch, results):
+                if item.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    item.future.set_exception(result)
+                else:
+                    item.future.set_result(result)
+        finally:
+            self._inflight.release()
+
+    def stats(self) -> dict:
+        """Возвращает гистограммы размеров пакетов и времени ожидания в очереди (в секундах)."""
+        return {"batch_size": self.batch_sizes.snapshot(), "queue_wait_s": self.queue_wait.snapshot()}
+
+
+async def _run_in_pool(images: list, on_queued: Callable[[int], Awaitable[None]]) -> List["DetectionResult"]:
+    return await pool.run(detect_batch_task, images, on_queued=on_queued)
+
+
+scheduler = BatchScheduler(
+    _run_in_pool,
+    max_batch=int(os.getenv("BATCH_SIZE", "8")),
+    max_wait_ms=float(os.getenv("BATCH_WAIT_MS", "10")),
+    max_inflight=pool.workers,
+)
@@ -0,0 +1,115 @@
+"""
+Сравнение конвейерной обработки альбома с последовательной обработкой фото по одному.
+Фото отдаёт локальный HTTP-сервер с искусственной задержкой (как у серверов Telegram),
+рабочие процессы используют заглушку модели.
+
+Запуск:
+    python benchmarks/bench_album.py
+    python benchmarks/bench_album.py --photos 10 --icons 60 --latency 0.2 --workers 4 --export pdf
+"""
+import argparse
+import asyncio
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from aiohttp import web
+
+import worker_pool
+from album import export_album_pdf, export_album_zip
+from result_cache import get_detection
+from worker_pool import export_pdf_task, export_zip_task, pool
+
+from synthetic import make_sheet
+
+
+def _init_stub_worker(model_filename: str, threads: int) -> None:
+    """Инициализатор рабочего процесса с заглушкой вместо модели YOLO."""
+    from model_registry import registry
+    from stub_model import StubYOLO
+    from yolo_processor import YOLOProcessor
+    registry._processors[model_filename] = YOLOProcessor(model=StubYOLO())
+
+
+async def _serve(sheets: list, latency: float) -> web.AppRunner:
+    async def handler(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.Response(body=sheets[int(request.match_info["index"])], content_type="image/jpeg")
+
+    app = web.Application()
+    app.router.add_get("/{run}/{index}.jpg", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 8765).start()
+    return runner
+
+
+def _photos(run: str, count: int) -> list:
+    # Отдельные ключи для каждого прогона, чтобы не попадать в кэш результатов;
+    # вместо file_id — прямой URL, загрузчик принимает и его
+    return [{"file_id": f"http://127.0.0.1:8765/{run}/{i}.jpg", "photo_id": f"{run}-{i}", "tiled": False}
+            for i in range(count)]
+
+
+async def sequential(photos: list, export: str) -> None:
+    """Прежний сценарий: каждое фото отдельно, следующее — после готовности предыдущего."""
+    for photo in photos:
+        detection = await get_detection(photo["photo_id"], photo["file_id"])
+        coordinates = [tuple(box) for box in detection.coordinates]
+        if export == "zip":
+            await pool.run(export_zip_task, detection.image, coordinates,
+                           detection.classes, detection.confidences, detection.names)
+        else:
+            await pool.run(export_pdf_task, detection.image, coordinates, 5, 9)
+
+
+async def pipelined(photos: list, export: str) -> None:
+    """Альбом одним заданием с общим результатом."""
+    if export == "zip":
+        await export_album_zip(photos)
+    else:
+        await export_album_pdf(photos, 5, 9)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки альбома.")
+    parser.add_argument("--photos", type=int, default=10)
+    parser.add_argument("--icons", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1240)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа сервера в секундах")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--export", choices=("zip", "pdf"), default="zip")
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    sheets = []
+    for i in range(args.photos):
+        encoded = BytesIO()
+        make_sheet(args.icons, args.width, seed=i).image.save(encoded, format="JPEG", quality=90)
+        sheets.append(encoded.getvalue())
+
+    runner = await _serve(sheets, args.latency)
+    worker_pool._init_worker = _init_stub_worker
+    pool.workers = args.workers
+    pool.start()
+    await pool.wait_ready()
+    try:
+        for name, scenario in (("последовательно", sequential), ("альбом", pipelined)):
+            best = float("inf")
+            for attempt in range(args.repeat):
+                started = time.perf_counter()
+                await scenario(_photos(f"{name}{attempt}", args.photos), args.export)
+                best = min(best, time.perf_counter() - started)
+            print(f"{name}: {best:.2f} с на {args.photos} фото ({args.photos / best:.2f} фото/с)")
+    finally:
+        pool.shutdown()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Сравнение бэкендов детекции (torch, onnx, onnx-int8) на синтетических листах:
+совпадение рамок с эталонным бэкендом и пропускная способность.
+
+Запуск:
+    python benchmarks/bench_backends.py --model yolo_custom.pt
+    python benchmarks/bench_backends.py --model yolo_custom.pt --backends onnx onnx-int8 --batch 4
+
+Код возврата 1, если полнота или точность какого-то бэкенда относительно эталона ниже --min-match.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import numpy as np
+
+from detection_backends import BACKENDS, Detections, make_backend
+
+from synthetic import make_sheet
+
+
+def _pairwise_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(reference: Detections, candidate: Detections, iou_threshold: float = 0.5):
+    """
+    Жадно сопоставляет рамки кандидата с эталонными (тот же класс, IoU не ниже порога).
+    :return: (число совпадений, средний IoU совпавших пар).
+    """
+    if not len(reference.boxes) or not len(candidate.boxes):
+        return 0, 0.0
+    iou = _pairwise_iou(reference.boxes, candidate.boxes)
+    iou[reference.classes[:, None] != candidate.classes[None, :]] = 0
+    matched = []
+    for i in np.argsort(-reference.confidences):
+        j = int(iou[i].argmax())
+        if iou[i, j] >= iou_threshold:
+            matched.append(iou[i, j])
+            iou[:, j] = 0
+    return len(matched), float(np.mean(matched)) if matched else 0.0
+
+
+def throughput(backend, images: list, batch: int, repeat: int) -> float:
+    """Лучшая скорость из repeat прогонов в изображениях в секунду."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for i in range(0, len(images), batch):
+            backend.predict(images[i:i + batch])
+        best = min(best, time.perf_counter() - started)
+    return len(images) / best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов детекции YOLO.")
+    parser.add_argument("--model", default="yolo_custom.pt")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--reference", default="torch", choices=BACKENDS)
+    parser.add_argument("--icons", type=int, nargs="+", default=[20, 60, 150])
+    parser.add_argument("--width", type=int, default=1240)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-match", type=float, default=0.95, help="минимальная полнота и точность")
+    args = parser.parse_args()
+
+    images = [make_sheet(icons, args.width, seed=icons).image for icons in args.icons]
+    reference = make_backend(args.reference, args.model)
+    expected = reference.predict(images)
+
+    failed = False
+    for name in args.backends:
+        started = time.perf_counter()
+        backend = reference if name == args.reference else make_backend(name, args.model)
+        load_time = time.perf_counter() - started
+
+        backend.predict(images[:1])
+        found = backend.predict(images)
+        matched = [match(ref, cand) for ref, cand in zip(expected, found)]
+        total_matched = sum(count for count, _ in matched)
+        recall = total_matched / max(1, sum(len(ref.boxes) for ref in expected))
+        precision = total_matched / max(1, sum(len(cand.boxes) for cand in found))
+        mean_iou = np.mean([value for count, value in matched if count]) if total_matched else 0.0
+        speed = throughput(backend, images, args.batch, args.repeat)
+
+        print(f"{name}: загрузка {load_time:.2f} с, {speed:.2f} изобр./с, "
+              f"полнота {recall:.3f}, точность {precision:.3f}, средний IoU {mean_iou:.3f}")
+        if min(recall, precision) < args.min_match:
+            print(f"{name}: совпадение с {args.reference} ниже {args.min_match}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Микробенчмарк фильтров: прежний путь через PIL против пакетного FilterChain.
+
+Запуск: python benchmarks/bench_filters.py --icons 200 --size 128 --mode RGB
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from OutputController import OutputController
+from legacy import apply_filters_pil
+
+
+def _make_icons(count: int, size: int, mode: str, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    bands = len(mode)
+    return [Image.fromarray(rng.integers(0, 255, (size, size, bands), dtype=np.uint8), mode) for _ in range(count)]
+
+
+def _best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--icons", type=int, default=200)
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", choices=("RGB", "RGBA"), default="RGBA",
+                        help="прежний путь отбрасывает альфа-канал, новый сохраняет его")
+    args = parser.parse_args()
+
+    icons = _make_icons(args.icons, args.size, args.mode)
+    cases = [("grayscale",), ("invert",), ("contrast",), ("threshold",), ("contrast", "threshold")]
+
+    print(f"{'фильтр':<22}{'PIL, мс':>10}{'пакет, мс':>12}{'ускорение':>11}")
+    for chain in cases:
+        def legacy():
+            controller = OutputController(list(icons))
+            for name in chain:
+                controller.images = apply_filters_pil(controller.images, name)
+
+        def batched():
+            controller = OutputController(list(icons))
+            controller.apply_filters(*chain)
+            controller.images
+
+        legacy_time = _best_of(legacy, args.repeat)
+        batched_time = _best_of(batched, args.repeat)
+        print(f"{'→'.join(chain):<22}{legacy_time * 1000:>10.1f}{batched_time * 1000:>12.1f}"
+              f"{legacy_time / batched_time:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Сравнение прежнего экспорта PDF через FPDF и потокового PdfWriter.
+
+Каждый вариант запускается в отдельном процессе, чтобы пиковая память (maxrss) не смешивалась.
+Для варианта FPDF нужен пакет fpdf (в зависимости бота он не входит).
+Запуск: python benchmarks/bench_pdf.py --icons 600 --grid 10x15
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from OutputController import OutputController
+from legacy import export_pdf_bytes_fpdf
+
+
+def _make_icons(count: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    icons = []
+    for _ in range(count):
+        width, height = rng.integers(80, 200, size=2)
+        icon = np.zeros((height, width, 4), dtype=np.uint8)
+        icon[..., :3] = rng.integers(0, 255, size=3, dtype=np.uint8)
+        icon[height // 6:-height // 6, width // 6:-width // 6, 3] = 255
+        icons.append(Image.fromarray(icon))
+    return icons
+
+
+def _run(engine: str, count: int, rows: int, cols: int, queue) -> None:
+    icons = _make_icons(count)
+    controller = OutputController(icons)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    try:
+        if engine == "fpdf":
+            size = len(export_pdf_bytes_fpdf(icons, rows, cols).getvalue())
+        else:
+            with tempfile.TemporaryFile() as f:
+                controller.export_pdf(f, rows, cols)
+                size = f.tell()
+    except Exception as e:
+        queue.put((engine, None, None, None, repr(e)))
+        return
+
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb
+    queue.put((engine, elapsed, peak_kb, size, None))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--icons", type=int, default=600)
+    parser.add_argument("--grid", default="10x15")
+    args = parser.parse_args()
+    rows, cols = map(int, args.grid.split("x"))
+
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    for engine in ("fpdf", "stream"):
+        process = context.Process(target=_run, args=(engine, args.icons, rows, cols, queue))
+        process.start()
+        process.join()
+        name, elapsed, peak_kb, size, error = queue.get()
+        if error:
+            print(f"{name:>7}: ошибка {error}")
+        else:
+            print(f"{name:>7}: {elapsed:.3f} с, прирост пиковой памяти {peak_kb / 1024:.1f} МБ, "
+                  f"размер {size / 1024:.0f} КБ")
+
+
+if __name__ == "__main__":
+    main()
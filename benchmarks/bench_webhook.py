@@ -0,0 +1,256 @@
+"""
+Нагрузочный тест режима вебхука: генератор поддельных обновлений Telegram и поддельный сервер Bot API.
+Бот запускается отдельным процессом в режиме вебхука (маршрутизатор и WEBHOOK_PROCESSES обработчиков),
+каждый пользователь проходит сценарий: фото → «В размеченном PDF» → выбор ориентации.
+Ответ на последний шаг проверяет, что состояние FSM прочитано из общего хранилища.
+Сценарий не доходит до детекции, поэтому модель не нужна.
+
+Запуск:
+    python benchmarks/bench_webhook.py
+    python benchmarks/bench_webhook.py --users 200 --rounds 3 --processes 4 --storage sqlite:///bench_state.db
+    python benchmarks/bench_webhook.py --check-restart
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent.parent
+TOKEN = "123456:BENCH"
+
+
+class FakeTelegram:
+    """
+    Поддельный сервер Bot API: отвечает на все методы, а отправленные ботом сообщения
+    складывает в очереди по чатам, чтобы генератор мог измерить время ответа.
+    """
+    def __init__(self):
+        self.replies: Dict[int, asyncio.Queue] = {}
+        self.webhook_set = asyncio.Event()
+        self.calls = 0
+        self._message_ids = itertools.count(1000)
+
+    def queue(self, chat_id: int) -> asyncio.Queue:
+        return self.replies.setdefault(chat_id, asyncio.Queue())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls += 1
+        if method == "setwebhook":
+            self.webhook_set.set()
+        if method == "getfile":
+            result = {"file_id": params["file_id"], "file_unique_id": params["file_id"],
+                      "file_path": f"photos/{params['file_id']}.jpg"}
+        elif method.startswith(("send", "edit")):
+            chat_id = int(params["chat_id"])
+            result = {"message_id": next(self._message_ids), "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+            self.queue(chat_id).put_nowait((method, params.get("text", ""), time.perf_counter()))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def application(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+class UpdateGenerator:
+    """Поддельные обновления Telegram от пользователей."""
+    def __init__(self, session: aiohttp.ClientSession, url: str):
+        self.session = session
+        self.url = url
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.errors = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id), **fields}
+
+    def text(self, user_id: int, text: str) -> dict:
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, text=text)}
+
+    def photo(self, user_id: int) -> dict:
+        sizes = [{"file_id": f"file{user_id}", "file_unique_id": f"unique{user_id}", "width": 1240, "height": 1754}]
+        return {"update_id": next(self._update_ids), "message": self._message(user_id, photo=sizes)}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        return {"update_id": next(self._update_ids), "callback_query": {
+            "id": str(next(self._update_ids)), "from": self._user(user_id), "chat_instance": str(user_id),
+            "data": data, "message": self._message(user_id, text="…"),
+        }}
+
+    async def post(self, update: dict) -> None:
+        async with self.session.post(self.url, json=update) as response:
+            if response.status != 200:
+                self.errors += 1
+
+
+async def step(generator: UpdateGenerator, telegram: FakeTelegram, update: dict, user_id: int,
+               timeout: float) -> tuple:
+    """Отправляет обновление и ждёт ответного сообщения бота. :return: (задержка, текст ответа)."""
+    started = time.perf_counter()
+    await generator.post(update)
+    _, text, answered = await asyncio.wait_for(telegram.queue(user_id).get(), timeout)
+    return answered - started, text
+
+
+async def wait_workers(generator: UpdateGenerator, telegram: FakeTelegram, processes: int) -> float:
+    """Ждёт, пока каждый процесс-обработчик ответит на /start (чаты 1..N попадают в разные процессы)."""
+    started = time.perf_counter()
+    await asyncio.wait_for(telegram.webhook_set.wait(), 120)
+    pending = set(range(1, processes + 1))
+    while pending:
+        for chat_id in list(pending):
+            try:
+                await generator.post(generator.text(chat_id, "/start"))
+                await asyncio.wait_for(telegram.queue(chat_id).get(), 2)
+                pending.discard(chat_id)
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                await asyncio.sleep(0.5)
+    generator.errors = 0
+    return time.perf_counter() - started
+
+
+def start_bot(args: argparse.Namespace) -> subprocess.Popen:
+    env = dict(os.environ, BOT_TOKEN=TOKEN, TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+               WEBHOOK_URL=f"http://127.0.0.1:{args.port}", WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(args.port),
+               WEBHOOK_PROCESSES=str(args.processes), STORAGE_URL=args.storage, WORKERS="1")
+    return subprocess.Popen([sys.executable, str(ROOT / "bot.py")], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL if not args.verbose else None,
+                            stderr=subprocess.DEVNULL if not args.verbose else None)
+
+
+def stop_bot(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def leftover_workers(args: argparse.Namespace, timeout: float = 10.0) -> List[int]:
+    """
+    Порты процессов-обработчиков, которые всё ещё принимают соединения после остановки бота
+    (процессы-сироты перехватили бы обновления перезапущенного бота).
+    """
+    ports = [args.port + 1 + i for i in range(args.processes)] if args.processes > 1 else [args.port]
+    deadline = time.perf_counter() + timeout
+    while True:
+        alive = []
+        for port in ports:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", port)
+            except OSError:
+                continue
+            writer.close()
+            alive.append(port)
+        if not alive or time.perf_counter() > deadline:
+            return alive
+        await asyncio.sleep(0.5)
+
+
+async def user_scenario(generator, telegram, user_id: int, rounds: int, timeout: float,
+                        latencies: List[float], failures: List[str]) -> None:
+    for _ in range(rounds):
+        try:
+            for update in (generator.photo(user_id), generator.callback(user_id, "export_to_pdf"),
+                           generator.callback(user_id, "orientation_portrait")):
+                latency, text = await step(generator, telegram, update, user_id, timeout)
+                latencies.append(latency)
+            if not text.startswith("Вы выбрали"):
+                failures.append(f"{user_id}: {text}")
+        except asyncio.TimeoutError:
+            failures.append(f"{user_id}: нет ответа за {timeout} с")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест режима вебхука.")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--storage", default=None, help="STORAGE_URL бота (по умолчанию временный файл SQLite)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--check-restart", action="store_true",
+                        help="перезапустить бота посреди сценария и проверить, что состояние FSM сохранилось")
+    parser.add_argument("--verbose", action="store_true", help="показывать вывод бота")
+    args = parser.parse_args()
+    temporary = tempfile.TemporaryDirectory()
+    args.storage = args.storage or f"sqlite:///{Path(temporary.name) / 'state.db'}"
+
+    telegram = FakeTelegram()
+    api_runner = web.AppRunner(telegram.application())
+    await api_runner.setup()
+    await web.TCPSite(api_runner, "127.0.0.1", args.api_port).start()
+
+    bot_process = start_bot(args)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        generator = UpdateGenerator(session, f"http://127.0.0.1:{args.port}/webhook")
+        try:
+            startup = await wait_workers(generator, telegram, args.processes)
+            print(f"Бот готов через {startup:.1f} с, процессов-обработчиков: {args.processes}")
+
+            latencies, failures = [], []
+            users = range(100, 100 + args.users)
+            started = time.perf_counter()
+            await asyncio.gather(*(user_scenario(generator, telegram, user_id, args.rounds, args.timeout,
+                                                 latencies, failures) for user_id in users))
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            print(f"{len(latencies)} обновлений за {elapsed:.2f} с ({len(latencies) / elapsed:.0f} обн./с), "
+                  f"задержка p50 {statistics.median(latencies) * 1000:.0f} мс, "
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} мс, "
+                  f"макс. {latencies[-1] * 1000:.0f} мс; ошибок HTTP {generator.errors}, "
+                  f"сбоев сценария {len(failures)}")
+            for failure in failures[:5]:
+                print("  ", failure)
+
+            if args.check_restart:
+                for user_id in users:
+                    await step(generator, telegram, generator.photo(user_id), user_id, args.timeout)
+                    await step(generator, telegram, generator.callback(user_id, "export_to_pdf"), user_id,
+                               args.timeout)
+                stop_bot(bot_process)
+                leftover = await leftover_workers(args)
+                if leftover:
+                    print(f"После остановки бота порты {leftover} всё ещё заняты процессами-сиротами")
+                    return
+                bot_process = start_bot(args)
+                telegram.webhook_set.clear()
+                await wait_workers(generator, telegram, args.processes)
+                kept = 0
+                for user_id in users:
+                    _, text = await step(generator, telegram, generator.callback(user_id, "orientation_portrait"),
+                                         user_id, args.timeout)
+                    kept += text.startswith("Вы выбрали")
+                print(f"После перезапуска состояние сохранилось у {kept} из {args.users} пользователей")
+        finally:
+            stop_bot(bot_process)
+            leftover = await leftover_workers(args)
+            if leftover:
+                print(f"Внимание: после остановки бота порты {leftover} всё ещё заняты")
+            await api_runner.cleanup()
+            temporary.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Прежние реализации фильтров (через PIL по одному изображению) и экспорта PDF (через FPDF),
+оставленные только для сравнения в бенчмарках. Библиотека fpdf нужна лишь для bench_pdf.py.
+"""
+from io import BytesIO
+from typing import List
+
+from PIL import Image, ImageEnhance, ImageOps
+
+
+def apply_filters_pil(images: List[Image.Image], filter_type: str) -> List[Image.Image]:
+    """
+    Применяет фильтр к каждому изображению, как прежний OutputController.apply_filters.
+    :param filter_type: Тип фильтра (grayscale, invert, contrast, threshold)
+    """
+    filters = {
+        "grayscale": lambda img: ImageOps.grayscale(img),
+        "invert": lambda img: ImageOps.invert(img.convert("RGB")),
+        "contrast": lambda img: ImageEnhance.Contrast(img).enhance(2.0),
+        "threshold": lambda img: img.convert("L").point(lambda p: 255 if p > 128 else 0, "1")
+    }
+
+    if filter_type in filters:
+        return [filters[filter_type](img) for img in images]
+    return images
+
+
+def export_pdf_bytes_fpdf(images: List[Image.Image], rows: int = 4, cols: int = 3, margin: int = 10) -> BytesIO:
+    """
+    Прежний экспорт через FPDF (всегда портретный A4).
+    """
+    from fpdf import FPDF
+
+    pdf = FPDF(orientation="P", unit="mm", format="A4")
+    pdf.add_page()
+
+    page_width, page_height = 210, 297  # Размеры A4 в мм
+    available_width = page_width - (cols + 1) * margin
+    available_height = page_height - (rows + 1) * margin
+
+    cell_width = available_width / cols
+    cell_height = available_height / rows
+
+    for i, img in enumerate(images):
+        if i % (rows * cols) == 0 and i > 0:
+            pdf.add_page()
+
+        col = i % cols
+        row = (i // cols) % rows
+
+        img_width, img_height = img.size
+        img_aspect = img_width / img_height
+        cell_aspect = cell_width / cell_height
+
+        if img_aspect > cell_aspect:
+            new_width = cell_width
+            new_height = cell_width / img_aspect
+        else:
+            new_height = cell_height
+            new_width = cell_height * img_aspect
+
+        temp_io = BytesIO()
+        img.resize((int(new_width * 3.78), int(new_height * 3.78)), Image.LANCZOS).save(temp_io, format="PNG")
+        temp_io.seek(0)
+
+        x = margin + col * (cell_width + margin) + (cell_width - new_width) / 2
+        y = margin + row * (cell_height + margin) + (cell_height - new_height) / 2
+        pdf.image(temp_io, x, y, new_width, new_height)
+
+    pdf_output = BytesIO()
+    pdf.output(pdf_output, 'F')
+    pdf_output.seek(0)
+    return pdf_output
@@ -0,0 +1,178 @@
+"""
+Офлайн-бенчмарк горячих путей бота на синтетических листах и заглушке модели.
+
+Запуск:
+    python benchmarks/run.py                          # замер и сравнение с benchmarks/baseline.json
+    python benchmarks/run.py --save                   # сохранить текущие результаты как базовые
+    python benchmarks/run.py --icons 20 150 --sizes 1240 2480 --threshold 0.3
+
+Код возврата 1, если какой-то этап медленнее базового больше чем на threshold
+или если быстрое выравнивание ошибается сильнее допуска.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import numpy as np
+
+from ImageController import ImageController, align_symbol, estimate_angle, remove_background
+from OutputController import OutputController
+from background import get_remover
+from downloader import decode_image
+from yolo_processor import YOLOProcessor
+
+from stub_model import StubYOLO
+from synthetic import make_sheet
+
+
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+# Изменения меньше этого порога (в секундах) считаются шумом
+NOISE_FLOOR = 0.005
+
+
+def _rembg_model_available(model_name: str = "u2net") -> bool:
+    """rembg скачивает модель при первом запуске; офлайн этап выполняется, только если она уже есть."""
+    home = os.getenv("U2NET_HOME", os.path.join(os.path.expanduser("~"), ".u2net"))
+    return os.path.exists(os.path.join(home, f"{model_name}.onnx"))
+
+
+def _timed(timings: dict, stage: str, repeat: int, fn):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    timings[stage] = best
+    return result
+
+
+def run_case(icons: int, width: int, repeat: int, align_search: bool, with_rembg: bool) -> dict:
+    """Прогоняет все этапы на одном листе и возвращает лучшее время каждого этапа в секундах."""
+    sheet = make_sheet(icons, width, seed=icons * 7919 + width)
+    encoded = BytesIO()
+    sheet.image.save(encoded, format="JPEG", quality=90)
+    data = encoded.getvalue()
+
+    timings = {}
+    image = _timed(timings, "decode", repeat, lambda: decode_image(data))
+
+    processor = YOLOProcessor(model=StubYOLO())
+    detection = _timed(timings, "detect", repeat, lambda: processor.detect(image))
+
+    coordinates = [tuple(box) for box in sheet.boxes.tolist()]
+    controller = ImageController(image, coordinates)
+    crops = _timed(timings, "crop_images", repeat, lambda: controller.crop_images())
+
+    masks = [sheet.mask.crop(box) for box in coordinates]
+    _timed(timings, "align_symbol", repeat,
+           lambda: [align_symbol(crop, mask=mask) for crop, mask in zip(crops, masks)])
+    if align_search:
+        _timed(timings, "align_symbol_search", 1,
+               lambda: [align_symbol(crop, mode="search", mask=mask) for crop, mask in zip(crops, masks)])
+
+    if with_rembg:
+        _timed(timings, "remove_background", 1, lambda: [remove_background(crop) for crop in crops])
+        _timed(timings, "background_masks", 1, lambda: get_remover().masks(crops))
+
+    def filters():
+        output = OutputController(controller.crop_collection())
+        output.apply_filters("contrast", "threshold")
+        return output.images
+
+    _timed(timings, "apply_filters", repeat, filters)
+    _timed(timings, "export_pdf_bytes", repeat,
+           lambda: OutputController(controller.crop_collection()).export_pdf_bytes(rows=10, cols=15))
+    _timed(timings, "export_zip_bytes", repeat,
+           lambda: OutputController(controller.crop_collection()).export_zip_bytes())
+
+    timings["detected_icons"] = len(detection.boxes)
+    return timings
+
+
+def alignment_error(icons: int = 60, width: int = 1240) -> float:
+    """Максимальная ошибка быстрой оценки угла (в градусах) относительно эталонных углов генератора."""
+    sheet = make_sheet(icons, width, seed=12345)
+    errors = []
+    for box, angle in zip(sheet.boxes.tolist(), sheet.angles):
+        mask = np.asarray(sheet.mask.crop(box))
+        mask = np.where(mask > 1, 255, 0).astype(np.uint8)
+        estimated = estimate_angle(mask)
+        # Значок повёрнут на angle, выравнивание должно повернуть обратно (с точностью до 90°)
+        errors.append(abs((estimated + angle + 45) % 90 - 45))
+    return float(max(errors))
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Возвращает список регрессий (случай, этап, базовое время, текущее время)."""
+    regressions = []
+    for case, timings in results.items():
+        for stage, value in timings.items():
+            if stage == "detected_icons":
+                continue
+            base = baseline.get(case, {}).get(stage)
+            if base is not None and value > base * (1 + threshold) and value - base > NOISE_FLOOR:
+                regressions.append((case, stage, base, value))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк этапов обработки листа со значками.")
+    parser.add_argument("--icons", type=int, nargs="+", default=[20, 60, 150])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1240, 2480], help="ширина листа в пикселях")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="записать результаты как новые базовые")
+    parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+    parser.add_argument("--align-search", action="store_true", help="замерить и эталонный перебор углов")
+    parser.add_argument("--angle-tolerance", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with_rembg = _rembg_model_available()
+    if not with_rembg:
+        print("Модель rembg не найдена локально — этапы remove_background и background_masks пропущены")
+    else:
+        remover = get_remover()
+        size, fixed = remover._batch_input()
+        # У стандартных моделей rembg пакет зафиксирован размером 1: ускорение дают только потоки
+        print(f"Маски фона: пакет {size}{' (задан моделью)' if fixed else ''}, потоков {remover.threads}")
+
+    results = {}
+    for width in args.sizes:
+        for icons in args.icons:
+            case = f"{icons}icons@{width}px"
+            results[case] = run_case(icons, width, args.repeat, args.align_search, with_rembg)
+            stages = ", ".join(f"{stage} {value * 1000:.1f} мс"
+                               for stage, value in results[case].items() if stage != "detected_icons")
+            print(f"{case}: {stages}")
+
+    failed = False
+    error = alignment_error()
+    print(f"Максимальная ошибка быстрого выравнивания: {error:.2f}°")
+    if error > args.angle_tolerance:
+        print(f"Ошибка выравнивания больше допуска {args.angle_tolerance}°")
+        failed = True
+
+    if args.save:
+        args.baseline.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+        print(f"Базовые результаты сохранены в {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        for case, stage, base, value in regressions:
+            print(f"РЕГРЕССИЯ {case} {stage}: {base * 1000:.1f} → {value * 1000:.1f} мс")
+        failed = failed or bool(regressions)
+    else:
+        print(f"Файл базовых результатов {args.baseline} не найден, сравнение пропущено")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
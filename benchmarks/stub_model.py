@@ -0,0 +1,90 @@
+"""
+Детерминированная замена модели YOLO для бенчмарков без yolo_custom.pt.
+Ищет значки как связные компоненты не-белых пикселей и отдаёт результат в формате ultralytics.
+"""
+from typing import Dict, List
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+class _Array(np.ndarray):
+    """numpy-массив с методами cpu() и numpy(), как у тензоров torch."""
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+
+def _tensor(values, dtype) -> _Array:
+    return np.asarray(values, dtype=dtype).view(_Array)
+
+
+class _StubBoxes:
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray):
+        self.xyxy = _tensor(xyxy, np.float32).reshape(-1, 4)
+        self.conf = _tensor(conf, np.float32)
+        self.cls = _tensor(cls, np.float32)
+
+    def __len__(self) -> int:
+        return len(self.xyxy)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield _StubBoxes(self.xyxy[i:i + 1], self.conf[i:i + 1], self.cls[i:i + 1])
+
+
+class _StubResult:
+    def __init__(self, image_bgr: np.ndarray, boxes: _StubBoxes, names: Dict[int, str]):
+        self.orig_img = image_bgr
+        self.boxes = boxes
+        self.names = names
+
+    def plot(self) -> np.ndarray:
+        """Рисует рамки на копии изображения (BGR), как Results.plot()."""
+        canvas = self.orig_img.copy()
+        for x_min, y_min, x_max, y_max in self.boxes.xyxy.numpy().astype(int):
+            cv2.rectangle(canvas, (x_min, y_min), (x_max, y_max), (0, 0, 255), 2)
+        return canvas
+
+
+class StubYOLO:
+    """
+    Вызываемый объект с интерфейсом модели ultralytics: model(image | [images], verbose=False).
+    Подходит для YOLOProcessor(model=StubYOLO()).
+    """
+    names = {0: "icon"}
+
+    def __init__(self, background_threshold: int = 245, min_area: int = 16):
+        """
+        :param background_threshold: Пиксели ярче порога считаются фоном.
+        :param min_area: Минимальная площадь компоненты в пикселях.
+        """
+        self.background_threshold = background_threshold
+        self.min_area = min_area
+
+    def __call__(self, images, verbose: bool = False) -> List[_StubResult]:
+        if not isinstance(images, list):
+            images = [images]
+        return [self._detect(image) for image in images]
+
+    def _detect(self, image) -> _StubResult:
+        if isinstance(image, Image.Image):
+            rgb = np.asarray(image.convert("RGB"))
+        else:
+            rgb = np.asarray(image)[..., :3]
+        bgr = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2BGR)
+
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        mask = (gray < self.background_threshold).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        stats = stats[1:count]
+        stats = stats[stats[:, cv2.CC_STAT_AREA] >= self.min_area]
+        left, top = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+        xyxy = np.stack([left, top, left + stats[:, cv2.CC_STAT_WIDTH], top + stats[:, cv2.CC_STAT_HEIGHT]], axis=1)
+
+        boxes = _StubBoxes(xyxy, np.full(len(xyxy), 0.9), np.zeros(len(xyxy)))
+        return _StubResult(bgr, boxes, self.names)
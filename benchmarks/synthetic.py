@@ -0,0 +1,69 @@
+"""
+Генератор синтетических листов со значками и эталонными рамками для офлайн-бенчмарков.
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+@dataclass
+class SyntheticSheet:
+    """Сгенерированный лист: изображение, маска значков, рамки и углы поворота каждого значка."""
+    image: Image.Image
+    mask: Image.Image
+    boxes: np.ndarray
+    angles: np.ndarray
+
+
+def _render_icon(rng: np.random.Generator, size: int) -> Image.Image:
+    """Рисует непрозрачный прямоугольный значок с простым рисунком внутри."""
+    aspect = rng.uniform(0.5, 0.9)
+    width, height = size, max(4, int(size * aspect))
+    color = tuple(int(v) for v in rng.integers(0, 200, size=3))
+    accent = tuple(int(v) for v in rng.integers(0, 200, size=3))
+
+    icon = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(icon)
+    draw.rectangle([0, 0, width - 1, height - 1], fill=color + (255,))
+    draw.ellipse([width // 4, height // 4, width * 3 // 4, height * 3 // 4], fill=accent + (255,))
+    return icon
+
+
+def make_sheet(icons: int, width: int, height: int = None, seed: int = 0,
+               max_angle: float = 30.0) -> SyntheticSheet:
+    """
+    Раскладывает N случайно повёрнутых значков по сетке на белом фоне.
+    :param icons: Число значков.
+    :param width: Ширина листа в пикселях.
+    :param height: Высота листа (по умолчанию — как у A4 при заданной ширине).
+    :param seed: Зерно генератора; один и тот же seed даёт один и тот же лист.
+    :param max_angle: Максимальный угол поворота значка в градусах.
+    """
+    height = height or int(width * 297 / 210)
+    rng = np.random.default_rng(seed)
+
+    cols = max(1, math.ceil(math.sqrt(icons * width / height)))
+    rows = math.ceil(icons / cols)
+    cell_width, cell_height = width / cols, height / rows
+    icon_size = max(8, int(min(cell_width, cell_height) * 0.6))
+
+    sheet = Image.new("RGB", (width, height), (255, 255, 255))
+    mask = Image.new("L", (width, height), 0)
+    boxes = np.zeros((icons, 4), dtype=np.float32)
+    angles = rng.uniform(-max_angle, max_angle, size=icons)
+
+    for i in range(icons):
+        icon = _render_icon(rng, icon_size).rotate(angles[i], expand=True, resample=Image.BICUBIC)
+        alpha = icon.getchannel("A")
+        left, top, right, bottom = alpha.getbbox()
+
+        row, col = divmod(i, cols)
+        x = int(col * cell_width + (cell_width - icon.width) / 2)
+        y = int(row * cell_height + (cell_height - icon.height) / 2)
+        sheet.paste(icon, (x, y), alpha)
+        mask.paste(alpha, (x, y), alpha)
+        boxes[i] = (x + left, y + top, x + right, y + bottom)
+
+    return SyntheticSheet(image=sheet, mask=mask, boxes=boxes, angles=angles)
@@ -1,27 +1,206 @@
+import time
+
+STARTED = time.perf_counter()
+
 import os
 import asyncio
-from aiogram import Bot, Dispatcher
+import logging
+import multiprocessing
+import signal
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
+
+# Настройки из .env нужны уже при импорте модулей (число процессов пула, общее хранилище)
+load_dotenv()
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 from base_callbacks import register_base_callbacks
 from pdf_callbacks import register_pdf_callbacks
+from worker_pool import pool
+from downloader import use_bot_session
+from metrics import MetricsMiddleware, start_metrics_server
+from shared_store import make_fsm_storage
+from webhook import WebhookRouter, start_site
+
+IMPORT_TIME = time.perf_counter() - STARTED
 
-load_dotenv()
 TOKEN: str | None = os.getenv("BOT_TOKEN")
+METRICS_PORT: str | None = os.getenv("METRICS_PORT")
+# Свой сервер Bot API (локальный telegram-bot-api или тестовый), по умолчанию api.telegram.org
+API_URL: str | None = os.getenv("TELEGRAM_API_URL")
+# redis://... или sqlite:///файл.db — общее хранилище состояний FSM и результатов детекции
+STORAGE_URL: str | None = os.getenv("STORAGE_URL")
+# Через сколько секунд общее хранилище забывает состояние диалога (по умолчанию неделя)
+FSM_TTL: float = float(os.getenv("FSM_TTL", str(7 * 24 * 3600)))
+# Публичный адрес бота: если задан, обновления принимаются вебхуком, а не опросом
+WEBHOOK_URL: str | None = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET: str | None = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_PROCESSES: int = int(os.getenv("WEBHOOK_PROCESSES", "1"))
 
 if not TOKEN:
     raise ValueError("В .env нет токена!")
 
-bot: Bot = Bot(token=TOKEN)
-dp: Dispatcher = Dispatcher()
+session = AiohttpSession(api=TelegramAPIServer.from_base(API_URL)) if API_URL else None
+bot: Bot = Bot(token=TOKEN, session=session)
+dp: Dispatcher = Dispatcher(storage=make_fsm_storage(STORAGE_URL, FSM_TTL))
+
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
 
 register_base_callbacks(dp, bot)
 register_pdf_callbacks(dp, bot)
+use_bot_session(bot)
+
+async def report_ready() -> None:
+    """Ожидает загрузки моделей в рабочих процессах и сообщает время до готовности."""
+    try:
+        startup = await pool.wait_ready()
+    except Exception:
+        logging.exception("Рабочие процессы не смогли загрузить модель")
+        return
+    print(f"Модели загружены и прогреты за {startup:.2f} с, "
+          f"бот готов через {time.perf_counter() - STARTED:.2f} с после запуска")
+
+@asynccontextmanager
+async def services(index: int = 0):
+    """
+    Пул рабочих процессов и эндпоинт метрик на время работы бота.
+    :param index: Номер процесса-обработчика вебхука (метрики каждого — на своём порту).
+    """
+    # Рабочие процессы загружают и прогревают модель в фоне, приём обновлений начинается сразу
+    pool.start()
+    ready_task = asyncio.create_task(report_ready())
+    metrics_runner = None
+    if METRICS_PORT:
+        port = int(METRICS_PORT) + index
+        metrics_runner = await start_metrics_server(port)
+        print(f"Метрики доступны на http://127.0.0.1:{port}/metrics")
+    try:
+        yield
+    finally:
+        ready_task.cancel()
+        pool.shutdown()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+async def set_webhook() -> None:
+    await bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                          drop_pending_updates=True)
+
+async def serve_webhook(host: str, port: int, index: int = 0, register: bool = False) -> None:
+    """
+    Принимает обновления вебхуком в этом процессе.
+    :param register: Сообщить Telegram адрес вебхука после запуска (если процесс один).
+    """
+    async with services(index):
+        app = web.Application()
+        SimpleRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+        runner = await start_site(app, host, port)
+        if register:
+            await set_webhook()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+async def run_until_stopped(coro, parent=None) -> None:
+    """
+    Выполняет корутину до завершения, сигнала SIGTERM/SIGINT или смерти родительского процесса.
+    Сигнал отменяет корутину, поэтому её блоки finally успевают остановить пул
+    и процессы-обработчики, а не оставить их сиротами.
+    :param parent: Родительский процесс (multiprocessing.parent_process()) для процесса-обработчика.
+    """
+    task = asyncio.ensure_future(coro)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            # Windows: обработчики сигналов в цикле событий не поддерживаются
+            pass
+
+    async def watch_parent() -> None:
+        while parent.is_alive():
+            await asyncio.sleep(1)
+        logging.warning("Маршрутизатор вебхука завершился, останавливаю процесс-обработчик")
+        task.cancel()
+
+    watcher = asyncio.create_task(watch_parent()) if parent is not None else None
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+def run_webhook_worker(index: int, port: int) -> None:
+    """Точка входа процесса-обработчика вебхука."""
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run_until_stopped(serve_webhook("127.0.0.1", port, index), multiprocessing.parent_process()))
+    except KeyboardInterrupt:
+        pass
+
+async def run_webhook_router() -> None:
+    """
+    Несколько процессов-обработчиков за одним портом: маршрутизатор принимает обновления
+    и передаёт их процессам по номеру чата, упавший процесс перезапускается.
+    """
+    # У каждого процесса свой пул детекции, поэтому ядра делятся между процессами
+    os.environ.setdefault("WORKERS", str(max(1, (os.cpu_count() or 1) // WEBHOOK_PROCESSES)))
+    context = multiprocessing.get_context("spawn")
+    ports = [WEBHOOK_PORT + 1 + i for i in range(WEBHOOK_PROCESSES)]
+
+    def start(index: int) -> multiprocessing.Process:
+        process = context.Process(target=run_webhook_worker, args=(index, ports[index]))
+        process.start()
+        return process
+
+    processes = [start(i) for i in range(WEBHOOK_PROCESSES)]
+    router = WebhookRouter([f"http://127.0.0.1:{port}{WEBHOOK_PATH}" for port in ports])
+    runner = await start_site(router.application(WEBHOOK_PATH), WEBHOOK_HOST, WEBHOOK_PORT)
+    try:
+        await set_webhook()
+        print(f"Вебхук на порту {WEBHOOK_PORT}, процессов-обработчиков: {WEBHOOK_PROCESSES}")
+        while True:
+            await asyncio.sleep(1)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logging.warning("Процесс-обработчик %d завершился с кодом %s, перезапускаю", i, process.exitcode)
+                    processes[i] = start(i)
+    finally:
+        await runner.cleanup()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            # Процесс останавливает свой пул; если он завис, завершаем принудительно
+            await asyncio.to_thread(process.join, 10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        await bot.session.close()
 
 async def main() -> None:
     """Основная функция для запуска бота."""
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    if WEBHOOK_URL and WEBHOOK_PROCESSES > 1:
+        await run_webhook_router()
+    elif WEBHOOK_URL:
+        await serve_webhook(WEBHOOK_HOST, WEBHOOK_PORT, register=True)
+    else:
+        async with services():
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    print("Бот запущен!")
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO)
+    print(f"Бот запущен! Импорт модулей занял {IMPORT_TIME:.2f} с")
+    asyncio.run(run_until_stopped(main()))
@@ -0,0 +1,84 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    """Площади рамок [x_min, y_min, x_max, y_max]."""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, threshold: float = 0.5, classes: Optional[np.ndarray] = None,
+        metric: str = "iou") -> np.ndarray:
+    """
+    Векторизованное подавление немаксимумов.
+    :param boxes: Рамки (N x 4).
+    :param scores: Оценки (N); рамки с большей оценкой обрабатываются первыми.
+    :param threshold: Порог перекрытия, выше которого рамка подавляется.
+    :param classes: Классы; если заданы, рамки разных классов друг друга не подавляют.
+    :param metric: "iou" — пересечение к объединению, "ios" — пересечение к меньшей из рамок
+                   (удобно для обрезанных на границе тайла рамок).
+    :return: Индексы оставленных рамок.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    if classes is not None:
+        # Сдвиг по классам разводит рамки разных классов, чтобы они не пересекались
+        offset = (boxes.max() + 1) * classes.astype(boxes.dtype)
+        boxes = boxes + offset[:, None]
+
+    areas = box_area(boxes)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        left = np.maximum(boxes[best, 0], boxes[rest, 0])
+        top = np.maximum(boxes[best, 1], boxes[rest, 1])
+        right = np.minimum(boxes[best, 2], boxes[rest, 2])
+        bottom = np.minimum(boxes[best, 3], boxes[rest, 3])
+        intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+
+        if metric == "ios":
+            overlap = intersection / np.maximum(np.minimum(areas[best], areas[rest]), 1e-9)
+        else:
+            overlap = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        order = rest[overlap <= threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def tile_grid(width: int, height: int, tile: int, overlap: float) -> List[Tuple[int, int, int, int]]:
+    """
+    Делит изображение на перекрывающиеся квадратные тайлы; последние тайлы прижаты к краю.
+    :return: Список рамок тайлов (left, top, right, bottom).
+    """
+    def starts(size: int) -> List[int]:
+        if size <= tile:
+            return [0]
+        stride = max(1, int(tile * (1 - overlap)))
+        positions = list(range(0, size - tile, stride))
+        positions.append(size - tile)
+        return positions
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def draw_boxes(image_rgb: np.ndarray, boxes: np.ndarray, classes: np.ndarray, confidences: np.ndarray,
+               names: Dict[int, str]) -> np.ndarray:
+    """Рисует рамки с подписями класса и уверенности на копии RGB-изображения."""
+    canvas = np.ascontiguousarray(image_rgb[..., :3]).copy()
+    thickness = max(1, round(sum(canvas.shape[:2]) / 1000))
+    for (x_min, y_min, x_max, y_max), class_id, confidence in zip(boxes.astype(int), classes, confidences):
+        color = tuple(int(c) for c in cv2.cvtColor(
+            np.uint8([[[(int(class_id) * 47) % 180, 220, 230]]]), cv2.COLOR_HSV2RGB)[0, 0])
+        cv2.rectangle(canvas, (x_min, y_min), (x_max, y_max), color, thickness)
+        label = f"{names.get(int(class_id), class_id)} {confidence:.2f}"
+        cv2.putText(canvas, label, (x_min, max(0, y_min - 3)), cv2.FONT_HERSHEY_SIMPLEX,
+                    thickness / 3, color, max(1, thickness - 1), cv2.LINE_AA)
+    return canvas
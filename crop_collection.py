@@ -0,0 +1,143 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass
+class Crop:
+    """
+    Вырезка значка: рамка на исходном листе и ленивое представление пикселей.
+    Пока пиксели не нужны, хранится только срез numpy без копирования.
+    """
+    box: Tuple[int, int, int, int]
+    view: Optional[np.ndarray]
+    class_id: int = -1
+    confidence: float = 0.0
+    _image: Optional[Image.Image] = field(default=None, repr=False)
+    # Номер исходного фото, если набор собран из нескольких листов (альбом)
+    source_id: int = 0
+    # Уже закодированная вырезка: (параметры кодирования, байты)
+    encoded: Optional[Tuple[tuple, bytes]] = field(default=None, repr=False)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Размер (ширина, высота) без материализации изображения."""
+        if self._image is not None:
+            return self._image.size
+        if self.view is None:
+            return self.box[2] - self.box[0], self.box[3] - self.box[1]
+        return self.view.shape[1], self.view.shape[0]
+
+    @property
+    def image(self) -> Image.Image:
+        """PIL-изображение вырезки; создаётся при первом обращении."""
+        if self._image is None:
+            self._image = Image.fromarray(self.view)
+        return self._image
+
+    @image.setter
+    def image(self, value: Image.Image) -> None:
+        self._image = value
+
+    def transient_image(self) -> Image.Image:
+        """
+        PIL-изображение без сохранения в вырезке: потоковый экспорт не держит в памяти весь набор.
+        """
+        if self._image is not None:
+            return self._image
+        return Image.fromarray(self.view)
+
+
+class CropCollection:
+    """
+    Набор вырезок с одного листа, общий для ImageController и OutputController.
+    """
+    def __init__(self, source: np.ndarray, boxes: Sequence[Sequence[float]],
+                 classes: Optional[Sequence[int]] = None, confidences: Optional[Sequence[float]] = None,
+                 names: Optional[Dict[int, str]] = None):
+        """
+        :param source: Исходное изображение (H x W x C).
+        :param boxes: Рамки [x_min, y_min, x_max, y_max] в пикселях.
+        :param classes: Классы объектов (необязательно).
+        :param confidences: Уверенности детектора (необязательно).
+        :param names: Имена классов (необязательно).
+        """
+        self.source = source
+        self.names = names or {}
+        height, width = source.shape[:2]
+
+        self.crops: List[Crop] = []
+        for i, box in enumerate(boxes):
+            left, top, right, bottom = (int(round(v)) for v in box)
+            left, right = max(0, left), min(width, right)
+            top, bottom = max(0, top), min(height, bottom)
+            self.crops.append(Crop(
+                box=(left, top, right, bottom),
+                view=source[top:bottom, left:right],
+                class_id=int(classes[i]) if classes is not None else -1,
+                confidence=float(confidences[i]) if confidences is not None else 0.0,
+            ))
+
+    @classmethod
+    def from_images(cls, images: Sequence[Image.Image]) -> "CropCollection":
+        """Создаёт набор из уже готовых изображений (без исходного листа)."""
+        collection = cls(np.zeros((0, 0, 4), dtype=np.uint8), [])
+        for image in images:
+            width, height = image.size
+            collection.crops.append(Crop(box=(0, 0, width, height), view=None, _image=image))
+        return collection
+
+    @classmethod
+    def concat(cls, collections: Sequence["CropCollection"]) -> "CropCollection":
+        """Объединяет наборы с нескольких листов в один (для общего экспорта альбома)."""
+        combined = cls(np.zeros((0, 0, 4), dtype=np.uint8), [])
+        for collection in collections:
+            combined.crops.extend(collection.crops)
+            combined.names.update(collection.names)
+        return combined
+
+    def detach(self, source_id: int = 0, keep_pixels: bool = True,
+               offset: Tuple[int, int] = (0, 0)) -> "CropCollection":
+        """
+        Отвязывает вырезки от исходного листа, чтобы набор можно было дёшево передать в другой процесс.
+        :param source_id: Номер исходного фото, который запоминается в каждой вырезке.
+        :param keep_pixels: Сохранить пиксели; если False, остаются только закодированные байты.
+        :param offset: Сдвиг рамок, если лист был обрезан до части (рамки возвращаются в координаты фото).
+        """
+        dx, dy = offset
+        for crop in self.crops:
+            left, top, right, bottom = crop.box
+            crop.box = (left + dx, top + dy, right + dx, bottom + dy)
+            if keep_pixels:
+                crop.image = crop.image.copy()
+            else:
+                crop.image = None
+            crop.view = None
+            crop.source_id = source_id
+        self.source = np.zeros((0, 0, 4), dtype=np.uint8)
+        return self
+
+    def __len__(self) -> int:
+        return len(self.crops)
+
+    def __iter__(self) -> Iterator[Crop]:
+        return iter(self.crops)
+
+    def __getitem__(self, index: int) -> Crop:
+        return self.crops[index]
+
+    @property
+    def images(self) -> List[Image.Image]:
+        """Материализованные изображения всех вырезок."""
+        return [crop.image for crop in self.crops]
+
+    @images.setter
+    def images(self, images: Sequence[Image.Image]) -> None:
+        for crop, image in zip(self.crops, images):
+            crop.image = image
+
+    def class_name(self, crop: Crop) -> str:
+        """Имя класса вырезки или пустая строка."""
+        return self.names.get(crop.class_id, "")
@@ -0,0 +1,216 @@
+import ast
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from box_ops import nms
+
+
+@dataclass
+class Detections:
+    """Рамки одного изображения в формате, не зависящем от бэкенда."""
+    boxes: np.ndarray
+    classes: np.ndarray
+    confidences: np.ndarray
+    names: Dict[int, str]
+
+
+def _to_pil(image) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(np.asarray(image))
+
+
+class TorchBackend:
+    """
+    Бэкенд на PyTorch через ultralytics (или любой объект с тем же интерфейсом вызова).
+    """
+    name = "torch"
+
+    def __init__(self, model_filename: str = "yolo_custom.pt", model=None):
+        """
+        :param model_filename: Файл весов .pt.
+        :param model: Уже загруженная модель с интерфейсом ultralytics.
+        """
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(model_filename)
+        self.model = model
+
+    def predict(self, images: Sequence) -> List[Detections]:
+        """Пакетный прогон списка изображений (PIL или RGB-массивы)."""
+        results = self.model([_to_pil(image) for image in images], verbose=False)
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            detections.append(Detections(
+                boxes=boxes.xyxy.cpu().numpy().astype(np.float32).reshape(-1, 4),
+                classes=boxes.cls.cpu().numpy().astype(np.int32),
+                confidences=boxes.conf.cpu().numpy().astype(np.float32),
+                names=dict(result.names),
+            ))
+        return detections
+
+
+def export_onnx(model_filename: str, imgsz: int = 640) -> str:
+    """
+    Экспортирует веса .pt в ONNX с динамическим размером пакета (один раз, рядом с исходным файлом).
+    Экспорт идёт во временном каталоге и переносится на место через os.replace,
+    поэтому процессы, одновременно загружающие модель, не увидят недописанный файл.
+    :return: Путь к файлу .onnx.
+    """
+    onnx_path = os.path.splitext(model_filename)[0] + ".onnx"
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(onnx_path))) as directory:
+            # ultralytics сохраняет ONNX рядом с весами, поэтому экспортируем копию весов
+            weights = shutil.copy(model_filename, directory)
+            exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True)
+            os.replace(exported, onnx_path)
+    return onnx_path
+
+
+def quantize_int8(onnx_path: str) -> str:
+    """
+    Динамически квантует веса ONNX-модели в int8 (один раз, рядом с исходным файлом).
+    Запись атомарна (временный файл и os.replace), как у экспорта в ONNX.
+    :return: Путь к квантованной модели.
+    """
+    int8_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(int8_path))) as directory:
+            temporary = os.path.join(directory, os.path.basename(int8_path))
+            quantize_dynamic(onnx_path, temporary, weight_type=QuantType.QUInt8)
+            os.replace(temporary, int8_path)
+    return int8_path
+
+
+class OnnxBackend:
+    """
+    Бэкенд на ONNX Runtime для CPU: собственная векторизованная подготовка входа (letterbox)
+    и постобработка выхода YOLOv8 с NMS.
+    """
+    name = "onnx"
+
+    def __init__(self, onnx_path: str, imgsz: int = 640, intra_threads: int = 0, inter_threads: int = 1,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.7, max_det: int = 300):
+        """
+        :param onnx_path: Файл модели .onnx.
+        :param imgsz: Размер входа модели.
+        :param intra_threads: Потоки внутри оператора (0 — по числу ядер).
+        :param inter_threads: Потоки между операторами.
+        :param conf_threshold: Минимальная уверенность.
+        :param iou_threshold: Порог IoU для NMS.
+        :param max_det: Максимум рамок на изображение.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_threads
+        options.inter_op_num_threads = inter_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        if isinstance(model_input.shape[2], int):
+            imgsz = model_input.shape[2]
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+
+    def _letterbox(self, image: Image.Image) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """Вписывает изображение в квадрат imgsz с серыми полями, как LetterBox в ultralytics."""
+        array = np.asarray(image.convert("RGB"))
+        height, width = array.shape[:2]
+        ratio = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = round(width * ratio), round(height * ratio)
+        pad_x, pad_y = (self.imgsz - new_width) / 2, (self.imgsz - new_height) / 2
+        left, top = round(pad_x - 0.1), round(pad_y - 0.1)
+
+        canvas = np.full((self.imgsz, self.imgsz, 3), 114, dtype=np.uint8)
+        resized = cv2.resize(array, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        canvas[top:top + new_height, left:left + new_width] = resized
+        return canvas, ratio, (left, top)
+
+    def _postprocess(self, output: np.ndarray, ratio: float, pad: Tuple[int, int],
+                     size: Tuple[int, int]) -> Detections:
+        """Разбирает выход (4 + число классов) x число якорей в рамки исходного изображения."""
+        predictions = output.T
+        scores = predictions[:, 4:]
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+
+        mask = confidences > self.conf_threshold
+        xywh, classes, confidences = predictions[mask, :4], classes[mask], confidences[mask]
+        boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+
+        keep = nms(boxes, confidences, self.iou_threshold, classes)[:self.max_det]
+        boxes, classes, confidences = boxes[keep], classes[keep], confidences[keep]
+
+        boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]])) / ratio
+        width, height = size
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return Detections(
+            boxes=boxes.astype(np.float32),
+            classes=classes.astype(np.int32),
+            confidences=confidences.astype(np.float32),
+            names=self.names,
+        )
+
+    def predict(self, images: Sequence) -> List[Detections]:
+        """Пакетный прогон списка изображений (PIL или RGB-массивы)."""
+        images = [_to_pil(image) for image in images]
+        prepared = [self._letterbox(image) for image in images]
+        batch = np.stack([canvas for canvas, _, _ in prepared]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: batch[i:i + 1]})[0] for i in range(len(batch))
+            ])
+
+        return [self._postprocess(output, ratio, pad, image.size)
+                for output, (_, ratio, pad), image in zip(outputs, prepared, images)]
+
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def make_backend(name: Optional[str] = None, model_filename: str = "yolo_custom.pt", imgsz: int = 640):
+    """
+    Создаёт бэкенд по имени из настроек.
+    :param name: "torch", "onnx" или "onnx-int8" (по умолчанию — переменная окружения YOLO_BACKEND).
+    :param model_filename: Файл весов .pt или .onnx.
+    """
+    name = name or os.getenv("YOLO_BACKEND", "torch")
+    if name == "torch":
+        return TorchBackend(model_filename)
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд детекции: {name}")
+
+    onnx_path = model_filename if model_filename.endswith(".onnx") else export_onnx(model_filename, imgsz)
+    if name == "onnx-int8":
+        onnx_path = quantize_int8(onnx_path)
+    return OnnxBackend(
+        onnx_path,
+        imgsz=imgsz,
+        intra_threads=int(os.getenv("YOLO_INTRA_THREADS", "0")),
+        inter_threads=int(os.getenv("YOLO_INTER_THREADS", "1")),
+    )
@@ -0,0 +1,133 @@
+import asyncio
+from io import BytesIO
+from typing import Optional, Union
+
+import aiohttp
+import numpy as np
+from PIL import Image, ImageOps
+
+from metrics import metrics
+
+
+class DownloadError(Exception):
+    """Ошибка скачивания файла (статус, таймаут или превышение размера)."""
+
+
+def decode_image(data: Union[bytes, BytesIO, np.ndarray, Image.Image]) -> Image.Image:
+    """
+    Приводит изображение из памяти (байты, BytesIO, numpy-массив или PIL Image) к PIL Image.
+    """
+    if isinstance(data, Image.Image):
+        return data
+    if isinstance(data, np.ndarray):
+        return Image.fromarray(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = BytesIO(data)
+
+    image = Image.open(data)
+    image.load()
+    return image
+
+
+def decode_document(data: Union[bytes, BytesIO, np.ndarray, Image.Image]) -> Image.Image:
+    """
+    Декодирует изображение, присланное файлом, и поворачивает его по тегу EXIF Orientation:
+    у сжатых фото Telegram делает это сам, а файл приходит как снят камерой.
+    """
+    image = decode_image(data)
+    ImageOps.exif_transpose(image, in_place=True)
+    return image
+
+
+class Downloader:
+    """
+    Асинхронный загрузчик файлов с пулом соединений.
+    Может переиспользовать HTTP-сессию бота, чтобы не открывать новое TLS-соединение на каждый файл.
+    """
+    def __init__(self, bot=None, max_bytes: int = 20 * 1024 * 1024, timeout: float = 30.0,
+                 chunk_size: int = 64 * 1024, connections: int = 32):
+        """
+        :param bot: Экземпляр aiogram Bot, чья сессия будет использоваться (необязательно).
+        :param max_bytes: Максимальный размер скачиваемого файла.
+        :param timeout: Общий таймаут скачивания в секундах.
+        :param chunk_size: Размер читаемого блока.
+        :param connections: Размер пула соединений для собственной сессии.
+        """
+        self.bot = bot
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.connections = connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self.bot is not None:
+            # Сессия бота сама пересоздаётся после закрытия и держит пул соединений к api.telegram.org
+            return await self.bot.session.create_session()
+
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.connections)
+                )
+            return self._session
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Скачивает файл потоком в буфер с ограничением размера и таймаутом.
+        :param url: URL файла.
+        :return: Содержимое файла.
+        """
+        session = await self._get_session()
+        buffer = BytesIO()
+        try:
+            with metrics.span("download"):
+                await self._stream(session, url, buffer)
+        except asyncio.TimeoutError:
+            raise DownloadError("Превышено время скачивания файла")
+        return buffer.getvalue()
+
+    async def _stream(self, session: aiohttp.ClientSession, url: str, buffer: BytesIO) -> None:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+            if response.status != 200:
+                raise DownloadError(f"HTTP {response.status} при скачивании файла")
+            if response.content_length and response.content_length > self.max_bytes:
+                raise DownloadError("Файл слишком большой")
+
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                buffer.write(chunk)
+                if buffer.tell() > self.max_bytes:
+                    raise DownloadError("Файл слишком большой")
+
+    async def resolve(self, file: str) -> str:
+        """
+        Ссылка на скачивание файла Telegram по file_id; URL возвращается как есть.
+        Ссылки Telegram временные и содержат токен бота, поэтому в состоянии диалога хранится только file_id,
+        а ссылка получается перед скачиванием.
+        """
+        if file.startswith(("http://", "https://")):
+            return file
+        file_info = await self.bot.get_file(file)
+        # Адрес строит сессия бота: с локальным сервером Bot API это не api.telegram.org
+        return self.bot.session.api.file_url(self.bot.token, file_info.file_path)
+
+    async def fetch_image(self, url: str) -> Image.Image:
+        """
+        Скачивает и декодирует изображение.
+        """
+        return decode_image(await self.fetch(url))
+
+    async def close(self) -> None:
+        """Закрывает собственную сессию (сессией бота управляет сам бот)."""
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+
+downloader = Downloader()
+
+
+def use_bot_session(bot) -> None:
+    """Переключает общий загрузчик на HTTP-сессию бота."""
+    downloader.bot = bot
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+import numpy as np
+from PIL import Image, ImageChops, ImageEnhance
+
+
+FILTERS = ("grayscale", "invert", "contrast", "threshold")
+
+_IDENTITY = np.arange(256, dtype=np.float64)
+
+
+_GRAY_MODES = {"RGB": "L", "RGBA": "LA"}
+
+
+def _normalize(img: Image.Image) -> Image.Image:
+    """Приводит изображение к одному из режимов RGB, RGBA, L или LA."""
+    if img.mode in ("RGB", "RGBA", "L", "LA"):
+        return img
+    has_alpha = "transparency" in img.info or img.mode in ("PA", "RGBa", "La")
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def _point(img: Image.Image, lut: np.ndarray, binary: bool = False) -> Image.Image:
+    """
+    Применяет таблицы преобразования цветовых каналов (C x 256) одним вызовом PIL;
+    альфа-канал получает тождественную таблицу и не меняется.
+    :param binary: Таблица переводит пиксели в 0 и 255: изображение L сохраняется в режиме "1".
+    """
+    if np.array_equal(lut, np.broadcast_to(_IDENTITY, lut.shape)):
+        return img
+    if img.mode in ("RGBA", "LA"):
+        lut = np.concatenate([lut, _IDENTITY[None, :]])
+    return img.point(lut.astype(np.uint8).ravel().tolist(), "1" if binary and img.mode == "L" else None)
+
+
+def _grayscale(img: Image.Image) -> Image.Image:
+    """RGB → L, RGBA → LA (склейка каналов быстрее, чем convert("LA"))."""
+    if img.mode == "RGBA":
+        return Image.merge("LA", (img.convert("L"), img.getchannel("A")))
+    return img.convert("L")
+
+
+def _mean_luminance(img: Image.Image) -> int:
+    """Средняя яркость, как в ImageEnhance.Contrast, но суммой в numpy вместо гистограммы в Python."""
+    gray = img if img.mode == "L" else img.convert("L")
+    return int(np.asarray(gray).sum(dtype=np.uint64) / (gray.width * gray.height) + 0.5)
+
+
+class FilterChain:
+    """
+    Ленивая цепочка фильтров. Поканальные операции сворачиваются в одну таблицу преобразования
+    на изображение, поэтому contrast→threshold выполняется за один проход по пикселям.
+    Таблицы считаются в numpy сразу для всего пакета, альфа-канал сохраняется.
+    Одиночный фильтр выполняется встроенными операциями PIL — так быстрее, чем через таблицы.
+    """
+    def __init__(self, *filters: str, contrast: float = 2.0, threshold: int = 128):
+        """
+        :param filters: Имена фильтров из FILTERS в порядке применения.
+        :param contrast: Коэффициент контраста.
+        :param threshold: Порог бинаризации.
+        """
+        self.filters = tuple(name for name in filters if name in FILTERS)
+        self.contrast = contrast
+        self.threshold = threshold
+        self._threshold_table = [255 if value > threshold else 0 for value in range(256)]
+
+    def then(self, *filters: str) -> "FilterChain":
+        """Возвращает новую цепочку с добавленными фильтрами."""
+        return FilterChain(*self.filters, *filters, contrast=self.contrast, threshold=self.threshold)
+
+    def __bool__(self) -> bool:
+        return bool(self.filters)
+
+    def _run(self, images: List[Image.Image]) -> List[Image.Image]:
+        n, c = len(images), 3 if images[0].mode in _GRAY_MODES else 1
+        luts = np.broadcast_to(_IDENTITY, (n, c, 256)).copy()
+
+        for name in self.filters:
+            if name == "grayscale" or (name == "threshold" and c == 3):
+                if c == 3:
+                    # Яркость зависит от всех каналов сразу, поэтому здесь накопленные таблицы применяются
+                    images = [_grayscale(_point(img, lut)) for img, lut in zip(images, luts)]
+                    c = 1
+                    luts = np.broadcast_to(_IDENTITY, (n, 1, 256)).copy()
+                if name == "grayscale":
+                    continue
+
+            if name == "invert":
+                luts = 255 - luts
+            elif name == "contrast":
+                if not np.array_equal(luts, np.broadcast_to(_IDENTITY, luts.shape)):
+                    # Среднюю яркость нужно считать по уже преобразованным пикселям
+                    images = [_point(img, lut) for img, lut in zip(images, luts)]
+                    luts = np.broadcast_to(_IDENTITY, (n, c, 256)).copy()
+                # Как в ImageEnhance.Contrast: смешивание с серым цветом средней яркости
+                mean = np.array([_mean_luminance(img) for img in images], dtype=np.float64)[:, None, None]
+                luts = np.clip(np.floor(mean + self.contrast * (luts - mean)), 0, 255)
+            elif name == "threshold":
+                luts = np.where(luts > self.threshold, 255.0, 0.0)
+
+        binary = "threshold" in self.filters and bool(np.isin(luts, (0.0, 255.0)).all())
+        return [_point(img, lut, binary) for img, lut in zip(images, luts)]
+
+    def _single(self, img: Image.Image) -> Image.Image:
+        """Один фильтр встроенными операциями PIL (те же результаты, что у таблиц)."""
+        name = self.filters[0]
+        if name == "grayscale":
+            return _grayscale(img) if img.mode in _GRAY_MODES else img
+        if name == "invert":
+            inverted = ImageChops.invert(img)
+            if img.mode in ("RGBA", "LA"):
+                inverted.putalpha(img.getchannel("A"))
+            return inverted
+        if name == "contrast":
+            return ImageEnhance.Contrast(img).enhance(self.contrast)
+        gray = img if img.mode == "L" else img.convert("L")
+        if img.mode in ("RGBA", "LA"):
+            return Image.merge("LA", (gray.point(self._threshold_table), img.getchannel("A")))
+        return gray.point(self._threshold_table, "1")
+
+    def apply(self, images: Sequence[Image.Image]) -> List[Image.Image]:
+        """
+        Применяет цепочку ко всем изображениям.
+        """
+        if not self.filters:
+            return list(images)
+
+        images = [_normalize(img) for img in images]
+        if len(self.filters) == 1:
+            return [self._single(img) for img in images]
+        groups: Dict[str, List[int]] = defaultdict(list)
+        for i, img in enumerate(images):
+            groups[img.mode].append(i)
+
+        result: List[Image.Image] = [None] * len(images)
+        for indices in groups.values():
+            for i, img in zip(indices, self._run([images[i] for i in indices])):
+                result[i] = img
+        return result
@@ -0,0 +1,323 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+
+def content_key(pixels: np.ndarray, options: str) -> str:
+    """
+    Ключ вырезки: хэш её пикселей (с размером и типом) и параметров обработки.
+    """
+    pixels = np.ascontiguousarray(pixels)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{pixels.shape}|{pixels.dtype}|{options}|".encode())
+    digest.update(pixels.data)
+    return digest.hexdigest()
+
+
+def perceptual_hash(pixels: np.ndarray) -> str:
+    """
+    Перцептивный отпечаток вырезки: 64-битный разностный хэш (dHash) яркости, грубый цвет
+    четырёх квадрантов (по 4 бита на канал) и размер. Устойчив к пересжатию JPEG и сдвигу рамки
+    на пару пикселей, а цвет и размер не дают спутать похожие по форме, но разные значки.
+    :return: Строка из 36 шестнадцатеричных символов.
+    """
+    image = Image.fromarray(np.ascontiguousarray(pixels)).convert("RGB")
+    values = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (values[:, 1:] > values[:, :-1]).ravel()
+    colour = np.asarray(image.resize((2, 2), Image.BOX)).ravel() >> 4
+    width, height = image.size
+    return (np.packbits(bits).tobytes().hex() + "".join(f"{value:x}" for value in colour)
+            + f"{min(width, 0xffff):04x}{min(height, 0xffff):04x}")
+
+
+def _split_hash(phash: str):
+    """Разбирает отпечаток на хэш яркости, цвет квадрантов и размер."""
+    colour = np.array([int(c, 16) for c in phash[16:28]], dtype=np.int16)
+    size = np.array([int(phash[28:32], 16), int(phash[32:36], 16)], dtype=np.int32)
+    return int(phash[:16], 16), colour, size
+
+
+class IconCache:
+    """
+    Кэш результатов обработки отдельных значков (удаление фона, выравнивание).
+    Первый уровень — LRU в памяти, второй — каталог .npy-файлов с ограничением по объёму,
+    который переживает перезапуск и общий для всех процессов пула.
+    Файлы читаются через mmap, запись атомарна (временный файл и os.replace).
+    Перцептивный отпечаток лежит рядом в файле <ключ>.phash, имя файла с пикселями от него не зависит.
+    """
+    def __init__(self, directory: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_disk_bytes: int = 512 * 1024 * 1024, phash: bool = False, phash_distance: int = 4):
+        """
+        :param directory: Каталог дискового хранилища (None — только память).
+        :param max_memory_bytes: Лимит LRU в памяти.
+        :param max_disk_bytes: Лимит дискового хранилища; при превышении удаляются давно не читавшиеся файлы.
+        :param phash: Искать почти одинаковые вырезки по перцептивному хэшу, если точного совпадения нет.
+        :param phash_distance: Максимальное расстояние Хэмминга между хэшами яркости.
+        """
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.phash = phash
+        self.phash_distance = phash_distance
+
+        self._memory: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        # Сколько записано этим процессом с последнего пересчёта объёма каталога
+        self._unscanned_bytes = 0
+        # Для каждого набора параметров: ключ -> перцептивный отпечаток
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._index: Dict[str, tuple] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    @staticmethod
+    def _options_dir(options: str) -> str:
+        return hashlib.blake2b(options.encode(), digest_size=4).hexdigest()
+
+    def _path(self, options: str, key: str) -> str:
+        return os.path.join(self.directory, self._options_dir(options), key + ".npy")
+
+    def _scan(self) -> None:
+        """Восстанавливает объём хранилища и индекс перцептивных хэшей после перезапуска."""
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            hashes = self._hashes.setdefault(entry.name, {})
+            for file in os.scandir(entry.path):
+                if file.name.endswith(".npy"):
+                    self.disk_bytes += file.stat().st_size
+                elif file.name.endswith(".phash"):
+                    self.disk_bytes += file.stat().st_size
+                    if not self.phash:
+                        continue
+                    try:
+                        with open(file.path) as sidecar:
+                            hashes[file.name[:-6]] = sidecar.read().strip()
+                    except OSError:
+                        continue
+
+    def get(self, pixels: np.ndarray, options: str) -> Optional[Image.Image]:
+        """
+        Ищет готовый результат для вырезки.
+        :param pixels: Пиксели исходной вырезки.
+        :param options: Строка с параметрами обработки (входит в ключ).
+        """
+        key = content_key(pixels, options)
+        image = self._get_key(key, options)
+        if image is not None:
+            with self._lock:
+                self.hits += 1
+            return image
+
+        # Перцептивный хэш считается только при промахе по точному ключу
+        if self.phash and self.directory:
+            similar = self._find_similar(perceptual_hash(pixels), options)
+            if similar is not None:
+                image = self._get_key(similar, options)
+                if image is not None:
+                    with self._lock:
+                        self.phash_hits += 1
+                    return image
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get_key(self, key: str, options: str) -> Optional[Image.Image]:
+        with self._lock:
+            image = self._memory.get(key)
+            if image is not None:
+                self._memory.move_to_end(key)
+                return image
+
+        if not self.directory:
+            return None
+        path = self._path(options, key)
+        try:
+            image = Image.fromarray(np.load(path, mmap_mode="r"))
+            # Время изменения служит отметкой последнего чтения для вытеснения с диска
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        self._remember(key, image)
+        return image
+
+    def _find_similar(self, phash: str, options: str) -> Optional[str]:
+        folder = self._options_dir(options)
+        if not self._hashes.get(folder):
+            return None
+        index = self._index.get(folder)
+        if index is None:
+            # Массивы для векторного поиска пересобираются только после изменения набора записей
+            parsed = [_split_hash(value) for value in self._hashes[folder].values()]
+            index = self._index[folder] = (
+                list(self._hashes[folder]),
+                np.array([value for value, _, _ in parsed], dtype=np.uint64),
+                np.stack([value for _, value, _ in parsed]),
+                np.stack([value for _, _, value in parsed]),
+            )
+        keys, values, colours, sizes = index
+        structure, colour, size = _split_hash(phash)
+
+        distances = np.unpackbits((values ^ np.uint64(structure)).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        # Цвет квадрантов может отличаться не больше чем на одну ступень квантования,
+        # размер — на пару пикселей (рамки одного значка на разных фото чуть отличаются)
+        same_colour = np.abs(colours - colour).max(axis=1) <= 1
+        same_size = (np.abs(sizes - size) <= np.maximum(2, size * 0.03)).all(axis=1)
+        distances = np.where(same_colour & same_size, distances, 64 + 1)
+        best = int(distances.argmin())
+        return keys[best] if distances[best] <= self.phash_distance else None
+
+    def put(self, pixels: np.ndarray, options: str, image: Image.Image) -> None:
+        """
+        Сохраняет результат обработки вырезки в память и на диск.
+        :param pixels: Пиксели исходной вырезки.
+        :param options: Строка с параметрами обработки.
+        :param image: Обработанное изображение.
+        """
+        key = content_key(pixels, options)
+        self._remember(key, image)
+        if not self.directory:
+            return
+
+        path = self._path(options, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as file:
+            np.save(file, np.asarray(image))
+        os.replace(file.name, path)
+
+        size = os.path.getsize(path)
+        phash = perceptual_hash(pixels) if self.phash else None
+        if phash is not None:
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".tmp", delete=False) as file:
+                file.write(phash)
+            os.replace(file.name, path[:-4] + ".phash")
+            size += len(phash)
+
+        with self._lock:
+            self.disk_bytes += size
+            self._unscanned_bytes += size
+            if phash is not None:
+                self._hashes.setdefault(self._options_dir(options), {})[key] = phash
+                self._index.pop(self._options_dir(options), None)
+        # Другие процессы пула пишут в тот же каталог, поэтому свой счётчик занижает объём:
+        # каталог пересчитывается и после каждых 5% лимита, записанных этим процессом
+        if self.disk_bytes > self.max_disk_bytes or self._unscanned_bytes > self.max_disk_bytes * 0.05:
+            self._prune()
+
+    def _remember(self, key: str, image: Image.Image) -> None:
+        size = image.width * image.height * len(image.getbands())
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = image
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_memory_bytes:
+                _, oldest = self._memory.popitem(last=False)
+                self.memory_bytes -= oldest.width * oldest.height * len(oldest.getbands())
+
+    def _prune(self) -> None:
+        """
+        Пересчитывает объём каталога (файлы с пикселями вместе с отпечатками .phash) и, если лимит
+        превышен, удаляет давно не читавшиеся записи, пока хранилище не займёт 90% лимита.
+        """
+        records = []
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            pixels, sidecars = [], {}
+            for entry in os.scandir(folder.path):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    # Файл только что удалил другой процесс
+                    continue
+                if entry.name.endswith(".npy"):
+                    pixels.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+                elif entry.name.endswith(".phash"):
+                    sidecars[entry.name[:-6]] = stat.st_size
+            for mtime, size, key in pixels:
+                records.append((mtime, size + sidecars.pop(key, 0), folder.name, key))
+            # Отпечатки без файла с пикселями (его уже удалили) вытесняются первыми
+            records.extend((0.0, size, folder.name, key) for key, size in sidecars.items())
+        records.sort(key=lambda item: item[0])
+
+        total = sum(size for _, size, _, _ in records)
+        target = self.max_disk_bytes * 0.9 if total > self.max_disk_bytes else total
+        removed = []
+        for _, size, folder, key in records:
+            if total <= target:
+                break
+            base = os.path.join(self.directory, folder, key)
+            try:
+                os.remove(base + ".npy")
+            except FileNotFoundError:
+                # Уже удалён другим процессом или остался только отпечаток
+                pass
+            except OSError:
+                # Файл открыт (Windows)
+                continue
+            try:
+                os.remove(base + ".phash")
+            except OSError:
+                pass
+            total -= size
+            removed.append((folder, key))
+        with self._lock:
+            for folder, key in removed:
+                self._hashes.get(folder, {}).pop(key, None)
+                self._index.pop(folder, None)
+            self.disk_bytes = total
+            self._unscanned_bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики попаданий и объём кэша в памяти и на диске.
+        """
+        return {
+            "hits": self.hits,
+            "phash_hits": self.phash_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes,
+        }
+
+
+_icon_cache: Optional[IconCache] = None
+
+
+def get_icon_cache() -> Optional[IconCache]:
+    """
+    Возвращает общий для процесса кэш значков, настроенный переменными окружения
+    ICON_CACHE_DIR, ICON_CACHE_MB, ICON_CACHE_MEMORY_MB и ICON_CACHE_PHASH.
+    Дисковый уровень включается, только если задан каталог ICON_CACHE_DIR, иначе кэш живёт в памяти.
+    Если ICON_CACHE_MB=0, кэширование отключено.
+    """
+    global _icon_cache
+    if _icon_cache is None:
+        disk_mb = int(os.getenv("ICON_CACHE_MB", "512"))
+        if disk_mb <= 0:
+            return None
+        _icon_cache = IconCache(
+            directory=os.getenv("ICON_CACHE_DIR") or None,
+            max_memory_bytes=int(os.getenv("ICON_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+            max_disk_bytes=disk_mb * 1024 * 1024,
+            phash=os.getenv("ICON_CACHE_PHASH", "0") == "1",
+        )
+    return _icon_cache
@@ -0,0 +1,227 @@
+import asyncio
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from metrics import metrics
+from worker_pool import pool
+
+if TYPE_CHECKING:
+    from jobs import Job
+
+
+# Чем меньше число, тем раньше задание получает слот: размеченное фото — быстрый ответ,
+# PDF с большой сеткой — самое долгое задание
+DEFAULT_PRIORITIES = {"marked_photo": 0, "zip": 1, "pdf": 2}
+
+
+def parse_priorities(value: str) -> Dict[str, int]:
+    """
+    Разбирает приоритеты операций из строки вида "marked_photo=0,zip=1,pdf=2"
+    (не указанные операции сохраняют приоритет по умолчанию).
+    """
+    priorities = dict(DEFAULT_PRIORITIES)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, priority = item.partition("=")
+        priorities[name.strip()] = int(priority)
+    return priorities
+
+
+class SingleFlight:
+    """
+    Объединяет одинаковые одновременные вычисления: пока вычисление по ключу идёт,
+    остальные запросы с тем же ключом ждут его результат, а не запускают своё.
+    Вычисление отменяется, только когда его перестали ждать все запросы.
+    """
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        # Вычисление -> сколько запросов ждут его результат
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """
+        Возвращает результат вычисления по ключу, запуская его, только если такого ещё нет.
+        :param key: Ключ вычисления (операция, фото, параметры).
+        :param factory: Корутинная функция без аргументов; вызывается только первым запросом.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            self.started += 1
+            flight = self._flights[key] = asyncio.ensure_future(factory())
+            flight.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        self._waiters[flight] = self._waiters.get(flight, 0) + 1
+        try:
+            # Отмена одного ожидающего не прерывает вычисление для остальных
+            return await asyncio.shield(flight)
+        finally:
+            self._waiters[flight] -= 1
+            if not self._waiters[flight]:
+                del self._waiters[flight]
+                if not flight.done():
+                    # Результат больше никому не нужен: например, все задания отменены новым фото
+                    flight.cancel()
+                    # Новый запрос с тем же ключом запустит вычисление заново, а не получит отмену
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+
+    def _finish(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            # Помечаем исключение полученным, даже если все ожидающие уже ушли
+            flight.exception()
+
+    def collect_metrics(self):
+        """Счётчики запущенных и объединённых вычислений для эндпоинта метрик."""
+        yield "single_flight_started_total", {}, self.started
+        yield "single_flight_shared_total", {}, self.shared
+        yield "single_flight_running", {}, len(self._flights)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "future")
+
+    def __init__(self, user_id: int, priority: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.priority = priority
+        self.future = future
+
+
+class JobScheduler:
+    """
+    Выдаёт заданиям обработчиков слоты выполнения:
+    - одновременно выполняется не больше max_running заданий и не больше per_user от одного пользователя;
+    - первыми слоты получают задания с более высоким приоритетом (меньшим числом);
+    - при равном приоритете пользователи обслуживаются по кругу, поэтому тот,
+      кто прислал десяток запросов, не задерживает остальных.
+    """
+    def __init__(self, max_running: int, per_user: int = 2, priorities: Optional[Dict[str, int]] = None):
+        """
+        :param max_running: Сколько заданий выполняется одновременно.
+        :param per_user: Сколько заданий одного пользователя выполняется одновременно.
+        :param priorities: Приоритеты операций.
+        """
+        self.max_running = max_running
+        self.per_user = per_user
+        self.priorities = priorities if priorities is not None else dict(DEFAULT_PRIORITIES)
+        # Приоритет -> очереди пользователей и порядок обхода пользователей по кругу
+        self._queues: Dict[int, Dict[int, Deque[_Waiter]]] = {}
+        self._turns: Dict[int, Deque[int]] = {}
+        self._user_running: Dict[int, int] = {}
+        self.running = 0
+        self.waiting = 0
+
+    def priority(self, operation: str) -> int:
+        """Приоритет операции; неизвестные операции идут последними."""
+        return self.priorities.get(operation, max(self.priorities.values(), default=0))
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, operation: str, job: Optional["Job"] = None,
+                   on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> AsyncIterator[None]:
+        """
+        Ожидает слот для задания пользователя и освобождает его при выходе из блока.
+        :param operation: Операция задания, определяет приоритет.
+        :param job: Задание; его отмена снимает ожидание слота.
+        :param on_queued: Колбэк с позицией в очереди, если слот не выдан сразу.
+        :raises JobCancelled: Если задание отменили, пока оно ждало слот.
+        """
+        waiter = _Waiter(user_id, self.priority(operation), asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        self._dispatch()
+        try:
+            if not waiter.future.done():
+                if job is not None:
+                    job.track(waiter.future)
+                if on_queued is not None:
+                    await on_queued(self.waiting)
+                try:
+                    await waiter.future
+                except asyncio.CancelledError:
+                    if job is not None:
+                        job.check()
+                    raise
+            yield
+        finally:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(user_id)
+            else:
+                self._remove(waiter)
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        users = self._queues.setdefault(waiter.priority, {})
+        if waiter.user_id not in users:
+            users[waiter.user_id] = deque()
+            self._turns.setdefault(waiter.priority, deque()).append(waiter.user_id)
+        users[waiter.user_id].append(waiter)
+        self.waiting += 1
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.priority, {}).get(waiter.user_id)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        self.waiting -= 1
+        if not queue:
+            self._drop_user(waiter.priority, waiter.user_id)
+
+    def _drop_user(self, priority: int, user_id: int) -> None:
+        del self._queues[priority][user_id]
+        self._turns[priority].remove(user_id)
+        if not self._queues[priority]:
+            del self._queues[priority], self._turns[priority]
+
+    def _next(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            turns = self._turns[priority]
+            for _ in range(len(turns)):
+                user_id = turns[0]
+                turns.rotate(-1)
+                if self._user_running.get(user_id, 0) >= self.per_user:
+                    continue
+                queue = self._queues[priority][user_id]
+                waiter = queue.popleft()
+                self.waiting -= 1
+                if not queue:
+                    self._drop_user(priority, user_id)
+                return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_running:
+            waiter = self._next()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                # Ожидание уже отменено вместе с заданием
+                continue
+            self.running += 1
+            self._user_running[waiter.user_id] = self._user_running.get(waiter.user_id, 0) + 1
+            waiter.future.set_result(None)
+
+    def _release(self, user_id: int) -> None:
+        self.running -= 1
+        count = self._user_running.pop(user_id) - 1
+        if count:
+            self._user_running[user_id] = count
+        self._dispatch()
+
+    def collect_metrics(self):
+        """Текущая загрузка планировщика для эндпоинта метрик."""
+        yield "jobs_running", {}, self.running
+        yield "jobs_waiting", {}, self.waiting
+        yield "jobs_users_running", {}, len(self._user_running)
+
+
+flights = SingleFlight()
+job_scheduler = JobScheduler(
+    max_running=int(os.getenv("JOBS_RUNNING", "0")) or 2 * pool.workers,
+    per_user=int(os.getenv("JOBS_PER_USER", "2")),
+    priorities=parse_priorities(os.getenv("JOB_PRIORITIES", "")),
+)
+metrics.add_collector(flights.collect_metrics)
+metrics.add_collector(job_scheduler.collect_metrics)
@@ -0,0 +1,282 @@
+import asyncio
+import math
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from job_scheduler import flights
+from worker_pool import crop_part_task, export_parts_zip_task, export_pdf_task, pool
+
+if TYPE_CHECKING:
+    from PIL import Image
+    from crop_collection import CropCollection
+    from yolo_processor import DetectionResult
+
+
+class JobCancelled(Exception):
+    """Задание отменено: пользователь прислал новое фото."""
+
+
+class Job:
+    """
+    Задание обработки для одного чата. Отмена кооперативная: обработчик вызывает check()
+    между этапами, а ещё не начатые части задания снимаются с очереди пула.
+    """
+    def __init__(self, chat_id: int, key: tuple = ()):
+        """
+        :param key: Запрос задания: (операция, фото, параметры...).
+        """
+        self.chat_id = chat_id
+        self.key = key
+        self.cancelled = False
+        self._tasks: List[asyncio.Future] = []
+
+    def check(self) -> None:
+        """
+        :raises JobCancelled: Если задание отменено.
+        """
+        if self.cancelled:
+            raise JobCancelled()
+
+    def track(self, future: asyncio.Future) -> None:
+        """Отмена задания отменит и это ожидание (часть в пуле, слот планировщика)."""
+        self._tasks.append(future)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        for task in self._tasks:
+            task.cancel()
+
+    async def shared(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """
+        Выполняет этап задания через flights: такой же одновременный запрос из другого чата
+        получит те же байты, а не запустит этап второй раз. Отмена задания снимает только
+        его ожидание; сам этап прерывается, когда его результат не ждёт никто.
+        :param key: Ключ этапа: запрос задания и, если нужно, номер части.
+        :param factory: Корутинная функция без аргументов; не должна проверять отмену этого задания.
+        :raises JobCancelled: Если задание отменено.
+        """
+        self.check()
+        waiter = asyncio.ensure_future(flights.run(key, factory))
+        self.track(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise JobCancelled() from None
+            raise
+
+    async def ordered(self, parts: List[Callable[[], Awaitable]], window: int = 2) -> AsyncIterator:
+        """
+        Выполняет части задания, держа в работе не больше window одновременно,
+        и отдаёт результаты по порядку. Между частями проверяет отмену.
+        :param parts: Корутинные функции без аргументов, по одной на часть.
+        :param window: Сколько частей может выполняться (или ждать в очереди пула) одновременно.
+        """
+        pending = [asyncio.ensure_future(part()) for part in parts[:window]]
+        for task in pending:
+            self.track(task)
+        try:
+            for i in range(len(parts)):
+                self.check()
+                try:
+                    result = await pending[i]
+                except asyncio.CancelledError:
+                    if self.cancelled:
+                        raise JobCancelled() from None
+                    raise
+                self.check()
+                if i + window < len(parts):
+                    task = asyncio.ensure_future(parts[i + window]())
+                    pending.append(task)
+                    self.track(task)
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+class JobRegistry:
+    """
+    Текущие задания чатов. Новое фото отменяет все задания чата, та же операция с другими
+    параметрами (например, другая сетка PDF) — предыдущее задание этой операции,
+    а точный повтор уже выполняющегося запроса второй раз не запускается.
+    """
+    def __init__(self):
+        self._jobs: Dict[int, Dict[tuple, Job]] = {}
+
+    def start(self, chat_id: int, key: tuple) -> Optional[Job]:
+        """
+        Начинает задание для чата.
+        :param key: Запрос: (операция, фото, параметры...).
+        :return: Задание или None, если такой же запрос уже выполняется.
+        """
+        running = self._jobs.setdefault(chat_id, {})
+        if key in running:
+            return None
+        for other in [other for other in running if other[0] == key[0]]:
+            running.pop(other).cancel()
+        job = running[key] = Job(chat_id, key)
+        return job
+
+    def cancel(self, chat_id: int) -> bool:
+        """
+        Отменяет все задания чата.
+        :return: True, если было что отменять.
+        """
+        running = self._jobs.pop(chat_id, {})
+        for job in running.values():
+            job.cancel()
+        return bool(running)
+
+    def finish(self, job: Job) -> None:
+        """Снимает завершённое задание с учёта."""
+        running = self._jobs.get(job.chat_id, {})
+        if running.get(job.key) is job:
+            del running[job.key]
+            if not running:
+                del self._jobs[job.chat_id]
+
+
+def photos_key(data: dict) -> tuple:
+    """Фото запроса для ключа задания: file_unique_id одиночного фото или всех фото альбома."""
+    if data.get("album"):
+        return tuple(photo["photo_id"] for photo in data["album"])
+    return (data.get("photo_id") or str(data.get("file_id")),)
+
+
+class ProgressMessage:
+    """
+    Сообщение с прогрессом, которое редактируется по мере обработки
+    (не чаще min_interval секунд, чтобы не упираться в лимиты Telegram).
+    """
+    def __init__(self, message: Message, title: str, total: int, min_interval: float = 1.0):
+        """
+        :param message: Сообщение, в чат которого отправляется прогресс.
+        :param title: Что обрабатывается ("Вырезаю значки", "Собираю PDF").
+        :param total: Общее число значков.
+        """
+        self.message = message
+        self.title = title
+        self.total = total
+        self.min_interval = min_interval
+        self._sent: Optional[Message] = None
+        self._text = ""
+        self._updated_at = 0.0
+
+    def _render(self, done: int) -> str:
+        filled = round(10 * done / self.total) if self.total else 10
+        return f"{self.title}: {'▓' * filled}{'░' * (10 - filled)} {done}/{self.total}"
+
+    async def update(self, done: int, force: bool = False) -> None:
+        """Показывает, сколько значков обработано."""
+        await self._edit(self._render(done), force)
+
+    async def finish(self, text: str) -> None:
+        """Заменяет прогресс итоговым текстом."""
+        await self._edit(text, force=True)
+
+    async def _edit(self, text: str, force: bool) -> None:
+        now = time.monotonic()
+        if text == self._text or (not force and now - self._updated_at < self.min_interval):
+            return
+        self._text, self._updated_at = text, now
+        if self._sent is None:
+            self._sent = await self.message.answer(text)
+            return
+        try:
+            await self._sent.edit_text(text)
+        except TelegramBadRequest:
+            # Сообщение удалено пользователем или текст не изменился
+            pass
+
+
+def sheet_region(image: "Image.Image", coordinates: List[List[float]]):
+    """
+    Обрезает лист до общей рамки группы значков, чтобы в рабочий процесс уходила только нужная часть.
+    :return: (часть листа, рамки относительно неё, положение части на листе).
+    """
+    if not coordinates:
+        return image, [], (0, 0)
+    left = max(0, math.floor(min(box[0] for box in coordinates)))
+    top = max(0, math.floor(min(box[1] for box in coordinates)))
+    right = min(image.width, math.ceil(max(box[2] for box in coordinates)))
+    bottom = min(image.height, math.ceil(max(box[3] for box in coordinates)))
+    boxes = [(x_min - left, y_min - top, x_max - left, y_max - top) for x_min, y_min, x_max, y_max in coordinates]
+    return image.crop((left, top, right, bottom)), boxes, (left, top)
+
+
+async def crop_in_parts(job: Job, detection: "DetectionResult", on_queued=None,
+                        progress: Optional[ProgressMessage] = None, image_format: Optional[str] = None,
+                        chunk: int = 48) -> List["CropCollection"]:
+    """
+    Вырезает (и для ZIP кодирует) значки частями по chunk штук: части выполняются в пуле параллельно,
+    прогресс обновляется по мере готовности, а между частями проверяется отмена.
+    :return: Наборы вырезок по частям в исходном порядке.
+    """
+    coordinates = detection.coordinates
+
+    def part(start: int) -> Callable[[], Awaitable]:
+        end = start + chunk
+        image, boxes, offset = sheet_region(detection.image, coordinates[start:end])
+        return lambda: pool.run(
+            crop_part_task, image, boxes, detection.classes[start:end], detection.confidences[start:end],
+            detection.names, 0, False, False, image_format, offset, on_queued=on_queued, admitted=True
+        )
+
+    parts, done = [], 0
+    async for collection in job.ordered([part(start) for start in range(0, len(coordinates), chunk)],
+                                        window=pool.workers + 1):
+        parts.append(collection)
+        done += len(collection)
+        if progress is not None:
+            await progress.update(done)
+    return parts
+
+
+async def zip_in_parts(job: Job, detection: "DetectionResult", on_queued=None,
+                       progress: Optional[ProgressMessage] = None, image_format: str = "png") -> bytes:
+    """
+    ZIP со всеми значками: вырезки частями (crop_in_parts), затем упаковка в пуле.
+    Одновременные запросы того же фото из разных чатов получают один и тот же архив.
+    """
+    async def build() -> bytes:
+        # У общего вычисления своё задание: отмена одного запроса не прерывает его для остальных
+        parts = await crop_in_parts(Job(job.chat_id, job.key), detection, on_queued, progress, image_format)
+        return await pool.run(export_parts_zip_task, parts, image_format, on_queued=on_queued, admitted=True)
+
+    return await job.shared(job.key + (image_format,), build)
+
+
+async def pdf_in_parts(job: Job, detection: "DetectionResult", rows: int, cols: int,
+                       orientation: str = "portrait", on_queued=None, pages_per_part: int = 5,
+                       page_size: str = "A4", dpi: int = 150) -> AsyncIterator[Tuple[int, int, int, bytes]]:
+    """
+    Собирает PDF частями по pages_per_part страниц и отдаёт каждую часть, как только она готова.
+    Части режутся по границам страниц, поэтому раскладка совпадает с цельным PDF.
+    :param page_size: Формат страницы (A3, A4, A5, Letter).
+    :param dpi: Разрешение встраиваемых изображений.
+    :return: Асинхронный итератор (номер части, число частей, готово значков, байты PDF).
+    """
+    coordinates = detection.coordinates
+    chunk = rows * cols * pages_per_part
+
+    def part(start: int) -> Callable[[], Awaitable]:
+        image, boxes, _ = sheet_region(detection.image, coordinates[start:start + chunk])
+        # Части с теми же страницами из других чатов собираются один раз
+        return lambda: job.shared(
+            job.key + (start,),
+            lambda: pool.run(export_pdf_task, image, boxes, rows, cols, orientation, False, False, page_size, dpi,
+                             on_queued=on_queued, admitted=True)
+        )
+
+    parts = [part(start) for start in range(0, len(coordinates), chunk)]
+    index = 0
+    async for pdf_bytes in job.ordered(parts, window=pool.workers + 1):
+        index += 1
+        yield index, len(parts), min(len(coordinates), index * chunk), pdf_bytes
+
+
+jobs = JobRegistry()
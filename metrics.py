@@ -0,0 +1,252 @@
+import bisect
+import json
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+
+
+logger = logging.getLogger("photobot.requests")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ICON_BUCKETS = (1, 5, 10, 25, 50, 100, 150, 250, 500)
+
+
+class Histogram:
+    """
+    Простая гистограмма с фиксированными границами корзин.
+    """
+    def __init__(self, bounds: Sequence[float]):
+        """
+        :param bounds: Возрастающие верхние границы корзин; последняя корзина — всё, что больше.
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Добавляет наблюдение."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        """Возвращает границы, счётчики по корзинам, число наблюдений и сумму."""
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "count": self.count, "sum": self.sum}
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Контекст текущего запроса (этапы и счётчики для итоговой строки лога)
+_request: ContextVar[Optional[Dict[str, Any]]] = ContextVar("photobot_request", default=None)
+# Сбор замеров внутри рабочего процесса для передачи родителю
+_captured: ContextVar[Optional[Dict[str, float]]] = ContextVar("photobot_captured", default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """
+    Реестр метрик процесса: счётчики, гистограммы и вычисляемые при выдаче значения.
+    Пока метрики выключены, span() возвращает общий пустой контекстный менеджер.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._collectors: list = []
+
+    def span(self, name: str):
+        """Контекстный менеджер, замеряющий длительность этапа обработки."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def record_stage(self, name: str, seconds: float) -> None:
+        """Учитывает длительность этапа в гистограмме и в контексте текущего запроса."""
+        captured = _captured.get()
+        if captured is not None:
+            captured[name] = captured.get(name, 0.0) + seconds
+            return
+
+        self.observe("stage_seconds", seconds, stage=name)
+        request = _request.get()
+        if request is not None:
+            request["stages"][name] = request["stages"].get(name, 0.0) + seconds
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """Увеличивает счётчик."""
+        if self.enabled:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: str) -> None:
+        """Добавляет наблюдение в гистограмму."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def observe_icons(self, count: int) -> None:
+        """Учитывает число значков, найденных в рамках запроса."""
+        if not self.enabled:
+            return
+        self.observe("icons_per_request", count, ICON_BUCKETS)
+        request = _request.get()
+        if request is not None:
+            request["icons"] = count
+
+    def request_error(self, error: BaseException) -> None:
+        """Помечает текущий запрос как завершившийся ошибкой (для обработчиков, которые сами ловят исключения)."""
+        logging.getLogger("photobot").error("Ошибка обработки запроса: %s", error, exc_info=error)
+        request = _request.get()
+        if request is not None:
+            request["error"] = repr(error)
+
+    def add_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]) -> None:
+        """
+        Регистрирует функцию, возвращающую текущие значения (имя, метки, значение) при каждой выдаче метрик.
+        """
+        self._collectors.append(collector)
+
+    def merge_stages(self, stages: Dict[str, float]) -> None:
+        """Добавляет замеры, полученные из рабочего процесса."""
+        for name, seconds in stages.items():
+            self.record_stage(name, seconds)
+
+    def render(self, prefix: str = "photobot_") -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        lines = []
+
+        def label_text(labels: Labels, extra: Labels = ()) -> str:
+            items = labels + extra
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        typed = set()
+        for (name, labels), value in sorted(self._counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} counter")
+                typed.add(name)
+            lines.append(f"{prefix}{name}{label_text(labels)} {value}")
+
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{label_text(labels, (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{prefix}{name}_sum{label_text(labels)} {histogram.sum}")
+            lines.append(f"{prefix}{name}_count{label_text(labels)} {histogram.count}")
+
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}{name} gauge")
+                    typed.add(name)
+                lines.append(f"{prefix}{name}{label_text(tuple(sorted(labels.items())))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def run_captured(fn: Callable, *args):
+    """
+    Выполняет функцию в рабочем процессе, собирая замеры этапов.
+    :return: Пара (результат, {этап: секунды}).
+    """
+    metrics.enabled = True
+    stages: Dict[str, float] = {}
+    token = _captured.set(stages)
+    try:
+        return fn(*args), stages
+    finally:
+        _captured.reset(token)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Middleware aiogram: замеряет каждый обработчик и пишет структурированную строку лога на запрос.
+    """
+    async def __call__(self, handler, event, data):
+        if not metrics.enabled:
+            return await handler(event, data)
+
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        user = data.get("event_from_user")
+        request = {"handler": name, "user_id": getattr(user, "id", None), "stages": {}, "icons": None, "error": None}
+        token = _request.set(request)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            request["error"] = repr(e)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            _request.reset(token)
+            status = "error" if request["error"] else "ok"
+            metrics.observe("handler_seconds", duration, handler=name)
+            metrics.inc("requests_total", handler=name, status=status)
+            request["duration_s"] = round(duration, 4)
+            request["stages"] = {stage: round(seconds, 4) for stage, seconds in request["stages"].items()}
+            request["status"] = status
+            logger.info(json.dumps(request, ensure_ascii=False))
+
+
+async def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    Запускает HTTP-эндпоинт /metrics в процессе бота и включает сбор метрик.
+    :return: AppRunner (для остановки через runner.cleanup()).
+    """
+    from aiohttp import web
+
+    async def handle(_request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    metrics.enabled = True
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,69 @@
+import time
+from threading import Lock
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    from yolo_processor import YOLOProcessor
+
+
+DEFAULT_MODEL = "yolo_custom.pt"
+
+
+class ModelRegistry:
+    """
+    Реестр моделей на весь процесс: каждая модель загружается один раз и
+    переиспользуется всеми обработчиками.
+    """
+    def __init__(self):
+        self._processors: Dict[str, "YOLOProcessor"] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = Lock()
+
+    def load(self, model_filename: str = DEFAULT_MODEL, warmup: bool = True) -> "YOLOProcessor":
+        """
+        Загружает модель (если она ещё не загружена) и прогревает её.
+        :param model_filename: Имя файла модели YOLO.
+        :param warmup: Выполнить ли пробный прогон после загрузки.
+        :return: Общий экземпляр YOLOProcessor.
+        """
+        with self._lock:
+            processor = self._processors.get(model_filename)
+            if processor is not None:
+                return processor
+
+            started = time.perf_counter()
+            from yolo_processor import YOLOProcessor
+            processor = YOLOProcessor(model_filename)
+            stats = {"load_time_s": time.perf_counter() - started, "warmup_s": 0.0}
+
+            if warmup:
+                started = time.perf_counter()
+                processor.warmup()
+                stats["warmup_s"] = time.perf_counter() - started
+
+            self._processors[model_filename] = processor
+            self._stats[model_filename] = stats
+            return processor
+
+    def get(self, model_filename: str = DEFAULT_MODEL) -> "YOLOProcessor":
+        """
+        Возвращает общий экземпляр модели, загружая его при первом обращении.
+        """
+        processor = self._processors.get(model_filename)
+        if processor is None:
+            processor = self.load(model_filename)
+        return processor
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Возвращает время загрузки и прогрева для каждой модели (в секундах).
+        """
+        return {name: dict(values) for name, values in self._stats.items()}
+
+
+registry = ModelRegistry()
+
+
+def get_processor(model_filename: str = DEFAULT_MODEL) -> "YOLOProcessor":
+    """Возвращает общий YOLOProcessor из реестра."""
+    return registry.get(model_filename)
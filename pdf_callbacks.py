@@ -1,14 +1,25 @@
+import os
+
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from yolo_processor import YOLOProcessor
+from album import export_album_pdf
+from job_scheduler import job_scheduler
+from jobs import JobCancelled, ProgressMessage, jobs, pdf_in_parts, photos_key
+from metrics import metrics
+from pdf_engine import PAGE_SIZES
+from result_cache import get_detection
+from worker_pool import PoolBusyError, queue_notifier
 from aiogram.types.input_file import BufferedInputFile
-from PIL import Image
-from ImageController import ImageController
-from OutputController import OutputController
-from io import BytesIO
+
+# Формат страниц и разрешение значков в PDF: A3/A5/Letter для печати, меньше DPI — легче файл
+PDF_PAGE_SIZE: str = os.getenv("PDF_PAGE_SIZE", "A4")
+PDF_DPI: int = int(os.getenv("PDF_DPI", "150"))
+
+if PDF_PAGE_SIZE not in PAGE_SIZES:
+    raise ValueError(f"Неизвестный формат страницы PDF_PAGE_SIZE={PDF_PAGE_SIZE}, доступны: {', '.join(PAGE_SIZES)}")
 
 
 class PdfExport(StatesGroup):
@@ -56,23 +67,52 @@ async def send_final_message(message: types.Message, state: FSMContext):
     orientation = data.get('orientation')
     grid = data.get('grid')
     rows, cols = map(int, grid.split('x'))
+    job = jobs.start(message.chat.id, ("pdf", photos_key(data), grid, orientation))
+    if job is None:
+        await message.answer("Этот запрос уже выполняется, результат придёт автоматически.")
+        return
     await message.answer(f"Ваши параметры:\n\nОриентация: {orientation}\nСетка: {grid}")
-    
+
     try:
-        photo_url = str(data.get("photo"))
-        yolo_processor = YOLOProcessor()
-        coordinates = [tuple(sublist) for sublist in yolo_processor.get_objects(photo_url)]
-        
-        controller = ImageController(photo_url, coordinates)
-        bytes_images = controller.export_bytes_images(False, False)
-        pil_images = [Image.open(img_bytes) for img_bytes in bytes_images]
-        
-        output_controller = OutputController(pil_images)
-        pdf_bytes = output_controller.export_pdf_bytes(rows=rows, cols=cols)
-        
-        await message.answer_document(BufferedInputFile(pdf_bytes.getvalue(), filename="icons.pdf"))
+        notify = queue_notifier(message)
+        async with job_scheduler.slot(message.chat.id, "pdf", job, notify):
+            if data.get("album"):
+                pdf_bytes = await job.shared(
+                    job.key,
+                    lambda: export_album_pdf(data["album"], rows, cols, orientation, notify, PDF_PAGE_SIZE, PDF_DPI)
+                )
+                job.check()
+                await message.answer_document(BufferedInputFile(pdf_bytes, filename="icons.pdf"))
+                return
+
+            detection = await get_detection(data["photo_id"], data["file_id"], notify, data.get("tiled", False))
+            job.check()
+            await message.answer_photo(
+                BufferedInputFile(detection.annotated, filename="processed_image.png"),
+                caption=f"Найдено значков: {len(detection.boxes)}. Собираю PDF..."
+            )
+            if not len(detection.boxes):
+                await message.answer("Значки не найдены, PDF не собран.")
+                return
+
+            # Большие сетки отправляются частями по мере готовности страниц
+            progress = ProgressMessage(message, "Собираю PDF", len(detection.boxes))
+            await progress.update(0, force=True)
+            parts = pdf_in_parts(job, detection, rows, cols, orientation, notify, page_size=PDF_PAGE_SIZE, dpi=PDF_DPI)
+            async for index, count, done, pdf_bytes in parts:
+                filename = "icons.pdf" if count == 1 else f"icons_{index}_of_{count}.pdf"
+                await message.answer_document(BufferedInputFile(pdf_bytes, filename=filename))
+                await progress.update(done)
+            await progress.finish("Готово!")
+    except JobCancelled:
+        await message.answer("Обработка прервана: пришло новое фото или новый запрос.")
+    except PoolBusyError as e:
+        await message.answer(f"{e}. Попробуйте позже.")
     except Exception as e:
         await message.answer(f"Произошла ошибка: {e}")
+        metrics.request_error(e)
+    finally:
+        jobs.finish(job)
 
 
 async def handle_grid(callback: types.CallbackQuery, state: FSMContext):
@@ -0,0 +1,200 @@
+import zlib
+from io import BytesIO
+from typing import BinaryIO, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+
+# Размеры страниц в мм (портретная ориентация)
+PAGE_SIZES: Dict[str, Tuple[float, float]] = {
+    "A3": (297.0, 420.0),
+    "A4": (210.0, 297.0),
+    "A5": (148.0, 210.0),
+    "Letter": (215.9, 279.4),
+}
+
+MM_TO_PT = 72 / 25.4
+
+_COLOR_SPACES = {"RGB": b"/DeviceRGB", "L": b"/DeviceGray"}
+
+
+class PdfWriter:
+    """
+    Потоковый писатель PDF: каждая страница со своими изображениями записывается в поток сразу,
+    поэтому память не растёт с числом страниц.
+    """
+    def __init__(self, stream: BinaryIO, page_size: str = "A4", orientation: str = "portrait",
+                 dpi: int = 150, image_format: str = "flate", jpeg_quality: int = 85):
+        """
+        :param stream: Поток для записи (файл, BytesIO, SpooledTemporaryFile).
+        :param page_size: Формат страницы из PAGE_SIZES.
+        :param orientation: "portrait" или "landscape".
+        :param dpi: Разрешение, до которого уменьшаются изображения.
+        :param image_format: "flate" — сжатые без потерь пиксели, "jpeg" — JPEG для непрозрачных изображений.
+        :param jpeg_quality: Качество JPEG.
+        """
+        width, height = PAGE_SIZES[page_size]
+        if orientation == "landscape":
+            width, height = height, width
+        self.page_width, self.page_height = width, height
+        self.stream = stream
+        self.dpi = dpi
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3  # 1 — дерево страниц, 2 — каталог; пишутся в конце
+        self._position = 0
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes) -> None:
+        self.stream.write(data)
+        self._position += len(data)
+
+    def _new_id(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id: int, body: bytes, stream: Optional[bytes] = None) -> None:
+        self._offsets[object_id] = self._position
+        self._write(b"%d 0 obj\n" % object_id)
+        if stream is None:
+            self._write(body + b"\nendobj\n")
+        else:
+            self._write(body[:-2] + b"/Length %d>>\nstream\n" % len(stream))
+            self._write(stream)
+            self._write(b"\nendstream\nendobj\n")
+
+    def _prepare(self, image: Image.Image, width_mm: float, height_mm: float) -> Image.Image:
+        """Уменьшает изображение до целевого DPI (увеличение не нужно — его сделает просмотрщик)."""
+        target = (max(1, round(width_mm / 25.4 * self.dpi)), max(1, round(height_mm / 25.4 * self.dpi)))
+        if image.width > target[0] or image.height > target[1]:
+            image = image.resize(target, Image.LANCZOS)
+        return image
+
+    def _write_image(self, image: Image.Image, width_mm: float, height_mm: float) -> int:
+        """Записывает изображение как XObject и возвращает его номер."""
+        image = self._prepare(image, width_mm, height_mm)
+
+        alpha = None
+        if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            alpha = image.getchannel("A")
+            if alpha.getextrema()[0] == 255:
+                alpha = None
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        if alpha is None and self.image_format == "jpeg":
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=self.jpeg_quality)
+            return self._write_jpeg(buffer.getvalue(), image.size, image.mode)
+
+        smask_ref = b""
+        if alpha is not None:
+            smask_id = self._new_id()
+            self._write_object(
+                smask_id,
+                b"<</Type/XObject/Subtype/Image/Width %d/Height %d/ColorSpace/DeviceGray"
+                b"/BitsPerComponent 8/Filter/FlateDecode>>" % image.size,
+                zlib.compress(alpha.tobytes(), 6),
+            )
+            smask_ref = b"/SMask %d 0 R" % smask_id
+
+        image_id = self._new_id()
+        self._write_object(
+            image_id,
+            b"<</Type/XObject/Subtype/Image/Width %d/Height %d/ColorSpace%s/BitsPerComponent 8"
+            b"/Filter/FlateDecode%s>>" % (image.width, image.height, _COLOR_SPACES[image.mode], smask_ref),
+            zlib.compress(image.tobytes(), 6),
+        )
+        return image_id
+
+    def _write_jpeg(self, data: bytes, size: Tuple[int, int], mode: str) -> int:
+        image_id = self._new_id()
+        self._write_object(
+            image_id,
+            b"<</Type/XObject/Subtype/Image/Width %d/Height %d/ColorSpace%s/BitsPerComponent 8"
+            b"/Filter/DCTDecode>>" % (size[0], size[1], _COLOR_SPACES[mode]),
+            data,
+        )
+        return image_id
+
+    def add_page(self, placements: Sequence[Tuple[Image.Image, float, float, float, float]]) -> None:
+        """
+        Записывает страницу с изображениями.
+        :param placements: Список (изображение, x, y, ширина, высота) в мм от левого верхнего угла.
+        """
+        resources = []
+        content = []
+        for i, (image, x, y, width, height) in enumerate(placements):
+            image_id = self._write_image(image, width, height)
+            resources.append(b"/Im%d %d 0 R" % (i, image_id))
+            content.append(b"q %.3f 0 0 %.3f %.3f %.3f cm /Im%d Do Q" % (
+                width * MM_TO_PT, height * MM_TO_PT,
+                x * MM_TO_PT, (self.page_height - y - height) * MM_TO_PT, i,
+            ))
+
+        content_id = self._new_id()
+        self._write_object(content_id, b"<</Filter/FlateDecode>>", zlib.compress(b"\n".join(content)))
+
+        page_id = self._new_id()
+        self._write_object(page_id, b"<</Type/Page/Parent 1 0 R/MediaBox[0 0 %.3f %.3f]"
+                                    b"/Resources<</XObject<<%s>>>>/Contents %d 0 R>>" % (
+            self.page_width * MM_TO_PT, self.page_height * MM_TO_PT, b"".join(resources), content_id,
+        ))
+        self._page_ids.append(page_id)
+
+    def close(self) -> None:
+        """Дописывает дерево страниц, каталог и таблицу ссылок."""
+        if not self._page_ids:
+            self.add_page([])
+
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids)
+        self._write_object(1, b"<</Type/Pages/Kids[%s]/Count %d>>" % (kids, len(self._page_ids)))
+        self._write_object(2, b"<</Type/Catalog/Pages 1 0 R>>")
+
+        xref_position = self._position
+        size = self._next_id
+        self._write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for object_id in range(1, size):
+            self._write(b"%010d 00000 n \n" % self._offsets[object_id])
+        self._write(b"trailer\n<</Size %d/Root 2 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_position))
+
+
+def grid_placements(sizes: Sequence[Tuple[int, int]], page_width: float, page_height: float,
+                    rows: int, cols: int, margin: float) -> List[List[Tuple[int, float, float, float, float]]]:
+    """
+    Раскладывает изображения по сетке и возвращает постранично (индекс, x, y, ширина, высота) в мм.
+    Изображения нулевой ширины или высоты (вырожденная рамка) пропускаются и не занимают ячейку.
+    """
+    cell_width = (page_width - (cols + 1) * margin) / cols
+    cell_height = (page_height - (rows + 1) * margin) / rows
+    cell_aspect = cell_width / cell_height
+    per_page = rows * cols
+
+    pages = []
+    cell = 0
+    for i, (img_width, img_height) in enumerate(sizes):
+        if img_width <= 0 or img_height <= 0:
+            continue
+        if cell % per_page == 0:
+            pages.append([])
+
+        col = cell % cols
+        row = (cell // cols) % rows
+        cell += 1
+        img_aspect = img_width / img_height
+
+        if img_aspect > cell_aspect:
+            new_width, new_height = cell_width, cell_width / img_aspect
+        else:
+            new_width, new_height = cell_height * img_aspect, cell_height
+
+        x = margin + col * (cell_width + margin) + (cell_width - new_width) / 2
+        y = margin + row * (cell_height + margin) + (cell_height - new_height) / 2
+        pages[-1].append((i, x, y, new_width, new_height))
+    return pages
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from io import BytesIO
+from threading import Lock
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+import numpy as np
+
+from downloader import decode_document, decode_image, downloader
+from batch_scheduler import scheduler
+from job_scheduler import flights
+from shared_store import open_store
+from worker_pool import detect_tiled_task, pool
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from yolo_processor import DetectionResult
+
+
+class ResultCache:
+    """
+    Ограниченный LRU/TTL-кэш результатов детекции, ключ — file_unique_id фото в Telegram.
+    Вытесняет старые записи, когда суммарный объём превышает лимит памяти.
+    """
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, ttl: float = 30 * 60, max_entries: int = 256):
+        """
+        :param max_bytes: Максимальный суммарный объём результатов в байтах.
+        :param ttl: Время жизни записи в секундах.
+        :param max_entries: Максимальное число записей.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional["DetectionResult"]:
+        """
+        Возвращает результат из кэша или None, если его нет или он устарел.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            result, size, expires_at = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: "DetectionResult") -> None:
+        """
+        Кладёт результат в кэш и вытесняет самые старые записи при переполнении.
+        """
+        size = result.nbytes
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (result, size, time.monotonic() + self.ttl)
+            self.current_bytes += size
+
+            while self._entries and (self.current_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики попаданий, промахов и текущий размер кэша.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+
+def dump_detection(result: "DetectionResult", image_bytes: bytes, tiled: bool = False) -> bytes:
+    """
+    Сериализует результат детекции для общего хранилища: исходный файл фото (а не пиксели),
+    рамки, классы и размеченный рендер. Формат .npz без pickle.
+    :param tiled: Фото прислано файлом: при загрузке его нужно повернуть по EXIF, как при детекции.
+    """
+    buffer = BytesIO()
+    np.savez(
+        buffer,
+        image=np.frombuffer(image_bytes, dtype=np.uint8),
+        boxes=result.boxes,
+        classes=result.classes,
+        confidences=result.confidences,
+        names=np.array(json.dumps(result.names, ensure_ascii=False)),
+        annotated=np.frombuffer(result.annotated, dtype=np.uint8),
+        tiled=np.array(tiled),
+    )
+    return buffer.getvalue()
+
+
+def load_detection(data: bytes) -> "DetectionResult":
+    """Восстанавливает результат детекции из dump_detection."""
+    from yolo_processor import DetectionResult
+
+    with np.load(BytesIO(data), allow_pickle=False) as arrays:
+        tiled = "tiled" in arrays.files and bool(arrays["tiled"])
+        return DetectionResult(
+            image=(decode_document if tiled else decode_image)(arrays["image"].tobytes()),
+            boxes=arrays["boxes"],
+            classes=arrays["classes"],
+            confidences=arrays["confidences"],
+            names={int(key): name for key, name in json.loads(str(arrays["names"])).items()},
+            annotated=arrays["annotated"].tobytes(),
+        )
+
+
+cache = ResultCache()
+# Второй уровень: общий для процессов бота (и серверов, если это Redis) кэш результатов
+shared_results = open_store(os.getenv("STORAGE_URL"), name="results")
+shared_stats = {"hits": 0, "misses": 0}
+
+
+def _collect_cache_metrics():
+    for name, value in cache.stats().items():
+        yield f"result_cache_{name}", {}, value
+    if shared_results is not None:
+        for name, value in shared_stats.items():
+            yield f"shared_results_{name}", {}, value
+
+
+metrics.add_collector(_collect_cache_metrics)
+
+
+async def get_detection(photo_key: str, photo: str,
+                        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+                        tiled: bool = False) -> "DetectionResult":
+    """
+    Возвращает результат детекции для фото: из кэша или после одного скачивания и пакетного прогона.
+    :param photo_key: file_unique_id фото.
+    :param photo: file_id фото в Telegram (или URL).
+    :param on_queued: Колбэк с позицией в очереди, если пул занят.
+    :param tiled: Изображение в полном разрешении (документ) — детекция по тайлам.
+    """
+    result = cache.get(photo_key)
+    if result is None:
+        # Одновременные запросы одного фото (PDF и ZIP подряд, альбом у двух пользователей)
+        # ждут одно скачивание и одну детекцию
+        result = await flights.run(("detect", photo_key, tiled),
+                                   lambda: _detect(photo_key, photo, on_queued, tiled))
+    metrics.observe_icons(len(result.boxes))
+    return result
+
+
+async def _detect(photo_key: str, photo: str, on_queued: Optional[Callable[[int], Awaitable[None]]],
+                  tiled: bool) -> "DetectionResult":
+    if shared_results is not None:
+        data = await shared_results.get(photo_key)
+        if data is not None:
+            shared_stats["hits"] += 1
+            result = await asyncio.to_thread(load_detection, data)
+            cache.put(photo_key, result)
+            return result
+        shared_stats["misses"] += 1
+
+    # Пакетный планировщик держит запросы у себя, пока пул не освободится, поэтому
+    # о прогреве моделей после перезапуска сообщаем сразу и один раз
+    if not pool.ready and on_queued is not None:
+        await on_queued(pool.pending + 1)
+        on_queued = None
+    image_bytes = await downloader.fetch(await downloader.resolve(photo))
+    with metrics.span("detect_wait"):
+        if tiled:
+            result = await pool.run(detect_tiled_task, image_bytes, on_queued=on_queued)
+        else:
+            result = await scheduler.submit(image_bytes, on_queued)
+    cache.put(photo_key, result)
+    if shared_results is not None:
+        await shared_results.set(photo_key, dump_detection(result, image_bytes, tiled), ttl=cache.ttl)
+    return result
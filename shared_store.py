@@ -0,0 +1,162 @@
+import asyncio
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+
+class SQLiteStore:
+    """
+    Хранилище ключ-значение в файле SQLite для процессов одного сервера.
+    Журнал WAL позволяет читать параллельно с записью из других процессов.
+    """
+    def __init__(self, path: str, table: str = "kv", prune_every: int = 100):
+        """
+        :param path: Путь к файлу базы.
+        :param table: Таблица (у состояний FSM и результатов детекции — разные).
+        :param prune_every: Через сколько записей удалять просроченные значения.
+        """
+        self.table = table
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+        )
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def _set(self, key: str, value: Optional[bytes], ttl: Optional[float]) -> None:
+        with self._lock:
+            if value is None:
+                self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return
+            expires_at = time.time() + ttl if ttl else None
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+                )
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Возвращает значение или None, если его нет или оно просрочено."""
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Optional[bytes], ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение.
+        :param value: Значение; None удаляет ключ.
+        :param ttl: Время жизни в секундах (None — бессрочно).
+        """
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class RedisStore:
+    """Хранилище ключ-значение в Redis (или совместимом сервере): общее для процессов и серверов."""
+    def __init__(self, url: str, prefix: str = "kv"):
+        """
+        :param url: Адрес сервера, например redis://localhost:6379/0.
+        :param prefix: Префикс ключей.
+        """
+        from redis.asyncio import Redis
+
+        self.prefix = prefix
+        self._redis = Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(f"{self.prefix}:{key}")
+
+    async def set(self, key: str, value: Optional[bytes], ttl: Optional[float] = None) -> None:
+        if value is None:
+            await self._redis.delete(f"{self.prefix}:{key}")
+            return
+        await self._redis.set(f"{self.prefix}:{key}", value, ex=int(ttl) if ttl else None)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def open_store(url: Optional[str], name: str = "kv"):
+    """
+    Открывает общее хранилище по адресу из STORAGE_URL.
+    :param url: redis://... или sqlite:///путь/к/файлу.db; пусто — хранилища нет.
+    :param name: Таблица SQLite или префикс ключей Redis.
+    :return: SQLiteStore, RedisStore или None.
+    """
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url, prefix=name)
+    if url.startswith("sqlite:///"):
+        return SQLiteStore(url[len("sqlite:///"):], table=name)
+    raise ValueError(f"Неизвестное хранилище: {url}")
+
+
+class StoreStorage(BaseStorage):
+    """Хранилище состояний FSM aiogram поверх SQLiteStore: состояние и данные в JSON."""
+    def __init__(self, store: SQLiteStore, ttl: Optional[float] = None):
+        """
+        :param ttl: Время жизни состояния диалога в секундах (None — бессрочно).
+        """
+        self.store = store
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def set_state(self, key: StorageKey, state: Optional[Any] = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self.store.set(self.key_builder.build(key, "state"), state.encode() if state else None,
+                             self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        value = await self.store.get(self.key_builder.build(key, "state"))
+        return value.decode() if value is not None else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        value = json.dumps(dict(data), ensure_ascii=False).encode() if data else None
+        await self.store.set(self.key_builder.build(key, "data"), value, self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self.store.get(self.key_builder.build(key, "data"))
+        return json.loads(value) if value is not None else {}
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def make_fsm_storage(url: Optional[str], ttl: Optional[float] = 7 * 24 * 3600) -> BaseStorage:
+    """
+    Хранилище состояний FSM: в памяти процесса (по умолчанию), в Redis или в SQLite.
+    Общее хранилище сохраняет выбранные фото и параметры PDF при перезапуске
+    и позволяет обслуживать бота несколькими процессами или серверами.
+    :param ttl: Через сколько секунд без изменений забывать состояние диалога.
+    """
+    if not url:
+        return MemoryStorage()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from aiogram.fsm.storage.redis import RedisStorage
+        ttl = int(ttl) if ttl else None
+        return RedisStorage.from_url(url, state_ttl=ttl, data_ttl=ttl)
+    return StoreStorage(open_store(url, name="fsm"), ttl)
@@ -0,0 +1,53 @@
+"""
+Согласованность быстрой оценки угла выравнивания (выпуклая оболочка) с эталонным перебором.
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip("cv2")
+pytest.importorskip("skimage")
+
+from ImageController import estimate_angle, search_angle  # noqa: E402
+
+ANGLES = [-38, -27, -16, -9, -3, 0, 4, 11, 19, 26, 37]
+SHAPES = [(120, 60), (90, 40), (70, 50), (140, 90)]
+# Эталон перебирает углы с шагом 1°, и растровая рамка добавляет ещё около половины градуса
+TOLERANCE = 1.5
+
+
+def _icon(width: int, height: int, angle: float) -> Image.Image:
+    """Прямоугольный значок с несимметричным вырезом, повёрнутый на angle градусов."""
+    icon = Image.new("RGBA", (width + 20, height + 20), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(icon)
+    draw.rectangle((10, 10, 10 + width, 10 + height), fill=(200, 60, 60, 255))
+    draw.ellipse((14, 14, 14 + height // 3, 14 + height // 3), fill=(0, 0, 0, 0))
+    return icon.rotate(angle, expand=True, resample=Image.BICUBIC, fillcolor=(0, 0, 0, 0))
+
+
+def _mask(icon: Image.Image) -> np.ndarray:
+    # Так же, как в align_symbol
+    return np.where(np.array(icon)[:, :, 3] > 1, 255, 0).astype(np.uint8)
+
+
+def _difference(a: float, b: float) -> float:
+    """Разница углов с учётом того, что рамка не меняется при повороте на 90°."""
+    return abs((a - b + 45) % 90 - 45)
+
+
+@pytest.mark.parametrize("width,height", SHAPES)
+@pytest.mark.parametrize("angle", ANGLES)
+@pytest.mark.parametrize("refine", [False, True])
+def test_fast_angle_matches_search(width, height, angle, refine):
+    icon = _icon(width, height, angle)
+    fast = estimate_angle(_mask(icon), refine=refine)
+    reference = search_angle(icon)
+    assert _difference(fast, reference) <= TOLERANCE
+
+
+@pytest.mark.parametrize("width,height", SHAPES)
+@pytest.mark.parametrize("angle", ANGLES)
+@pytest.mark.parametrize("refine", [False, True])
+def test_fast_angle_undoes_rotation(width, height, angle, refine):
+    icon = _icon(width, height, angle)
+    assert _difference(estimate_angle(_mask(icon), refine=refine), -angle) <= 1.0
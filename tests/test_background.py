@@ -0,0 +1,71 @@
+"""
+Пакетный расчёт масок фона для моделей с динамическим и фиксированным размером пакета (без rembg).
+"""
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from background import BackgroundRemover
+
+
+class _Input:
+    def __init__(self, batch_dim):
+        self.shape = [batch_dim, 3, 320, 320]
+
+
+class _InnerSession:
+    def __init__(self, batch_dim):
+        self.batch_dim = batch_dim
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def get_inputs(self):
+        return [_Input(self.batch_dim)]
+
+    def run(self, outputs, feed):
+        batch = feed["input"]
+        if isinstance(self.batch_dim, int):
+            assert len(batch) == self.batch_dim
+        with self._lock:
+            self.batches.append(len(batch))
+        # В маске изображения с номером i светится только i-й пиксель: так виден порядок масок
+        prediction = np.zeros((len(batch), 1, 16 * 16), dtype=np.float32)
+        prediction[np.arange(len(batch)), 0, batch[:, 0, 0, 0].astype(int)] = 1
+        return [prediction.reshape(len(batch), 1, 16, 16)]
+
+
+class _Session:
+    def __init__(self, batch_dim):
+        self.inner_session = _InnerSession(batch_dim)
+
+    def normalize(self, image, mean, std, size):
+        return {"input": np.full((1, 3, 1, 1), image.getpixel((0, 0))[0], dtype=np.float32)}
+
+
+def _remover(batch_dim, threads: int) -> BackgroundRemover:
+    remover = BackgroundRemover("u2net", batch_size=4, threads=threads)
+    remover._session = _Session(batch_dim)
+    return remover
+
+
+def _images(count: int):
+    # Номер изображения записан в цвете; размер совпадает с выходом сети, поэтому маски не масштабируются
+    return [Image.new("RGB", (16, 16), (i, 0, 0)) for i in range(count)]
+
+
+@pytest.mark.parametrize("batch_dim, threads, batches", [
+    ("batch", 1, [4, 4, 2]),
+    (None, 2, [4, 4, 2]),
+    (1, 1, [1] * 10),
+    (1, 3, [1] * 10),
+    (4, 2, [4, 4, 4]),
+])
+def test_masks_keep_order_and_sizes(batch_dim, threads, batches):
+    remover = _remover(batch_dim, threads)
+    images = _images(10)
+    masks = remover.masks(images)
+    assert sorted(remover.session.inner_session.batches) == sorted(batches)
+    assert [int(np.argmax(np.asarray(mask))) for mask in masks] == list(range(10))
+    assert remover.masks([]) == []
@@ -0,0 +1,92 @@
+"""
+Повреждённое изображение в пакете детекции: ошибка достаётся только его запросу.
+"""
+import asyncio
+from io import BytesIO
+
+from PIL import Image, UnidentifiedImageError
+
+import model_registry
+from batch_scheduler import BatchScheduler
+from worker_pool import detect_batch_task
+
+
+def _jpeg(color) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (32, 24), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class _Processor:
+    def __init__(self):
+        self.batches = []
+
+    def detect_batch(self, images):
+        self.batches.append(len(images))
+        return [("result", image.getpixel((0, 0))[0] > 128) for image in images]
+
+
+def test_detect_batch_task_skips_corrupt_image(monkeypatch):
+    processor = _Processor()
+    monkeypatch.setattr(model_registry, "get_processor", lambda model_filename: processor)
+    # Обрезанный JPEG и байты, которые вовсе не изображение
+    broken = _jpeg("white")[:40]
+    results = detect_batch_task([_jpeg("white"), broken, b"not an image", _jpeg("black")])
+
+    assert processor.batches == [2]
+    assert results[0] == ("result", True) and results[3] == ("result", False)
+    assert isinstance(results[1], OSError)
+    assert isinstance(results[2], UnidentifiedImageError)
+
+
+def test_detect_batch_task_with_only_corrupt_images(monkeypatch):
+    processor = _Processor()
+    monkeypatch.setattr(model_registry, "get_processor", lambda model_filename: processor)
+    results = detect_batch_task([b"broken"])
+    assert processor.batches == [] and isinstance(results[0], UnidentifiedImageError)
+
+
+def test_scheduler_delivers_per_image_errors():
+    async def runner(images, on_queued):
+        return [ValueError(image) if image == "bad" else f"ok:{image}" for image in images]
+
+    async def scenario():
+        scheduler = BatchScheduler(runner, max_batch=8, max_wait_ms=50)
+        results = await asyncio.gather(
+            *(scheduler.submit(image) for image in ["a", "bad", "b"]), return_exceptions=True
+        )
+        assert results[0] == "ok:a" and results[2] == "ok:b"
+        assert isinstance(results[1], ValueError)
+        # Все три запроса ушли одним пакетом
+        assert scheduler.stats()["batch_size"]["count"] == 1
+        # Планировщик продолжает работать после ошибки
+        assert await scheduler.submit("c") == "ok:c"
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_failed_batch_fails_every_request():
+    async def runner(images, on_queued):
+        raise RuntimeError("pool died")
+
+    async def scenario():
+        scheduler = BatchScheduler(runner, max_batch=8, max_wait_ms=50)
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_failing_queue_callback_does_not_break_the_batch():
+    async def runner(images, on_queued):
+        await on_queued(2)
+        return list(images)
+
+    async def broken(position):
+        raise RuntimeError("message deleted")
+
+    async def scenario():
+        scheduler = BatchScheduler(runner, max_batch=8, max_wait_ms=50)
+        assert await asyncio.gather(scheduler.submit("a", broken), scheduler.submit("b")) == ["a", "b"]
+
+    asyncio.run(scenario())
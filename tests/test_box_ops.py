@@ -0,0 +1,99 @@
+"""
+Подавление немаксимумов, сетка тайлов и перенос рамок из тайлов в координаты листа.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from PIL import Image  # noqa: E402
+
+from box_ops import nms, tile_grid  # noqa: E402
+from detection_backends import Detections  # noqa: E402
+from yolo_processor import YOLOProcessor  # noqa: E402
+
+
+def _boxes(*boxes) -> np.ndarray:
+    return np.array(boxes, dtype=np.float32)
+
+
+def test_nms_iou():
+    boxes = _boxes([0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30])
+    keep = nms(boxes, np.array([0.9, 0.8, 0.7]), threshold=0.5)
+    assert keep.tolist() == [0, 2]
+    # Выигрывает рамка с большей оценкой, а не первая по порядку
+    assert nms(boxes, np.array([0.8, 0.9, 0.7]), threshold=0.5).tolist() == [1, 2]
+
+
+def test_nms_ios_suppresses_cut_box_inside_whole_one():
+    # Обрезанная на границе тайла половина значка и сам значок целиком
+    boxes = _boxes([0, 0, 40, 40], [20, 0, 40, 40])
+    scores = np.array([0.9, 0.95])
+    # По IoU перекрытие 0.5 и половина не подавляется, по доле меньшей рамки — полное
+    assert sorted(nms(boxes, scores, threshold=0.5, metric="iou").tolist()) == [0, 1]
+    assert nms(boxes, scores, threshold=0.5, metric="ios").tolist() == [1]
+    assert nms(boxes, np.array([0.95, 0.9]), threshold=0.5, metric="ios").tolist() == [0]
+
+
+def test_nms_classes_and_empty():
+    boxes = _boxes([0, 0, 10, 10], [0, 0, 10, 10])
+    assert nms(boxes, np.array([0.9, 0.8]), classes=np.array([0, 1]), metric="ios").tolist() == [0, 1]
+    assert nms(boxes, np.array([0.9, 0.8]), classes=np.array([2, 2]), metric="ios").tolist() == [0]
+    assert nms(np.zeros((0, 4), dtype=np.float32), np.zeros(0)).tolist() == []
+
+
+@pytest.mark.parametrize("width, height, tile, overlap", [
+    (1000, 700, 400, 0.2), (960, 960, 960, 0.2), (1201, 399, 400, 0.25), (300, 200, 400, 0.2),
+])
+def test_tile_grid_covers_image_with_overlap(width, height, tile, overlap):
+    tiles = tile_grid(width, height, tile, overlap)
+    covered = np.zeros((height, width), dtype=bool)
+    for left, top, right, bottom in tiles:
+        assert 0 <= left < right <= width and 0 <= top < bottom <= height
+        assert right - left == min(tile, width) and bottom - top == min(tile, height)
+        covered[top:bottom, left:right] = True
+    assert covered.all()
+
+    # Соседние тайлы перекрываются не меньше чем на долю overlap (последний прижат к краю)
+    lefts = sorted({box[0] for box in tiles})
+    assert all(b - a <= int(tile * (1 - overlap)) for a, b in zip(lefts, lefts[1:]))
+    assert max(box[2] for box in tiles) == width
+
+
+class _SheetBackend:
+    """Отдаёт для каждого тайла видимые в нём части известных значков листа в координатах тайла."""
+    def __init__(self, icons: np.ndarray, tiles):
+        self.icons = icons
+        self.tiles = tiles
+
+    def predict(self, images):
+        assert len(images) == len(self.tiles)
+        detections = []
+        for image, (left, top, right, bottom) in zip(images, self.tiles):
+            assert image.size == (right - left, bottom - top)
+            clipped = np.stack([
+                np.maximum(self.icons[:, 0], left), np.maximum(self.icons[:, 1], top),
+                np.minimum(self.icons[:, 2], right), np.minimum(self.icons[:, 3], bottom),
+            ], axis=1)
+            visible = (clipped[:, 2] > clipped[:, 0]) & (clipped[:, 3] > clipped[:, 1])
+            boxes = clipped[visible] - np.array([left, top, left, top], dtype=np.float32)
+            detections.append(Detections(
+                boxes.astype(np.float32), np.zeros(len(boxes), dtype=np.int64),
+                np.full(len(boxes), 0.9, dtype=np.float32), {0: "icon"},
+            ))
+        return detections
+
+
+def test_tiled_boxes_map_back_to_sheet():
+    width, height, tile, overlap = 1000, 700, 400, 0.25
+    # Значки внутри тайлов и на их границах; каждый целиком помещается хотя бы в один тайл
+    icons = _boxes(
+        [10, 10, 60, 60], [290, 280, 350, 330], [580, 20, 640, 70],
+        [900, 600, 990, 690], [440, 300, 520, 380], [280, 600, 330, 650],
+    )
+    processor = YOLOProcessor(backend=_SheetBackend(icons, tile_grid(width, height, tile, overlap)))
+    result = processor.detect_tiled(Image.new("RGB", (width, height), "white"), tile=tile, overlap=overlap)
+
+    found = sorted(map(tuple, result.boxes.tolist()))
+    assert found == sorted(map(tuple, icons.tolist()))
+    assert result.names == {0: "icon"}
@@ -0,0 +1,88 @@
+"""
+Совпадение FilterChain (свёрнутые таблицы и одиночные фильтры) с последовательными фильтрами PIL
+и сохранение альфа-канала.
+"""
+import itertools
+
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance, ImageOps
+
+from filters import FILTERS, FilterChain, _normalize
+
+CONTRAST = 2.0
+THRESHOLD = 128
+
+
+def _reference(img: Image.Image, names) -> Image.Image:
+    """Фильтры по одному встроенными операциями PIL; альфа-канал переносится без изменений."""
+    for name in names:
+        alpha = img.getchannel("A") if img.mode in ("RGBA", "LA") else None
+        if name == "grayscale":
+            if img.mode in ("RGB", "RGBA"):
+                img = img.convert("LA" if alpha else "L")
+        elif name == "invert":
+            img = ImageOps.invert(img.convert("RGB" if img.mode in ("RGB", "RGBA") else "L"))
+            if alpha:
+                img.putalpha(alpha)
+        elif name == "contrast":
+            img = ImageEnhance.Contrast(img).enhance(CONTRAST)
+        elif name == "threshold":
+            img = img.convert("L").point(lambda value: 255 if value > THRESHOLD else 0)
+            if alpha:
+                img = img.convert("LA")
+                img.putalpha(alpha)
+    return img
+
+
+def _images(mode: str, count: int = 4):
+    rng = np.random.default_rng(len(mode))
+    images = []
+    for _ in range(count):
+        height, width = rng.integers(5, 40, 2)
+        pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+        images.append(Image.fromarray(pixels, "RGBA").convert(mode))
+    return images
+
+
+CHAINS = [names for length in (1, 2, 3) for names in itertools.product(FILTERS, repeat=length)]
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "L", "LA"])
+@pytest.mark.parametrize("names", CHAINS, ids="→".join)
+def test_chain_matches_pil(mode, names):
+    images = _images(mode)
+    chain = FilterChain(*names, contrast=CONTRAST, threshold=THRESHOLD)
+    outputs = [chain.apply(images)]
+    if len(names) == 1:
+        # Одиночный фильтр идёт отдельным путём: сверяем с ним и свёрнутую таблицу
+        outputs.append(chain._run([_normalize(img) for img in images]))
+
+    for source, *results in zip(images, *outputs):
+        expected = _reference(source, names)
+        for result in results:
+            assert result.size == source.size
+            assert np.array_equal(np.asarray(result.convert(expected.mode)), np.asarray(expected))
+
+
+@pytest.mark.parametrize("names", CHAINS, ids="→".join)
+def test_alpha_is_preserved(names):
+    images = _images("RGBA")
+    for source, result in zip(images, FilterChain(*names).apply(images)):
+        assert result.mode in ("RGBA", "LA")
+        assert np.array_equal(np.asarray(result.getchannel("A")), np.asarray(source.getchannel("A")))
+
+
+@pytest.mark.parametrize("names", [("threshold",), ("contrast", "threshold"), ("invert", "threshold")])
+def test_threshold_without_alpha_is_binary(names):
+    for result in FilterChain(*names).apply(_images("RGB")):
+        assert result.mode == "1"
+
+
+def test_mixed_modes_and_unknown_filters():
+    images = _images("RGB", 2) + _images("LA", 2) + [Image.new("P", (4, 4))]
+    chain = FilterChain("contrast", "sepia", "invert")
+    assert chain.filters == ("contrast", "invert")
+    results = chain.apply(images)
+    assert [result.mode for result in results] == ["RGB", "RGB", "LA", "LA", "RGB"]
+    assert FilterChain("sepia").apply(images) == images
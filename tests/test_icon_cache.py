@@ -0,0 +1,91 @@
+"""
+Кэш значков: счётчики, вытеснение с диска вместе с отпечатками и настройки по умолчанию.
+"""
+import os
+
+import numpy as np
+from PIL import Image
+
+import icon_cache
+from icon_cache import IconCache
+
+
+def _pixels(seed: int, size: int = 32) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (size, size, 3), dtype=np.uint8)
+
+
+def _files(directory) -> list:
+    return sorted(
+        name for folder in os.scandir(directory) if folder.is_dir() for name in os.listdir(folder.path)
+    )
+
+
+def _size(directory) -> int:
+    return sum(
+        entry.stat().st_size
+        for folder in os.scandir(directory) if folder.is_dir() for entry in os.scandir(folder.path)
+    )
+
+
+def test_exact_hit_does_not_compute_perceptual_hash(tmp_path, monkeypatch):
+    cache = IconCache(str(tmp_path), phash=True)
+    pixels = _pixels(1)
+    cache.put(pixels, "opts", Image.fromarray(pixels))
+
+    calls = []
+    monkeypatch.setattr(icon_cache, "perceptual_hash", lambda value: calls.append(value) or "0" * 36)
+    assert cache.get(pixels, "opts") is not None
+    assert calls == []
+    assert cache.get(_pixels(2), "opts") is None
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prune_counts_and_removes_sidecars(tmp_path):
+    pixels = [_pixels(seed) for seed in range(12)]
+    entry = IconCache(str(tmp_path / "probe"), phash=True)
+    entry.put(pixels[0], "opts", Image.fromarray(pixels[0]))
+    entry_size = _size(tmp_path / "probe")
+
+    # Лимит вмещает пять записей вместе с отпечатками, но не шесть
+    limit = entry_size * 5 + entry_size // 2
+    cache = IconCache(str(tmp_path / "cache"), max_disk_bytes=limit, phash=True)
+    for value in pixels:
+        cache.put(value, "opts", Image.fromarray(value))
+
+    files = _files(tmp_path / "cache")
+    stems = {name.rsplit(".", 1)[0] for name in files}
+    # Файлы с пикселями и отпечатки удаляются парами
+    assert len(files) == 2 * len(stems)
+    assert _size(tmp_path / "cache") == cache.disk_bytes <= limit
+    # После перезапуска объём восстанавливается с учётом отпечатков
+    assert IconCache(str(tmp_path / "cache"), max_disk_bytes=limit).disk_bytes == cache.disk_bytes
+
+
+def test_prune_removes_orphan_sidecars_first(tmp_path):
+    cache = IconCache(str(tmp_path), max_disk_bytes=10 ** 9, phash=True)
+    pixels = _pixels(3)
+    cache.put(pixels, "opts", Image.fromarray(pixels))
+    orphan = tmp_path / IconCache._options_dir("opts") / "orphan.phash"
+    # Большой, чтобы его удаления хватило для возврата под лимит
+    orphan.write_text("0" * 10000)
+
+    cache.max_disk_bytes = _size(tmp_path) - 1
+    cache._prune()
+    assert not orphan.exists()
+    assert len(_files(tmp_path)) == 2
+
+
+def test_disk_cache_is_off_without_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("ICON_CACHE_DIR", raising=False)
+    monkeypatch.delenv("ICON_CACHE_MB", raising=False)
+    monkeypatch.setattr(icon_cache, "_icon_cache", None)
+    cache = icon_cache.get_icon_cache()
+    assert cache is not None and cache.directory is None
+    assert os.listdir(tmp_path) == []
+
+    monkeypatch.setattr(icon_cache, "_icon_cache", None)
+    monkeypatch.setenv("ICON_CACHE_DIR", str(tmp_path / "icons"))
+    assert icon_cache.get_icon_cache().directory == str(tmp_path / "icons")
+    assert os.path.isdir(tmp_path / "icons")
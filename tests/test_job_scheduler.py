@@ -0,0 +1,255 @@
+"""
+Объединение одинаковых вычислений и выдача слотов заданиям: приоритеты, очередь пользователей
+по кругу, ограничение на пользователя и отмена ожидания.
+"""
+import asyncio
+
+import pytest
+
+from job_scheduler import JobScheduler, SingleFlight, parse_priorities
+from jobs import Job, JobCancelled
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_single_flight_shares_one_computation():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return b"pdf"
+
+        waiters = [asyncio.create_task(flights.run(("pdf", 1), compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*waiters) == [b"pdf"] * 3
+        assert (calls, flights.started, flights.shared) == (1, 1, 2)
+        # После завершения тот же ключ вычисляется заново
+        assert await flights.run(("pdf", 1), compute) == b"pdf"
+        assert calls == 2
+
+    _run(scenario())
+
+
+def test_single_flight_shares_errors():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flights.run("key", fail), flights.run("key", fail), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+        assert flights.started == 1
+
+    _run(scenario())
+
+
+def test_single_flight_survives_one_cancelled_waiter():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        cancelled = False
+
+        async def compute():
+            nonlocal cancelled
+            try:
+                await release.wait()
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            return 42
+
+        first = asyncio.create_task(flights.run("key", compute))
+        second = asyncio.create_task(flights.run("key", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == 42
+        assert first.cancelled() and not cancelled
+
+    _run(scenario())
+
+
+def test_single_flight_is_cancelled_when_nobody_waits():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def compute():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flights.run("key", compute)) for _ in range(2)]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # Новый запрос запускает вычисление заново, а не получает отмену
+        started.clear()
+        task = asyncio.create_task(flights.run("key", compute))
+        await asyncio.wait_for(started.wait(), 1)
+        assert flights.started == 2
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    _run(scenario())
+
+
+def test_job_shared_cancels_only_its_own_wait():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return b"zip"
+
+        first, second = Job(1, ("zip", ("photo",))), Job(2, ("zip", ("photo",)))
+        waiting = [asyncio.create_task(job.shared(("zip", "photo", "test"), compute)) for job in (first, second)]
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        assert isinstance(results[0], JobCancelled) and results[1] == b"zip"
+
+    _run(scenario())
+
+
+class _Recorder:
+    """Задания, которые держат слот, пока их не отпустят, и записывают порядок запуска."""
+    def __init__(self, scheduler: JobScheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self._release = {}
+
+    def start(self, name: str, user_id: int, operation: str = "zip", job: Job = None) -> asyncio.Task:
+        release = self._release[name] = asyncio.Event()
+
+        async def run():
+            async with self.scheduler.slot(user_id, operation, job):
+                self.started.append(name)
+                await release.wait()
+        return asyncio.create_task(run())
+
+    def release(self, name: str) -> None:
+        self._release[name].set()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_users_are_served_in_turn():
+    async def scenario():
+        scheduler = JobScheduler(max_running=1, per_user=5)
+        recorder = _Recorder(scheduler)
+        tasks = [recorder.start("blocker", 0)]
+        await _settle()
+        # Пользователь 1 прислал три запроса раньше, чем пользователи 2 и 3 по одному
+        for name, user_id in [("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2), ("c1", 3)]:
+            tasks.append(recorder.start(name, user_id))
+            await _settle()
+        assert scheduler.waiting == 5
+
+        for name in ["blocker", "a1", "b1", "c1", "a2", "a3"]:
+            recorder.release(name)
+            await _settle()
+        await asyncio.gather(*tasks)
+        assert recorder.started == ["blocker", "a1", "b1", "c1", "a2", "a3"]
+        assert (scheduler.running, scheduler.waiting) == (0, 0)
+
+    _run(scenario())
+
+
+def test_higher_priority_goes_first():
+    async def scenario():
+        scheduler = JobScheduler(max_running=1, per_user=5)
+        recorder = _Recorder(scheduler)
+        tasks = [recorder.start("blocker", 0)]
+        await _settle()
+        tasks.append(recorder.start("pdf", 1, "pdf"))
+        tasks.append(recorder.start("zip", 2, "zip"))
+        tasks.append(recorder.start("marked", 3, "marked_photo"))
+        await _settle()
+
+        for name in ["blocker", "marked", "zip", "pdf"]:
+            recorder.release(name)
+            await _settle()
+        await asyncio.gather(*tasks)
+        assert recorder.started == ["blocker", "marked", "zip", "pdf"]
+
+    _run(scenario())
+
+
+def test_per_user_limit():
+    async def scenario():
+        scheduler = JobScheduler(max_running=4, per_user=2)
+        recorder = _Recorder(scheduler)
+        tasks = [recorder.start(f"a{i}", 1) for i in range(3)]
+        await _settle()
+        tasks.append(recorder.start("b0", 2))
+        await _settle()
+        # Третье задание пользователя 1 ждёт, хотя общих слотов хватает
+        assert recorder.started == ["a0", "a1", "b0"]
+        assert (scheduler.running, scheduler.waiting) == (3, 1)
+
+        recorder.release("a0")
+        await _settle()
+        assert recorder.started[-1] == "a2"
+        for name in ["a1", "a2", "b0"]:
+            recorder.release(name)
+        await asyncio.gather(*tasks)
+        assert scheduler.running == 0
+
+    _run(scenario())
+
+
+def test_cancelled_job_leaves_the_queue():
+    async def scenario():
+        scheduler = JobScheduler(max_running=1, per_user=5)
+        recorder = _Recorder(scheduler)
+        blocker = recorder.start("blocker", 0)
+        await _settle()
+        job = Job(1, ("zip",))
+        cancelled = recorder.start("cancelled", 1, job=job)
+        waiting = recorder.start("next", 2)
+        await _settle()
+        assert scheduler.waiting == 2
+
+        job.cancel()
+        with pytest.raises(JobCancelled):
+            await cancelled
+        assert scheduler.waiting == 1
+
+        recorder.release("blocker")
+        await _settle()
+        recorder.release("next")
+        await asyncio.gather(blocker, waiting)
+        # Отменённое задание не получило слот и не занимает его
+        assert recorder.started == ["blocker", "next"]
+        assert (scheduler.running, scheduler.waiting) == (0, 0)
+
+    _run(scenario())
+
+
+def test_parse_priorities():
+    assert parse_priorities("pdf=0, zip = 5,,") == {"marked_photo": 0, "zip": 5, "pdf": 0}
+    scheduler = JobScheduler(max_running=1, priorities={"zip": 1, "pdf": 3})
+    assert scheduler.priority("unknown") == 3
@@ -0,0 +1,41 @@
+"""
+Разбор файлов разметки YOLO: быстрый путь и файлы со строками другого формата.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+from ImageController import read_labels  # noqa: E402
+
+
+def _write(tmp_path, text: str) -> str:
+    path = tmp_path / "labels.txt"
+    path.write_text(text)
+    return str(path)
+
+
+def test_boxes_in_pixels(tmp_path):
+    path = _write(tmp_path, "0 0.5 0.5 0.2 0.4\n3 0.25 0.75 0.1 0.1\n")
+    boxes, classes = read_labels(path, 200, 100)
+    assert boxes.tolist() == [[80, 30, 120, 70], [40, 70, 60, 80]]
+    assert classes.tolist() == [0, 3]
+
+
+@pytest.mark.parametrize("text", [
+    # Полигон и строка из трёх чисел вместе дают столько же чисел, сколько две рамки
+    "0 0.5 0.5 0.2 0.4\n1 0.1 0.1 0.2 0.2 0.3 0.3\n2 0.5 0.5\n",
+    "1 0.1 0.1 0.2 0.2 0.3 0.3 0.4 0.4\n0 0.5 0.5 0.2 0.4\n\n",
+    "0 0.5 0.5 0.2 0.4\n1 0.1 0.1 0.2\n",
+])
+def test_lines_of_other_formats_are_skipped(tmp_path, text):
+    boxes, classes = read_labels(_write(tmp_path, text), 200, 100)
+    assert boxes.tolist() == [[80, 30, 120, 70]]
+    assert classes.tolist() == [0]
+
+
+@pytest.mark.parametrize("text", ["", "\n\n", "1 0.1 0.1 0.2 0.2 0.3 0.3\n"])
+def test_no_boxes(tmp_path, text):
+    boxes, classes = read_labels(_write(tmp_path, text), 200, 100)
+    assert boxes.shape == (0, 4) and classes.shape == (0,)
+    assert boxes.dtype == np.int64
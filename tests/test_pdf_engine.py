@@ -0,0 +1,31 @@
+"""
+Раскладка значков по сетке PDF.
+"""
+from io import BytesIO
+
+from pdf_engine import PdfWriter, grid_placements
+
+
+def test_degenerate_sizes_are_skipped():
+    pages = grid_placements([(10, 0), (10, 10), (0, 5), (5, 10)], 210, 297, rows=1, cols=2, margin=10)
+    # Вырожденные рамки не занимают ячейки: остальные значки идут подряд
+    assert [[item[0] for item in page] for page in pages] == [[1, 3]]
+    assert [round(item[1]) for item in pages[0]] == [10, 110]
+
+
+def test_only_degenerate_sizes_give_an_empty_pdf():
+    assert grid_placements([(0, 0), (3, 0)], 210, 297, rows=2, cols=2, margin=10) == []
+    stream = BytesIO()
+    writer = PdfWriter(stream)
+    writer.close()
+    assert stream.getvalue().startswith(b"%PDF-1.4") and stream.getvalue().endswith(b"%%EOF\n")
+
+
+def test_pages_follow_the_grid():
+    sizes = [(20, 10)] * 7
+    pages = grid_placements(sizes, 210, 297, rows=2, cols=2, margin=10)
+    assert [len(page) for page in pages] == [4, 3]
+    assert [item[0] for item in pages[1]] == [4, 5, 6]
+    # Широкое изображение вписывается по ширине ячейки
+    _, _, _, width, height = pages[0][0]
+    assert width == (210 - 3 * 10) / 2 and height == width / 2
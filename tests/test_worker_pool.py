@@ -0,0 +1,98 @@
+"""
+Учёт задач пула: отмена ожидания не освобождает процесс, пока задача в нём не закончится,
+а части уже допущенных заданий не отклоняются из-за переполненной очереди.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from worker_pool import PoolBusyError, WorkerPool
+
+
+def _blocking(started: threading.Event, release: threading.Event) -> str:
+    started.set()
+    release.wait(5)
+    return "done"
+
+
+def _pool(workers: int = 1) -> WorkerPool:
+    # Потоки вместо процессов: учёт задач от этого не зависит, а модель не загружается
+    pool = WorkerPool(workers=workers, max_queue=1)
+    pool._executor = ThreadPoolExecutor(workers)
+    return pool
+
+
+def test_cancelled_running_task_is_counted_until_it_finishes():
+    async def scenario():
+        pool = _pool()
+        started, release = threading.Event(), threading.Event()
+        task = asyncio.create_task(pool.run(_blocking, started, release))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Процесс всё ещё занят отменённой задачей
+        assert pool.pending == 1
+
+        release.set()
+        for _ in range(100):
+            if pool.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.pending == 0
+        pool._executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_queued_task_is_released_at_once():
+    async def scenario():
+        pool = _pool()
+        started, release = threading.Event(), threading.Event()
+        running = asyncio.create_task(pool.run(_blocking, started, release))
+        await asyncio.to_thread(started.wait, 5)
+        queued = asyncio.create_task(pool.run(_blocking, threading.Event(), threading.Event()))
+        await asyncio.sleep(0.05)
+        assert pool.pending == 2 and pool.queued == 1
+
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        # Задача ещё не начиналась, поэтому снята с очереди пула и не занимает место
+        assert pool.pending == 1
+
+        release.set()
+        assert await running == "done"
+        await asyncio.sleep(0.05)
+        assert pool.pending == 0
+        pool._executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_admitted_parts_wait_instead_of_overflowing_the_queue():
+    async def scenario():
+        pool = _pool()
+        started, release = threading.Event(), threading.Event()
+        running = asyncio.create_task(pool.run(_blocking, started, release))
+        await asyncio.to_thread(started.wait, 5)
+        # Части уже допущенного задания ждут процесса, даже если очередь пула переполнена
+        parts = [asyncio.create_task(pool.run(_blocking, threading.Event(), release, admitted=True))
+                 for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert pool.queued == 3 and pool.admitted == 3
+
+        # Новый запрос получает место в очереди: части заданий его не занимают
+        queued = asyncio.create_task(pool.run(_blocking, threading.Event(), release))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolBusyError):
+            await pool.run(_blocking, threading.Event(), release)
+
+        release.set()
+        assert await asyncio.gather(running, queued, *parts) == ["done"] * 5
+        await asyncio.sleep(0.05)
+        assert pool.pending == 0 and pool.admitted == 0
+        pool._executor.shutdown()
+
+    asyncio.run(scenario())
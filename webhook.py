@@ -0,0 +1,79 @@
+import json
+from typing import List, Optional
+
+import aiohttp
+from aiohttp import web
+
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_chat_id(update: dict) -> int:
+    """
+    Чат, к которому относится обновление (для нажатий кнопок — чат сообщения с кнопкой).
+    Обновления без чата распределяются по update_id.
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = value.get("from")
+        if user:
+            return user["id"]
+    return update.get("update_id", 0)
+
+
+class WebhookRouter:
+    """
+    Принимает обновления Telegram на общем порту и передаёт каждое процессу-обработчику по номеру чата.
+    Все обновления одного чата попадают в один процесс, поэтому альбомы, отмена заданий
+    и очереди пользователя работают так же, как в одном процессе.
+    """
+    def __init__(self, workers: List[str]):
+        """
+        :param workers: Адреса вебхуков процессов-обработчиков.
+        """
+        self.workers = workers
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        worker = self.workers[update_chat_id(update) % len(self.workers)]
+        headers = {"Content-Type": "application/json"}
+        if SECRET_HEADER in request.headers:
+            headers[SECRET_HEADER] = request.headers[SECRET_HEADER]
+        try:
+            async with self._session.post(worker, data=body, headers=headers) as response:
+                return web.Response(status=response.status, body=await response.read())
+        except aiohttp.ClientError:
+            # Процесс ещё запускается или перезапускается — Telegram повторит доставку позже
+            return web.Response(status=503)
+
+    async def _start_session(self, app: web.Application) -> None:
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+
+    async def _close_session(self, app: web.Application) -> None:
+        await self._session.close()
+
+    def application(self, path: str) -> web.Application:
+        """Приложение aiohttp с маршрутом вебхука."""
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        app.on_startup.append(self._start_session)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+
+async def start_site(app: web.Application, host: str, port: int) -> web.AppRunner:
+    """Запускает приложение aiohttp на адресе и возвращает runner для остановки."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
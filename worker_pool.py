@@ -0,0 +1,316 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple, Union
+
+from metrics import metrics, run_captured
+from model_registry import DEFAULT_MODEL
+
+# Тяжёлые модули (torch, ultralytics, rembg, cv2, skimage) импортируются только в рабочих процессах,
+# чтобы главный процесс бота стартовал быстро
+if TYPE_CHECKING:
+    from PIL import Image
+    from crop_collection import CropCollection
+    from yolo_processor import DetectionResult
+
+
+class PoolBusyError(Exception):
+    """Очередь задач переполнена, новую задачу принять нельзя."""
+    def __init__(self, position: int):
+        super().__init__(f"Бот перегружен, позиция в очереди была бы {position}")
+        self.position = position
+
+
+def _init_worker(model_filename: str, threads: int) -> None:
+    """
+    Инициализирует рабочий процесс: ограничивает число потоков бэкенда и заранее загружает модель.
+    """
+    backend = os.getenv("YOLO_BACKEND", "torch")
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(threads)
+    else:
+        os.environ.setdefault("YOLO_INTRA_THREADS", str(threads))
+
+    from model_registry import registry
+    registry.load(model_filename)
+    stats = registry.stats()[model_filename]
+    # Модули обрезки и экспорта тоже импортируем заранее, чтобы первый запрос не ждал их загрузки
+    import ImageController, OutputController  # noqa: F401
+    print(f"Воркер {os.getpid()} ({backend}): модель загружена за {stats['load_time_s']:.2f} с, "
+          f"прогрев {stats['warmup_s']:.2f} с")
+
+
+def _noop() -> None:
+    """Пустая задача, чтобы процессы пула запустились и загрузили модель заранее."""
+
+
+def detect_task(image, model_filename: str = DEFAULT_MODEL) -> "DetectionResult":
+    """Детекция объектов в рабочем процессе."""
+    from model_registry import get_processor
+    return get_processor(model_filename).detect(image)
+
+
+def detect_batch_task(images: list,
+                      model_filename: str = DEFAULT_MODEL) -> List[Union["DetectionResult", Exception]]:
+    """
+    Пакетная детекция объектов в рабочем процессе.
+    Изображения декодируются по одному до сборки пакета: вместо результата
+    повреждённого изображения возвращается его исключение, остальные обрабатываются.
+    """
+    from downloader import decode_image
+    from model_registry import get_processor
+    decoded = []
+    with metrics.span("decode"):
+        for image in images:
+            try:
+                decoded.append(decode_image(image))
+            except Exception as e:
+                decoded.append(e)
+    valid = [image for image in decoded if not isinstance(image, Exception)]
+    results = iter(get_processor(model_filename).detect_batch(valid) if valid else [])
+    return [image if isinstance(image, Exception) else next(results) for image in decoded]
+
+
+def detect_tiled_task(image, model_filename: str = DEFAULT_MODEL) -> "DetectionResult":
+    """
+    Тайловая детекция изображения в полном разрешении в рабочем процессе.
+    Так обрабатываются фото, присланные файлом, поэтому до нарезки они поворачиваются по EXIF.
+    """
+    from downloader import decode_document
+    from model_registry import get_processor
+    with metrics.span("decode"):
+        image = decode_document(image)
+    return get_processor(model_filename).detect_tiled(image)
+
+
+def crop_task(image: "Image.Image", coordinates: List[Tuple[int, int, int, int]],
+              remove_bg: bool = False, align: bool = False) -> List["Image.Image"]:
+    """Обрезка (и при необходимости удаление фона и выравнивание) в рабочем процессе."""
+    from ImageController import ImageController
+    return ImageController(image, coordinates).crop_images(remove_bg, align)
+
+
+def export_zip_task(image: "Image.Image", coordinates: List[Tuple[int, int, int, int]],
+                    classes=None, confidences=None, names=None,
+                    remove_bg: bool = False, align: bool = False, image_format: str = "png") -> bytes:
+    """Обрезка и упаковка значков в ZIP (с манифестом рамок и классов) в рабочем процессе."""
+    from ImageController import ImageController
+    from OutputController import OutputController
+    crops = ImageController(image, coordinates).crop_collection(
+        remove_bg, align, classes=classes, confidences=confidences, names=names
+    )
+    # Архив собирается в буфере, который уходит на диск сверх порога, и читается один раз
+    with OutputController(crops).export_zip_spooled(image_format=image_format) as buffer:
+        return buffer.read()
+
+
+def export_pdf_task(image: "Image.Image", coordinates: List[Tuple[int, int, int, int]],
+                    rows: int, cols: int, orientation: str = "portrait",
+                    remove_bg: bool = False, align: bool = False,
+                    page_size: str = "A4", dpi: int = 150) -> bytes:
+    """Обрезка и сборка PDF в рабочем процессе."""
+    from ImageController import ImageController
+    from OutputController import OutputController
+    crops = ImageController(image, coordinates).crop_collection(remove_bg, align)
+    return OutputController(crops).export_pdf_bytes(
+        rows=rows, cols=cols, orientation=orientation, page_size=page_size, dpi=dpi
+    ).getvalue()
+
+
+def crop_part_task(image: "Image.Image", coordinates: List[Tuple[int, int, int, int]],
+                   classes=None, confidences=None, names=None, source_id: int = 0,
+                   remove_bg: bool = False, align: bool = False,
+                   image_format: Optional[str] = None, offset: Tuple[int, int] = (0, 0)) -> "CropCollection":
+    """
+    Этап обработки фото (или его части): обрезка и, для ZIP, кодирование вырезок.
+    :param source_id: Номер фото в альбоме.
+    :param image_format: Формат для ZIP; если указан, возвращаются только закодированные байты.
+    :param offset: Положение переданной части листа на исходном фото.
+    """
+    from ImageController import ImageController
+    from OutputController import OutputController
+    crops = ImageController(image, coordinates).crop_collection(
+        remove_bg, align, classes=classes, confidences=confidences, names=names
+    )
+    if image_format is not None:
+        OutputController(crops).encode(image_format)
+    return crops.detach(source_id, keep_pixels=image_format is None, offset=offset)
+
+
+def export_parts_zip_task(parts: List["CropCollection"], image_format: str = "png") -> bytes:
+    """Сборка общего ZIP из уже закодированных вырезок нескольких фото."""
+    from OutputController import OutputController
+    from crop_collection import CropCollection
+    output = OutputController(CropCollection.concat(parts))
+    with output.export_zip_spooled(image_format=image_format) as buffer:
+        return buffer.read()
+
+
+def export_parts_pdf_task(parts: List["CropCollection"], rows: int, cols: int,
+                          orientation: str = "portrait", page_size: str = "A4", dpi: int = 150) -> bytes:
+    """Сборка общего PDF из вырезок нескольких фото."""
+    from OutputController import OutputController
+    from crop_collection import CropCollection
+    output = OutputController(CropCollection.concat(parts))
+    return output.export_pdf_bytes(
+        rows=rows, cols=cols, orientation=orientation, page_size=page_size, dpi=dpi
+    ).getvalue()
+
+
+class WorkerPool:
+    """
+    Пул процессов для тяжёлых CPU-задач (детекция, обрезка, экспорт) с ограниченной очередью.
+    Каждый процесс заранее загружает модель, обработчики только ожидают результат.
+    """
+    def __init__(self, workers: Optional[int] = None, max_queue: int = 32,
+                 model_filename: str = DEFAULT_MODEL):
+        """
+        :param workers: Число рабочих процессов (по умолчанию — число ядер).
+        :param max_queue: Сколько задач может ждать свободного процесса.
+        :param model_filename: Модель, загружаемая в каждый процесс.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.model_filename = model_filename
+        self.pending = 0
+        # Из них части заданий, уже допущенных планировщиком заданий
+        self.admitted = 0
+        self.startup_s: Optional[float] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._warmup: List[Future] = []
+        self._started_at = 0.0
+
+    def start(self) -> None:
+        """Запускает рабочие процессы, не дожидаясь загрузки моделей."""
+        if self._executor is not None:
+            return
+        self._started_at = time.perf_counter()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.model_filename, threads),
+        )
+        # Процессы создаются по требованию, поэтому сразу отправляем каждому пустую задачу
+        self._warmup = [self._executor.submit(_noop) for _ in range(self.workers)]
+
+    @property
+    def ready(self) -> bool:
+        """Все процессы запущены, модели загружены и прогреты."""
+        return self._executor is not None and all(
+            future.done() and future.exception() is None for future in self._warmup
+        )
+
+    async def wait_ready(self) -> float:
+        """
+        Ожидает, пока все процессы загрузят и прогреют модели.
+        :return: Время от запуска пула до готовности в секундах.
+        :raises BrokenProcessPool: Если процесс не смог загрузить модель.
+        """
+        self.start()
+        for future in self._warmup:
+            await asyncio.wrap_future(future)
+        if self.startup_s is None:
+            self.startup_s = time.perf_counter() - self._started_at
+        return self.startup_s
+
+    def shutdown(self) -> None:
+        """Останавливает рабочие процессы."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queued(self) -> int:
+        """Число задач, ожидающих свободного процесса."""
+        return max(0, self.pending - self.workers)
+
+    def _done(self, admitted: bool) -> None:
+        self.pending -= 1
+        if admitted:
+            self.admitted -= 1
+
+    async def run(self, fn: Callable, *args,
+                  on_queued: Optional[Callable[[int], Awaitable[None]]] = None, admitted: bool = False):
+        """
+        Выполняет функцию в пуле и ожидает результат.
+        :param fn: Функция верхнего уровня модуля (должна сериализоваться pickle).
+        :param on_queued: Корутина, вызываемая с позицией в очереди, если все процессы заняты
+                          или ещё загружают модели.
+        :param admitted: Часть задания, уже получившего слот планировщика заданий. Число таких задач
+                         ограничено планировщиком, поэтому они ждут процесса, а не отклоняются
+                         посреди задания, и не занимают места в очереди новых запросов.
+        :raises PoolBusyError: Если очередь переполнена.
+        """
+        self.start()
+        # Пока модели загружаются, свободных процессов нет и все задачи ждут в очереди
+        position = self.pending - self.workers + 1 if self.ready else self.pending + 1
+        if not admitted and position - self.admitted > self.max_queue:
+            raise PoolBusyError(position)
+
+        self.pending += 1
+        self.admitted += admitted
+        loop = asyncio.get_running_loop()
+        captured = metrics.enabled
+        submitted = False
+        try:
+            if position > 0 and on_queued is not None:
+                await on_queued(position)
+            if captured:
+                metrics.observe("pool_queue_depth", self.queued, (0, 1, 2, 4, 8, 16, 32, 64))
+                future = self._executor.submit(run_captured, fn, *args)
+            else:
+                future = self._executor.submit(fn, *args)
+            submitted = True
+            # Отмена ожидания не останавливает уже начатую задачу, поэтому счётчик уменьшается,
+            # только когда процесс действительно освободился (или задача снята с очереди)
+            future.add_done_callback(lambda _: self._call_soon(loop, self._done, admitted))
+            result = await asyncio.wrap_future(future)
+        finally:
+            if not submitted:
+                self._done(admitted)
+
+        if captured:
+            result, stages = result
+            metrics.merge_stages(stages)
+        return result
+
+    @staticmethod
+    def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable, *args) -> None:
+        """Вызывает callback в потоке цикла событий (колбэки concurrent.futures идут из потока пула)."""
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Цикл событий уже закрыт при остановке бота
+            pass
+
+    def collect_metrics(self):
+        """Текущая загрузка пула для эндпоинта метрик."""
+        yield "pool_pending_jobs", {}, self.pending
+        yield "pool_queued_jobs", {}, self.queued
+        yield "pool_workers", {}, self.workers
+        yield "pool_ready", {}, int(self.ready)
+        if self.startup_s is not None:
+            yield "pool_startup_seconds", {}, self.startup_s
+
+
+pool = WorkerPool(
+    workers=int(os.getenv("WORKERS", "0")) or None,
+    max_queue=int(os.getenv("WORKER_QUEUE", "32")),
+)
+metrics.add_collector(pool.collect_metrics)
+
+
+def queue_notifier(message) -> Callable[[int], Awaitable[None]]:
+    """Возвращает колбэк, сообщающий пользователю его позицию в очереди."""
+    async def notify(position: int) -> None:
+        if not pool.ready:
+            await message.answer(f"Бот запускается и прогревает модель, ваша позиция в очереди: {position}. "
+                                 f"Результат придёт автоматически.")
+        else:
+            await message.answer(f"Сервер занят, ваша позиция в очереди: {position}")
+    return notify
@@ -1,68 +1,206 @@
-from ultralytics import YOLO
-import requests
 from io import BytesIO
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List
 from PIL import Image
 import numpy as np
-import cv2
+
+from box_ops import box_area, draw_boxes, nms, tile_grid
+from detection_backends import Detections, TorchBackend, make_backend
+from downloader import Downloader, decode_image
+from metrics import metrics
+
+
+@dataclass
+class DetectionResult:
+    """
+    Результат одного прогона YOLO: исходное изображение, найденные рамки и размеченный рендер.
+    """
+    image: Image.Image
+    boxes: np.ndarray
+    classes: np.ndarray
+    confidences: np.ndarray
+    names: Dict[int, str]
+    annotated: bytes
+
+    @property
+    def coordinates(self) -> List[List[float]]:
+        """Координаты рамок в формате [x_min, y_min, x_max, y_max]."""
+        return self.boxes.tolist()
+
+    @property
+    def nbytes(self) -> int:
+        """Примерный объём памяти, занимаемый результатом."""
+        width, height = self.image.size
+        image_bytes = width * height * len(self.image.getbands())
+        return (image_bytes + self.boxes.nbytes + self.classes.nbytes
+                + self.confidences.nbytes + len(self.annotated))
 
 
 class YOLOProcessor:
-    def __init__(self, model_filename: str = "yolo_custom.pt"):
+    def __init__(self, model_filename: str = "yolo_custom.pt", model=None, imgsz: int = 640,
+                 backend=None):
         """
         Загружает модель YOLO.
         :param model_filename: Имя файла модели YOLO.
+        :param model: Уже загруженная модель с интерфейсом ultralytics (оборачивается в TorchBackend).
+        :param imgsz: Размер входа модели (для выбора размера тайлов).
+        :param backend: Бэкенд детекции или его имя ("torch", "onnx", "onnx-int8");
+                        по умолчанию берётся из переменной окружения YOLO_BACKEND.
         """
-        self.model = YOLO(model_filename)
+        self.model_filename = model_filename
+        self.imgsz = imgsz
+        if model is not None:
+            backend = TorchBackend(model=model)
+        elif backend is None or isinstance(backend, str):
+            backend = make_backend(backend, model_filename, imgsz)
+        self.backend = backend
+        # Один экземпляр модели делят все обработчики, поэтому вызовы сериализуются
+        self._lock = Lock()
 
-    def download_image(self, image_url: str):
+    def predict(self, images: list) -> List[Detections]:
         """
-        Скачивает изображение по URL и возвращает его в виде объекта BytesIO.
-        :param image_url: URL изображения.
-        :return: BytesIO объект с изображением или None при ошибке.
+        Прогоняет изображения через модель под блокировкой.
+        :param images: Список изображений (PIL Image или RGB numpy-массивы).
+        :return: Рамки для каждого изображения.
         """
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            return BytesIO(response.content)
-        return None
+        with self._lock:
+            return self.backend.predict(images)
 
-    def process_image(self, image_url: str):
+    def warmup(self, size: int = 640) -> None:
         """
-        Прогоняет изображение через YOLO и возвращает размеченное изображение в памяти.
-        :param image_url: URL изображения.
-        :return: BytesIO объект с размеченным изображением или None при ошибке.
+        Выполняет пробный прогон на пустом изображении, чтобы первый реальный запрос не был медленным.
+        :param size: Размер стороны пустого изображения.
         """
-        image_bytes = self.download_image(image_url)
-        if not image_bytes:
-            return None
+        self.predict([np.zeros((size, size, 3), dtype=np.uint8)])
 
-        image = Image.open(image_bytes)
-        results = self.model(image)
+    def detect(self, image) -> DetectionResult:
+        """
+        Один раз прогоняет изображение через YOLO и собирает всё, что нужно обработчикам.
+        :param image: Изображение в памяти (PIL Image, numpy-массив или байты).
+        :return: DetectionResult с рамками, классами, уверенностями и размеченным PNG.
+        """
+        return self.detect_batch([image])[0]
 
-        marked_image = results[0].plot()
-        marked_image_rgb = cv2.cvtColor(marked_image, cv2.COLOR_BGR2RGB)
+    def detect_batch(self, images: list) -> List[DetectionResult]:
+        """
+        Прогоняет несколько изображений одним пакетным вызовом модели.
+        :param images: Список изображений в памяти (PIL Image, numpy-массивы или байты).
+        :return: Список DetectionResult в том же порядке.
+        """
+        with metrics.span("decode"):
+            images = [decode_image(image) for image in images]
+        with metrics.span("inference"):
+            results = self.predict(images)
+        with metrics.span("annotate"):
+            return [self._to_detection(image, result) for image, result in zip(images, results)]
 
+    @staticmethod
+    def _to_detection(image: Image.Image, detections: Detections) -> DetectionResult:
+        marked = draw_boxes(np.asarray(image.convert("RGB")), detections.boxes, detections.classes,
+                            detections.confidences, detections.names)
         output = BytesIO()
-        Image.fromarray(marked_image_rgb).save(output, format="PNG")
-        output.seek(0)
+        Image.fromarray(marked).save(output, format="PNG")
 
-        return output
+        return DetectionResult(
+            image=image,
+            boxes=detections.boxes,
+            classes=detections.classes,
+            confidences=detections.confidences,
+            names=dict(detections.names),
+            annotated=output.getvalue(),
+        )
 
-    def get_objects(self, image_url: str):
+    def auto_tile_size(self, width: int, height: int, overlap: float = 0.2):
         """
-        Возвращает координаты объектов на изображении (bounding boxes).
-        :param image_url: URL изображения.
-        :return: Список координат объектов или None при ошибке.
+        Подбирает размер тайла по размеру изображения: тайл (вместе с перекрытием) не больше
+        1.5 * imgsz, то есть уменьшается при инференсе не более чем в 1.5 раза,
+        поэтому мелкие значки сохраняют разрешение.
+        :return: Размер стороны тайла или None, если изображение достаточно мало для одного прогона.
         """
-        image_bytes = self.download_image(image_url)
-        if not image_bytes:
+        longest = max(width, height)
+        max_tile = int(self.imgsz * 1.5)
+        if longest <= max_tile:
             return None
+        # Перекрытие учитываем при выборе числа тайлов, иначе тайл вырастает до ~1.8 * imgsz
+        per_side = int(np.ceil(longest * (1 + overlap) / max_tile))
+        return min(max_tile, int(np.ceil(longest / per_side * (1 + overlap))))
 
-        image = Image.open(image_bytes)
-        results = self.model(image)
+    def detect_tiled(self, image, tile: int = None, overlap: float = 0.2,
+                     iou_threshold: float = 0.5) -> DetectionResult:
+        """
+        Детекция на изображении в полном разрешении: нарезка на перекрывающиеся тайлы,
+        один пакетный прогон, перенос рамок в глобальные координаты и слияние дублей через NMS.
+        :param image: Изображение в памяти (PIL Image, numpy-массив или байты).
+        :param tile: Размер тайла (по умолчанию подбирается автоматически).
+        :param overlap: Доля перекрытия соседних тайлов.
+        :param iou_threshold: Порог перекрытия (пересечение к меньшей рамке) для слияния дублей.
+        """
+        with metrics.span("decode"):
+            image = decode_image(image)
+        width, height = image.size
+        tile = tile or self.auto_tile_size(width, height, overlap)
+        if tile is None:
+            return self.detect(image)
 
-        coordinates = []
-        for obj in results[0].boxes:
-            coords = obj.xyxy[0].cpu().numpy()
-            coordinates.append(coords.tolist())
+        tiles = tile_grid(width, height, tile, overlap)
+        with metrics.span("inference"):
+            results = self.predict([image.crop(box) for box in tiles])
 
-        return coordinates
\ No newline at end of file
+        boxes, classes, confidences, complete = [], [], [], []
+        names = {}
+        for (left, top, right, bottom), result in zip(tiles, results):
+            names.update(result.names)
+            tile_boxes = result.boxes
+            # Рамка, упирающаяся во внутреннюю границу тайла, скорее всего обрезана
+            cut = np.zeros(len(tile_boxes), dtype=bool)
+            if left > 0:
+                cut |= tile_boxes[:, 0] <= 1
+            if top > 0:
+                cut |= tile_boxes[:, 1] <= 1
+            if right < width:
+                cut |= tile_boxes[:, 2] >= right - left - 1
+            if bottom < height:
+                cut |= tile_boxes[:, 3] >= bottom - top - 1
+
+            boxes.append(tile_boxes + np.array([left, top, left, top], dtype=np.float32))
+            classes.append(result.classes)
+            confidences.append(result.confidences)
+            complete.append(~cut)
+
+        boxes, classes = np.concatenate(boxes), np.concatenate(classes)
+        confidences, complete = np.concatenate(confidences), np.concatenate(complete)
+
+        # Целые рамки важнее обрезанных, среди равных — более крупные и уверенные
+        area = box_area(boxes)
+        rank = complete * 2.0 + confidences + area / (area.max() + 1) * 1e-3 if len(boxes) else confidences
+        keep = nms(boxes, rank, iou_threshold, classes, metric="ios")
+        keep = keep[np.argsort(keep)]
+        boxes, classes, confidences = boxes[keep], classes[keep], confidences[keep]
+
+        with metrics.span("annotate"):
+            return self._to_detection(image, Detections(boxes, classes, confidences, names))
+
+    async def detect_url(self, image_url: str, downloader: Downloader) -> DetectionResult:
+        """
+        Асинхронно скачивает изображение и выполняет детекцию.
+        :param image_url: URL изображения.
+        :param downloader: Загрузчик с пулом соединений.
+        """
+        return self.detect(await downloader.fetch(image_url))
+
+    def process_image(self, image):
+        """
+        Прогоняет изображение через YOLO и возвращает размеченное изображение в памяти.
+        :param image: Изображение в памяти (PIL Image, numpy-массив или байты).
+        :return: BytesIO объект с размеченным изображением.
+        """
+        return BytesIO(self.detect(image).annotated)
+
+    def get_objects(self, image):
+        """
+        Возвращает координаты объектов на изображении (bounding boxes).
+        :param image: Изображение в памяти (PIL Image, numpy-массив или байты).
+        :return: Список координат объектов.
+        """
+        return self.detect(image).coordinates